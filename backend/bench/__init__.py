@@ -0,0 +1,8 @@
+"""
+End-to-end load benchmark for the upload -> Runway -> download pipeline.
+Runway and the temp hosts are replaced by local stand-ins, so a run costs
+no credits. From backend/:
+
+    python -m bench.run --jobs 50 --concurrency 10 --json baseline.json
+    python -m bench.run --jobs 50 --concurrency 10 --baseline baseline.json
+"""
@@ -0,0 +1,233 @@
+import asyncio
+import random
+import socket
+import struct
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+
+
+def _box(kind: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), kind) + payload
+
+
+def _full_box(kind: bytes, payload: bytes) -> bytes:
+    return _box(kind, b"\0\0\0\0" + payload)
+
+
+def synthetic_mp4(width: int = 1280, height: int = 720, duration: float = 5.0, fps: int = 30, padding: int = 65536) -> bytes:
+    """
+    Header-only H.264 MP4 that passes the input probe: a moov with one video
+    track, then `padding` bytes of empty mdat. Not decodable, so face
+    preflight and normalization should stay off when using it.
+    """
+    timescale = 15360
+    identity = struct.pack(">9i", 65536, 0, 0, 0, 65536, 0, 0, 0, 0x40000000)
+    tkhd = _full_box(
+        b"tkhd",
+        struct.pack(">IIIII", 0, 0, 1, 0, int(duration * 1000)) + b"\0" * 16 + identity
+        + struct.pack(">II", width << 16, height << 16),
+    )
+    mdhd = _full_box(b"mdhd", struct.pack(">IIII", 0, 0, timescale, int(duration * timescale)) + b"\0" * 4)
+    hdlr = _full_box(b"hdlr", b"\0" * 4 + b"vide" + b"\0" * 12 + b"bench\0")
+    stsd = _full_box(b"stsd", struct.pack(">I", 1) + struct.pack(">I4s", 16, b"avc1") + b"\0" * 8)
+    stts = _full_box(b"stts", struct.pack(">III", 1, int(duration * fps), timescale // fps))
+    trak = _box(b"trak", tkhd + _box(b"mdia", mdhd + hdlr + _box(b"minf", _box(b"stbl", stsd + stts))))
+    moov = _box(b"moov", _full_box(b"mvhd", b"\0" * 96) + trak)
+    return _box(b"ftyp", b"isom\0\0\2\0isomavc1") + moov + _box(b"mdat", b"\0" * padding)
+
+
+def unique_copy(video: bytes) -> bytes:
+    """Same video with a random trailing free box, so it never hits the result cache"""
+    return video + _box(b"free", uuid.uuid4().bytes)
+
+
+@dataclass
+class FakeProfile:
+    """Latency and failure behaviour of one stand-in service"""
+
+    latency: float = 0.05  # seconds per request
+    jitter: float = 0.5  # latency varies by up to this fraction either way
+    failure_rate: float = 0.0  # share of requests answered with a 5xx
+
+    async def respond(self) -> bool:
+        """Sleep for one request's latency; False when this request should fail"""
+        await asyncio.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+        return random.random() >= self.failure_rate
+
+
+@dataclass
+class _FakeTask:
+    render_seconds: float
+    fails: bool
+    started: Optional[float] = None
+
+
+@dataclass
+class FakeRunway:
+    """
+    Stand-in for the Runway API: /v1/character_performance creates a task
+    that renders for `render_seconds`, /v1/tasks/{id} reports it the way
+    Runway does, and the output URL serves an `output_size` byte MP4.
+    With `concurrency_quota`, tasks beyond it stay THROTTLED until a slot
+    frees up; with `create_rate_limit`, faster submissions get a 429.
+    """
+
+    profile: FakeProfile = field(default_factory=FakeProfile)
+    render_seconds: float = 2.0
+    task_failure_rate: float = 0.0
+    output_size: int = 2 * 1024 * 1024
+    concurrency_quota: int = 0  # 0: unlimited
+    create_rate_limit: float = 0.0  # submissions per second; 0: unlimited
+    base_url: str = ""
+    tasks: Dict[str, _FakeTask] = field(default_factory=dict)
+    requests: Dict[str, int] = field(default_factory=lambda: {"create": 0, "retrieve": 0, "download": 0, "rejected": 0})
+
+    def __post_init__(self):
+        self._last_create = 0.0
+        self._output = _box(b"ftyp", b"isom\0\0\2\0isomavc1") + _box(b"mdat", b"\0" * max(0, self.output_size - 32))
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[
+            Route("/v1/character_performance", self.create, methods=["POST"]),
+            Route("/v1/tasks/{task_id}", self.retrieve, methods=["GET"]),
+            Route("/outputs/{task_id}.mp4", self.download, methods=["GET"]),
+        ])
+
+    async def create(self, request: Request) -> Response:
+        self.requests["create"] += 1
+        await request.body()
+        if not await self.profile.respond():
+            return JSONResponse({"error": "Injected failure"}, status_code=503)
+        now = time.monotonic()
+        if self.create_rate_limit and now - self._last_create < 1 / self.create_rate_limit:
+            self.requests["rejected"] += 1
+            return JSONResponse({"error": "Too many requests"}, status_code=429, headers={"Retry-After": "1"})
+        self._last_create = now
+        task_id = str(uuid.uuid4())
+        self.tasks[task_id] = _FakeTask(
+            render_seconds=self.render_seconds,
+            fails=random.random() < self.task_failure_rate,
+        )
+        self._admit()
+        return JSONResponse({"id": task_id})
+
+    def _admit(self) -> None:
+        """Start throttled tasks, oldest first, while the quota has room"""
+        now = time.monotonic()
+        running = sum(
+            1 for task in self.tasks.values()
+            if task.started is not None and now - task.started < task.render_seconds
+        )
+        for task in self.tasks.values():
+            if self.concurrency_quota and running >= self.concurrency_quota:
+                break
+            if task.started is None:
+                task.started = now
+                running += 1
+
+    async def retrieve(self, request: Request) -> Response:
+        self.requests["retrieve"] += 1
+        if not await self.profile.respond():
+            return JSONResponse({"error": "Injected failure"}, status_code=503)
+        task_id = request.path_params["task_id"]
+        task = self.tasks.get(task_id)
+        if task is None:
+            return JSONResponse({"error": "Task not found"}, status_code=404)
+
+        self._admit()
+        body: Dict[str, Any] = {"id": task_id, "createdAt": "2024-01-01T00:00:00Z"}
+        if task.started is None:
+            body.update(status="THROTTLED")
+            return JSONResponse(body)
+        progress = (time.monotonic() - task.started) / task.render_seconds
+        if progress < 1:
+            body.update(status="RUNNING", progress=round(progress, 3))
+        elif task.fails:
+            body.update(status="FAILED", failure="Injected task failure", failureCode="INTERNAL.BENCH")
+        else:
+            body.update(status="SUCCEEDED", output=[f"{self.base_url}/outputs/{task_id}.mp4"])
+        return JSONResponse(body)
+
+    async def download(self, request: Request) -> Response:
+        self.requests["download"] += 1
+        if not await self.profile.respond():
+            return PlainTextResponse("Injected failure", status_code=503)
+        return Response(self._output, media_type="video/mp4")
+
+
+@dataclass
+class FakeHosting:
+    """
+    Stand-in for the temp hosts, speaking each provider's upload protocol:
+    transfer.sh (PUT /transfer/<name>), 0x0.st (POST /0x0) and file.io
+    (POST /fileio). Every provider shares one latency/failure profile.
+    """
+
+    profile: FakeProfile = field(default_factory=FakeProfile)
+    base_url: str = ""
+    uploads: int = 0
+    bytes_received: int = 0
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[
+            Route("/transfer/{name}", self.transfer_sh, methods=["PUT"]),
+            Route("/0x0", self.zero_x0, methods=["POST"]),
+            Route("/fileio", self.file_io, methods=["POST"]),
+        ])
+
+    async def _receive(self, request: Request) -> Optional[str]:
+        async for chunk in request.stream():
+            self.bytes_received += len(chunk)
+        if not await self.profile.respond():
+            return None
+        self.uploads += 1
+        return f"{self.base_url}/files/{uuid.uuid4().hex}.mp4"
+
+    async def transfer_sh(self, request: Request) -> Response:
+        url = await self._receive(request)
+        return PlainTextResponse(url) if url else PlainTextResponse("Injected failure", status_code=503)
+
+    async def zero_x0(self, request: Request) -> Response:
+        url = await self._receive(request)
+        return PlainTextResponse(url) if url else PlainTextResponse("Injected failure", status_code=503)
+
+    async def file_io(self, request: Request) -> Response:
+        url = await self._receive(request)
+        if url is None:
+            return JSONResponse({"success": False}, status_code=503)
+        return JSONResponse({"success": True, "link": url})
+
+
+class LocalServer:
+    """Serve an ASGI app with uvicorn on a free localhost port, in a background thread"""
+
+    def __init__(self, app: Any, host: str = "127.0.0.1"):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((host, 0))
+        self.url = f"http://{host}:{self.socket.getsockname()[1]}"
+        self.server = uvicorn.Server(uvicorn.Config(app, log_level="warning", lifespan="auto"))
+        self._thread = threading.Thread(target=self.server.run, kwargs={"sockets": [self.socket]}, daemon=True)
+
+    def start(self, timeout: float = 30.0) -> "LocalServer":
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if not self._thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError(f"Server at {self.url} did not start")
+            time.sleep(0.05)
+        return self
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self._thread.join(timeout=30)
+        self.socket.close()
@@ -0,0 +1,290 @@
+"""
+Drive N concurrent uploads through the real FastAPI app, with Runway and
+the temp hosts replaced by local stand-ins, and report per-stage latency
+percentiles, throughput, peak RSS and thread counts. The stand-ins run in
+this process too, so RSS and threads include them.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from bench.fakes import FakeHosting, FakeProfile, FakeRunway, LocalServer, synthetic_mp4, unique_copy
+
+FINISHED_STATUSES = ("completed", "failed")
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile"""
+    ordered = sorted(values)
+    rank = math.ceil(q / 100 * len(ordered))
+    return ordered[min(max(rank, 1), len(ordered)) - 1]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "p99": round(percentile(values, 99), 3),
+        "max": round(max(values), 3),
+    }
+
+
+class ResourceSampler:
+    """Peak RSS and thread counts of this process, sampled in the background"""
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.peak_rss_bytes = 0
+        self.peak_threads = 0
+        self.peak_python_threads = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _rss_bytes() -> int:
+        try:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        # Not Linux: fall back to the peak so far (bytes on macOS, KiB elsewhere)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+    @staticmethod
+    def _os_threads() -> int:
+        try:
+            return len(os.listdir("/proc/self/task"))
+        except OSError:
+            return threading.active_count()
+
+    def sample(self) -> None:
+        self.peak_rss_bytes = max(self.peak_rss_bytes, self._rss_bytes())
+        self.peak_threads = max(self.peak_threads, self._os_threads())
+        self.peak_python_threads = max(self.peak_python_threads, threading.active_count())
+
+    async def _run(self) -> None:
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> Dict[str, Any]:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self.sample()
+        return {
+            "peak_rss_mb": round(self.peak_rss_bytes / 1024 / 1024, 1),
+            "peak_threads": self.peak_threads,
+            "peak_python_threads": self.peak_python_threads,
+        }
+
+
+async def run_job(
+    client: httpx.AsyncClient,
+    character: bytes,
+    reference: bytes,
+    poll_interval: float,
+    timeout: float,
+) -> Dict[str, Any]:
+    """Upload one pair, wait for the job to finish, return its record and client-side times"""
+    started = time.monotonic()
+    while True:
+        response = await client.post("/api/upload", files={
+            "character_file": ("character.mp4", character, "video/mp4"),
+            "reference_file": ("reference.mp4", reference, "video/mp4"),
+        })
+        if response.status_code != 429:
+            break
+        await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+    uploaded = time.monotonic()
+    if response.status_code != 200:
+        return {"status": "rejected", "error": response.text, "upload": uploaded - started}
+
+    job_id = response.json()["job_id"]
+    deadline = uploaded + timeout
+    while True:
+        job = (await client.get(f"/api/jobs/{job_id}")).json()
+        if job["status"] in FINISHED_STATUSES or time.monotonic() > deadline:
+            break
+        await asyncio.sleep(poll_interval)
+
+    return {**job, "upload": uploaded - started, "end_to_end": time.monotonic() - started}
+
+
+async def drive(args: argparse.Namespace, app_url: str, video: bytes) -> Dict[str, Any]:
+    slots = asyncio.Semaphore(args.concurrency)
+    sampler = ResourceSampler()
+
+    async def one(client: httpx.AsyncClient) -> Dict[str, Any]:
+        async with slots:
+            return await run_job(client, unique_copy(video), unique_copy(video), args.poll_interval, args.timeout)
+
+    limits = httpx.Limits(max_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=app_url, timeout=None, limits=limits) as client:
+        sampler.start()
+        started = time.monotonic()
+        results = await asyncio.gather(*(one(client) for _ in range(args.jobs)))
+        wall = time.monotonic() - started
+        resources = await sampler.stop()
+
+    completed = [r for r in results if r["status"] == "completed"]
+    stages: Dict[str, List[float]] = {}
+    for result in completed:
+        for stage, seconds in (result.get("timings") or {}).items():
+            stages.setdefault(stage, []).append(seconds)
+        for stage in ("upload", "end_to_end"):
+            stages.setdefault(f"client_{stage}", []).append(result[stage])
+
+    outcomes: Dict[str, int] = {}
+    for result in results:
+        outcomes[result["status"]] = outcomes.get(result["status"], 0) + 1
+
+    return {
+        "jobs": args.jobs,
+        "concurrency": args.concurrency,
+        "outcomes": outcomes,
+        "wall_seconds": round(wall, 3),
+        "jobs_per_second": round(len(completed) / wall, 3) if wall else 0.0,
+        "stages": {stage: summarize(values) for stage, values in sorted(stages.items())},
+        "resources": resources,
+        "errors": sorted({r.get("error") or "" for r in results if r["status"] != "completed"} - {""})[:10],
+    }
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    def delta(new: float, old: Optional[float]) -> str:
+        if old in (None, 0):
+            return ""
+        return f" ({(new - old) / old:+.0%})"
+
+    base_stages = (baseline or {}).get("stages", {})
+    print(f"\n{report['jobs']} jobs, concurrency {report['concurrency']}: {report['outcomes']}")
+    print(f"{'stage':<20}{'p50':>15}{'p95':>15}{'p99':>15}{'max':>10}")
+    for stage, stats in report["stages"].items():
+        old = base_stages.get(stage, {})
+        print(
+            f"{stage:<20}"
+            + "".join(f"{stats[k]:>8.3f}{delta(stats[k], old.get(k)):>7}" for k in ("p50", "p95", "p99"))
+            + f"{stats['max']:>10.3f}"
+        )
+    base_jps = (baseline or {}).get("jobs_per_second")
+    print(f"jobs/s: {report['jobs_per_second']}{delta(report['jobs_per_second'], base_jps)}  wall: {report['wall_seconds']}s")
+    resources = report["resources"]
+    base_resources = (baseline or {}).get("resources", {})
+    print(
+        f"peak RSS: {resources['peak_rss_mb']}MB{delta(resources['peak_rss_mb'], base_resources.get('peak_rss_mb'))}  "
+        f"threads: {resources['peak_threads']} (python {resources['peak_python_threads']})"
+    )
+    for error in report["errors"]:
+        print(f"error: {error.splitlines()[0]}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m bench.run", description=__doc__)
+    parser.add_argument("--jobs", type=int, default=20, help="jobs to submit")
+    parser.add_argument("--concurrency", type=int, default=5, help="uploads in flight at once")
+    parser.add_argument("--video", type=Path, help="input video to upload (default: a synthetic MP4)")
+    parser.add_argument("--input-size", type=int, default=1024 * 1024, help="synthetic input size in bytes")
+    parser.add_argument("--output-size", type=int, default=2 * 1024 * 1024, help="rendered output size in bytes")
+    parser.add_argument("--render-seconds", type=float, default=2.0, help="fake Runway render time")
+    parser.add_argument("--runway-latency", type=float, default=0.05, help="fake Runway per-request latency")
+    parser.add_argument("--runway-failure-rate", type=float, default=0.0, help="share of Runway requests failing with 503")
+    parser.add_argument("--task-failure-rate", type=float, default=0.0, help="share of Runway tasks ending FAILED")
+    parser.add_argument("--runway-quota", type=int, default=0, help="fake account concurrency quota (0: unlimited)")
+    parser.add_argument("--runway-create-limit", type=float, default=0.0, help="fake submissions/s before 429 (0: unlimited)")
+    parser.add_argument("--hosting-latency", type=float, default=0.1, help="fake temp host per-upload latency")
+    parser.add_argument("--hosting-failure-rate", type=float, default=0.0, help="share of temp host uploads failing")
+    parser.add_argument("--poll-interval", type=float, default=0.25, help="how often the client polls a job")
+    parser.add_argument("--timeout", type=float, default=600.0, help="give up on a job after this many seconds")
+    parser.add_argument("--json", type=Path, help="write the report here")
+    parser.add_argument("--baseline", type=Path, help="earlier --json report to compare against")
+    parser.add_argument("--keep", action="store_true", help="keep the uploads, outputs and job store afterwards")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    args = parse_args(argv)
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    video = args.video.read_bytes() if args.video else synthetic_mp4(padding=args.input_size)
+
+    runway = FakeRunway(
+        profile=FakeProfile(latency=args.runway_latency, failure_rate=args.runway_failure_rate),
+        render_seconds=args.render_seconds,
+        task_failure_rate=args.task_failure_rate,
+        output_size=args.output_size,
+        concurrency_quota=args.runway_quota,
+        create_rate_limit=args.runway_create_limit,
+    )
+    hosting = FakeHosting(profile=FakeProfile(latency=args.hosting_latency, failure_rate=args.hosting_failure_rate))
+    runway_server = LocalServer(runway.app()).start()
+    hosting_server = LocalServer(hosting.app()).start()
+    runway.base_url = runway_server.url
+    hosting.base_url = hosting_server.url
+
+    # Settings are read when the app is imported, so point it at the stand-ins first
+    workdir = Path(tempfile.mkdtemp(prefix="sports-editor-bench-"))
+    os.environ.update({
+        "RUNWAY_API_KEY": "bench",
+        "RUNWAYML_BASE_URL": runway_server.url,
+        "TRANSFER_SH_URL": f"{hosting_server.url}/transfer",
+        "ZERO_X0_URL": f"{hosting_server.url}/0x0",
+        "FILEIO_URL": f"{hosting_server.url}/fileio",
+        "UPLOAD_DIRECTORY": str(workdir / "uploads"),
+        "JOBS_DIRECTORY": str(workdir / "jobs"),
+        "JOB_STORE_URL": f"sqlite:///{workdir / 'jobs.db'}",
+        "RESULT_CACHE_PATH": str(workdir / "result_cache.json"),
+        "STORAGE_PINS_PATH": str(workdir / "storage_pins.json"),
+        "NGROK_ENABLED": "false",
+    })
+    # Tunables the caller has not set get benchmark-friendly values
+    for key, value in {
+        "RUNWAY_POLL_INITIAL_INTERVAL": "0.25",
+        "RUNWAY_POLL_MAX_INTERVAL": "1.0",
+        "PREFLIGHT_ENABLED": "false" if not args.video else "true",
+        "NORMALIZE_ENABLED": "false" if not args.video else "true",
+        # The fake Runway output is not decodable video
+        "PLAYBACK_ENABLED": "false",
+        "STORAGE_GC_ENABLED": "false",
+        "LOG_LEVEL": "WARNING",
+    }.items():
+        os.environ.setdefault(key, value)
+
+    import main as app_module
+
+    app_server = LocalServer(app_module.app).start()
+    try:
+        report = asyncio.run(drive(args, app_server.url, video))
+    finally:
+        app_server.stop()
+        hosting_server.stop()
+        runway_server.stop()
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report["fake_runway_requests"] = runway.requests
+    report["fake_hosting_uploads"] = hosting.uploads
+    print_report(report, baseline)
+    if args.json:
+        args.json.write_text(json.dumps(report, indent=2))
+    return report
+
+
+if __name__ == "__main__":
+    main()
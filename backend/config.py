@@ -9,11 +9,134 @@ class Settings(BaseSettings):
     DEBUG: bool = True
     CORS_ORIGINS: str = "http://localhost:3000,http://127.0.0.1:3000"
     
+    # Logging
+    LOG_LEVEL: str = "INFO"
+    LOG_FORMAT: str = "text"  # "text" or "json" (one object per line)
+    LOG_LEVELS: str = "httpx=WARNING"  # per-module overrides, e.g. "httpx=WARNING,hosting=DEBUG"
+    
     # File Upload
     MAX_FILE_SIZE: int = 16777216  # 16MB in bytes
+    UPLOAD_CHUNK_SIZE: int = 1048576  # 1MB read/write chunks when streaming uploads
     UPLOAD_DIRECTORY: str = "./uploads"
     JOBS_DIRECTORY: str = "./jobs"
     
+    # Chunked uploads
+    CHUNKED_UPLOAD_CHUNK_SIZE: int = 4194304  # 4MB per chunk
+    CHUNKED_UPLOAD_MAX_SIZE: int = 134217728  # 128MB; normalization shrinks inputs before Runway sees them
+    CHUNKED_UPLOAD_MAX_SESSIONS: int = 32  # open uploads; their sizes also count against UPLOAD_QUOTA_BYTES
+    
+    # Input probing
+    PROBE_MIN_SHORT_SIDE: int = 360  # pixels; below this Runway cannot find faces
+    PROBE_MIN_DURATION: float = 1.0  # seconds
+    PROBE_MAX_DURATION: float = 30.0
+    PROBE_CACHE_SIZE: int = 1024  # probe results kept by content hash
+    
+    # Face preflight (needs opencv-python-headless)
+    PREFLIGHT_ENABLED: bool = True
+    PREFLIGHT_WORKERS: int = 2  # detector processes
+    PREFLIGHT_SAMPLE_FRAMES: int = 8
+    PREFLIGHT_MIN_FACE_COVERAGE: float = 0.25  # share of sampled frames with a face
+    PREFLIGHT_MIN_BRIGHTNESS: float = 0.12  # mean luma, 0-1
+    
+    # Input normalization (needs ffmpeg)
+    NORMALIZE_ENABLED: bool = True
+    FFMPEG_PATH: str = "ffmpeg"
+    NORMALIZE_WORKERS: int = 2  # concurrent ffmpeg transcodes
+    NORMALIZE_MAX_DURATION: float = 30.0  # seconds kept from each input
+    NORMALIZE_CRF: int = 23
+    
+    # Playback artifacts for outputs (needs ffmpeg)
+    PLAYBACK_ENABLED: bool = True
+    PLAYBACK_WORKERS: int = 2  # outputs packaged at once
+    PLAYBACK_POSTER_AT: float = 1.0  # seconds into the output
+    PLAYBACK_HLS_ENABLED: bool = False
+    PLAYBACK_HLS_SEGMENT_SECONDS: float = 2.0
+    
+    # Job store
+    JOB_STORE_URL: str = "sqlite:///./jobs.db"  # or redis://localhost:6379/0, shared by all nodes
+    
+    # Job scheduling
+    JOB_QUEUE_SIZE: int = 100
+    JOB_WORKERS: int = 4
+    JOB_RETRY_AFTER: int = 30  # seconds, until job durations are known
+    HOSTING_CONCURRENCY: int = 4
+    RUNWAY_CONCURRENCY: int = 4
+    DOWNLOAD_CONCURRENCY: int = 4
+    
+    # Distributed queue (needs redis; empty runs jobs in this process)
+    JOB_QUEUE_URL: str = ""  # e.g. redis://localhost:6379/0
+    JOB_VISIBILITY_TIMEOUT: float = 120.0  # seconds before a silent worker's job is handed out again
+    JOB_MAX_DELIVERIES: int = 5  # attempts before an interrupted job is failed
+    
+    # Runway task polling
+    RUNWAY_POLL_INITIAL_INTERVAL: float = 5.0  # seconds
+    RUNWAY_POLL_MAX_INTERVAL: float = 30.0
+    RUNWAY_POLL_BACKOFF: float = 1.5
+    RUNWAY_POLL_BATCH_SIZE: int = 50
+    RUNWAY_TASK_TIMEOUT: float = 600.0
+    
+    # Runway rate limits and retries
+    RUNWAY_CREATE_RATE: float = 2.0  # task submissions per second
+    RUNWAY_CREATE_BURST: int = 10
+    RUNWAY_RETRIEVE_RATE: float = 10.0  # status reads per second
+    RUNWAY_RETRIEVE_BURST: int = 20
+    RUNWAY_MAX_RETRIES: int = 5  # on 429 and 5xx
+    RUNWAY_RETRY_BASE_DELAY: float = 1.0  # seconds, doubled per attempt with jitter
+    RUNWAY_RETRY_MAX_DELAY: float = 60.0
+    RUNWAY_THROTTLE_TIMEOUT: float = 900.0  # how long a submission refused with 429 keeps waiting
+    
+    # Job status push
+    SSE_KEEPALIVE_SECONDS: float = 15.0
+    
+    # Temp hosting
+    HOSTING_STAGGER_SECONDS: float = 5.0  # head start each provider gets before the next one joins
+    HOSTED_URL_TTL: float = 3600.0  # seconds a hosted URL is reused for the same file
+    NGROK_ENABLED: bool = True
+    NGROK_AUTOSTART: bool = True
+    NGROK_API_URL: str = "http://localhost:4040"
+    NGROK_LOCAL_PORT: int = 8000
+    TUNNEL_HEALTH_INTERVAL: float = 30.0  # seconds between background tunnel checks
+    TRANSFER_SH_URL: str = "https://transfer.sh"
+    ZERO_X0_URL: str = "https://0x0.st"
+    FILEIO_URL: str = "https://file.io"
+    
+    # Outbound HTTP
+    HTTP_TIMEOUT: float = 120.0  # seconds
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    DOWNLOAD_TIMEOUT: float = 120.0
+    DOWNLOAD_CHUNK_SIZE: int = 1048576  # 1MB
+    DOWNLOAD_MAX_RETRIES: int = 5
+    
+    # Media serving
+    MEDIA_CHUNK_SIZE: int = 262144  # 256KB reads when sendfile is unavailable
+    MEDIA_MAX_AGE: int = 86400  # seconds browsers may reuse a served file
+    
+    # Act Two defaults
+    ACT_TWO_RATIO: str = "1280:720"
+    ACT_TWO_BODY_CONTROL: bool = True
+    ACT_TWO_EXPRESSION_INTENSITY: int = 3
+    
+    # Batches
+    BATCH_MAX_JOBS: int = 50
+    
+    # Storage lifecycle
+    STORAGE_GC_ENABLED: bool = True
+    STORAGE_GC_INTERVAL: float = 300.0  # seconds between lifecycle passes
+    STORAGE_SCAN_BATCH: int = 2000  # new files stat'ed per pass
+    UPLOAD_QUOTA_BYTES: int = 10737418240  # 10GB
+    JOBS_QUOTA_BYTES: int = 21474836480  # 20GB
+    STORAGE_TTL_COMPLETED: float = 1209600.0  # 14 days since last use
+    STORAGE_TTL_FAILED: float = 86400.0  # 1 day; also orphaned files
+    STORAGE_TTL_UPLOAD: float = 259200.0  # 3 days since last use
+    STORAGE_TTL_PARTIAL: float = 86400.0  # abandoned .part files and upload sessions
+    STORAGE_PINS_PATH: str = "./storage_pins.json"
+    ADMIN_API_KEY: str = ""  # X-Admin-Key for /api/admin/*; unset: direct local requests only
+    
+    # Result cache
+    RESULT_CACHE_PATH: str = "./result_cache.json"
+    RESULT_CACHE_MAX_BYTES: int = 2147483648  # 2GB of indexed outputs
+    
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,50 @@
+import asyncio
+from collections import defaultdict
+from typing import Any, Dict, Optional, Set
+
+
+class JobEventBus:
+    """
+    In-process pub/sub for job updates.
+    Every subscriber gets its own bounded queue; a subscriber that falls
+    behind loses its oldest events rather than slowing down publishers.
+    With a relay set, events are also forwarded to other nodes, and the
+    relay hands their events back through deliver().
+    """
+
+    def __init__(self, max_queue: int = 100):
+        self.max_queue = max_queue
+        self.relay: Optional[Any] = None
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+
+    def subscribe(self, job_id: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue)
+        self._subscribers[job_id].add(queue)
+        return queue
+
+    def unsubscribe(self, job_id: str, queue: asyncio.Queue) -> None:
+        subscribers = self._subscribers.get(job_id)
+        if subscribers is None:
+            return
+        subscribers.discard(queue)
+        if not subscribers:
+            del self._subscribers[job_id]
+
+    def publish(self, job_id: str, event: Dict[str, Any]) -> None:
+        self.deliver(job_id, event)
+        if self.relay is not None:
+            self.relay.publish(job_id, event)
+
+    def deliver(self, job_id: str, event: Dict[str, Any]) -> None:
+        """Hand an event to this process's subscribers only"""
+        for queue in self._subscribers.get(job_id, ()):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+event_bus = JobEventBus()
@@ -0,0 +1,359 @@
+import asyncio
+import base64
+import logging
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from config import settings
+from http_pool import get_http_client
+from metrics import BYTES_TOTAL, HOSTING_SECONDS
+from tunnel import TunnelUnavailableError, tunnel_manager
+
+logger = logging.getLogger(__name__)
+
+# Files below this size can be inlined as a data URI if every provider fails
+DATA_URI_MAX_BYTES = 3 * 1024 * 1024
+
+
+class HostingError(Exception):
+    """Raised when no provider could publish a video."""
+
+
+async def _iter_file(path: str, chunk_size: int = settings.UPLOAD_CHUNK_SIZE) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _unique_name(video_path: str) -> str:
+    # Timestamp prefix keeps repeated uploads of the same file distinct
+    return f"{int(time.time() * 1000)}_{Path(video_path).name}"
+
+
+def _check_url(provider: str, url: str) -> str:
+    if not url.startswith(("https://", "http://")):
+        raise HostingError(f"{provider} returned invalid URL: {url}")
+    return url
+
+
+class HostingProvider:
+    """A place a local video can be published to get a public URL."""
+
+    name = "provider"
+    # Whether one URL can be handed to several Runway tasks
+    reusable = True
+    # Whether the file stays on this machine until Runway fetches it
+    local = False
+
+    async def upload(self, video_path: str) -> str:
+        raise NotImplementedError
+
+
+class TransferShProvider(HostingProvider):
+    name = "transfer.sh"
+
+    def __init__(self, base_url: str = settings.TRANSFER_SH_URL, timeout: float = 120.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    async def upload(self, video_path: str) -> str:
+        response = await get_http_client().put(
+            f"{self.base_url}/{_unique_name(video_path)}",
+            content=_iter_file(video_path),
+            headers={
+                "Content-Type": "video/mp4",
+                "Content-Length": str(Path(video_path).stat().st_size),
+            },
+            timeout=self.timeout,
+        )
+        if response.status_code != 200:
+            raise HostingError(f"transfer.sh upload failed with status {response.status_code}")
+        return _check_url(self.name, response.text.strip())
+
+
+class ZeroX0Provider(HostingProvider):
+    """0x0.st (100MB limit)"""
+
+    name = "0x0.st"
+
+    def __init__(self, base_url: str = settings.ZERO_X0_URL, timeout: float = 120.0):
+        self.base_url = base_url
+        self.timeout = timeout
+
+    async def upload(self, video_path: str) -> str:
+        with open(video_path, "rb") as f:
+            files = {"file": (_unique_name(video_path), f, "video/mp4")}
+            response = await get_http_client().post(self.base_url, files=files, timeout=self.timeout)
+        if response.status_code != 200:
+            raise HostingError(f"0x0.st upload failed with status {response.status_code}")
+        return _check_url(self.name, response.text.strip())
+
+
+class FileIoProvider(HostingProvider):
+    name = "file.io"
+    # file.io deletes a file after its first download
+    reusable = False
+
+    def __init__(self, base_url: str = settings.FILEIO_URL, timeout: float = 60.0):
+        self.base_url = base_url
+        self.timeout = timeout
+
+    async def upload(self, video_path: str) -> str:
+        with open(video_path, "rb") as f:
+            response = await get_http_client().post(self.base_url, files={"file": f}, timeout=self.timeout)
+        if response.status_code != 200:
+            raise HostingError(f"File.io upload failed with status {response.status_code}")
+        result = response.json()
+        if not result.get("success"):
+            raise HostingError(f"File.io upload failed: {result}")
+        return _check_url(self.name, result["link"])
+
+
+class NgrokProvider(HostingProvider):
+    """Serve the file from this backend through the cached ngrok tunnel"""
+
+    name = "ngrok"
+    # Cheap to recompute, and must follow the tunnel if its URL changes
+    reusable = False
+    local = True
+
+    async def upload(self, video_path: str) -> str:
+        try:
+            return tunnel_manager.url_for(Path(video_path).name)
+        except TunnelUnavailableError as e:
+            raise HostingError(str(e))
+
+
+@dataclass
+class ProviderStats:
+    attempts: int = 0
+    successes: int = 0
+    failures: int = 0
+    cancelled: int = 0
+    latency_ewma: Optional[float] = None
+
+    def record_success(self, seconds: float) -> None:
+        self.attempts += 1
+        self.successes += 1
+        if self.latency_ewma is None:
+            self.latency_ewma = seconds
+        else:
+            self.latency_ewma = 0.7 * self.latency_ewma + 0.3 * seconds
+
+    def record_failure(self) -> None:
+        self.attempts += 1
+        self.failures += 1
+
+    def score(self, default_latency: float) -> float:
+        """Expected seconds to a usable URL; lower ranks first"""
+        success_rate = (self.successes + 1) / (self.attempts + 2)
+        latency = self.latency_ewma if self.latency_ewma is not None else default_latency
+        return latency / success_rate
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "attempts": self.attempts,
+            "successes": self.successes,
+            "failures": self.failures,
+            "cancelled": self.cancelled,
+            "latency_ewma": self.latency_ewma,
+        }
+
+
+class HostingRace:
+    """
+    Publishes a video by racing hosting providers.
+    Providers start one after another, `stagger` seconds apart (or immediately
+    when the previous one fails); the first good URL wins and the remaining
+    attempts are cancelled. Providers are ranked by their observed latency
+    and success rate, so the best one usually finishes before the next starts.
+    URLs from reusable providers are cached per file for `url_ttl` seconds, and
+    concurrent requests for the same file share one race, so an input used by
+    many jobs is uploaded once. With `shared` set (nodes sharing a queue),
+    reusable URLs are also looked up in and published to it, so a file
+    hosted by one node is reused by the others. Providers are plain
+    objects, so tests can swap in local stand-ins.
+    """
+
+    def __init__(
+        self,
+        providers: Sequence[HostingProvider],
+        stagger: float = settings.HOSTING_STAGGER_SECONDS,
+        default_latency: float = 10.0,
+        url_ttl: float = settings.HOSTED_URL_TTL,
+    ):
+        self.providers = list(providers)
+        self.stagger = stagger
+        self.default_latency = default_latency
+        self.url_ttl = url_ttl
+        self.stats: Dict[str, ProviderStats] = {p.name: ProviderStats() for p in self.providers}
+        self.url_cache_hits = 0
+        self.shared: Optional[Any] = None
+        self._urls: Dict[str, Tuple[str, float]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def ranked(self) -> List[HostingProvider]:
+        # Stable sort keeps the configured order among providers with no history
+        return sorted(self.providers, key=lambda p: self.stats[p.name].score(self.default_latency))
+
+    def known(self, video_path: str) -> bool:
+        """Whether the file has a fresh URL or a race for it is under way"""
+        key = str(Path(video_path).resolve())
+        cached = self._urls.get(key)
+        return key in self._inflight or bool(cached and cached[1] > time.monotonic())
+
+    async def host(self, video_path: str) -> str:
+        """Return a public URL for the video, reusing a recent one when possible"""
+        # Uploads are content-addressed, so the path identifies the bytes
+        key = str(Path(video_path).resolve())
+        cached = self._urls.get(key)
+        if cached and cached[1] > time.monotonic():
+            self.url_cache_hits += 1
+            return cached[0]
+
+        shared = key in self._inflight
+        if not shared and self.shared is not None:
+            found = await self.shared.get(key)
+            if found:
+                url, ttl = found
+                self._urls[key] = (url, time.monotonic() + ttl)
+                self.url_cache_hits += 1
+                return url
+            shared = key in self._inflight
+        if not shared:
+            self._inflight[key] = asyncio.ensure_future(self._host_once(key, video_path))
+            self._inflight[key].add_done_callback(lambda _: self._inflight.pop(key, None))
+        url, reusable = await asyncio.shield(self._inflight[key])
+        if shared and not reusable:
+            # Single-use URL already claimed by the job that started the race
+            url, _ = await self._race(video_path)
+        return url
+
+    async def _host_once(self, key: str, video_path: str) -> Tuple[str, bool]:
+        url, reusable = await self._race(video_path)
+        if reusable:
+            # Cached before the shared future resolves, so late callers never miss both
+            now = time.monotonic()
+            self._urls = {k: v for k, v in self._urls.items() if v[1] > now}
+            self._urls[key] = (url, now + self.url_ttl)
+            if self.shared is not None:
+                await self.shared.put(key, url, self.url_ttl)
+        return url, reusable
+
+    async def _race(self, video_path: str) -> Tuple[str, bool]:
+        """Race providers in rank order; returns the URL and whether it is reusable"""
+        queue = self.ranked()
+        running: Dict[asyncio.Task, HostingProvider] = {}
+        errors: List[str] = []
+
+        def launch_next() -> None:
+            provider = queue.pop(0)
+            logger.debug("Trying %s", provider.name)
+            running[asyncio.create_task(self._attempt(provider, video_path))] = provider
+
+        launch_next()
+        try:
+            while running or queue:
+                if not running:
+                    launch_next()
+                done, _ = await asyncio.wait(
+                    running,
+                    timeout=self.stagger if queue else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    # Nothing back within the stagger window: hedge with the next provider
+                    launch_next()
+                    continue
+
+                for task in done:
+                    provider = running.pop(task)
+                    try:
+                        url = task.result()
+                    except Exception as e:
+                        logger.warning("%s failed: %s", provider.name, e)
+                        errors.append(f"{provider.name}: {e}")
+                        continue
+                    logger.info("Hosted via %s", provider.name, extra={"url": url})
+                    return url, provider.reusable
+        finally:
+            for task, provider in running.items():
+                if not task.done():
+                    task.cancel()
+                    self.stats[provider.name].cancelled += 1
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        # If all hosting services fail, fallback to base64 for small files
+        file_size = Path(video_path).stat().st_size
+        if file_size < DATA_URI_MAX_BYTES:
+            logger.warning("All hosting failed, falling back to a data URI")
+            return await asyncio.to_thread(video_to_data_uri, video_path), False
+        raise HostingError(
+            f"Video too large ({file_size/1024/1024:.1f}MB) and all temp hosting services failed: {'; '.join(errors)}"
+        )
+
+    async def _attempt(self, provider: HostingProvider, video_path: str) -> str:
+        started = time.monotonic()
+        try:
+            url = await provider.upload(video_path)
+        except asyncio.CancelledError:
+            HOSTING_SECONDS.observe(time.monotonic() - started, provider=provider.name, outcome="cancelled")
+            raise
+        except Exception:
+            self.stats[provider.name].record_failure()
+            HOSTING_SECONDS.observe(time.monotonic() - started, provider=provider.name, outcome="failure")
+            raise
+        elapsed = time.monotonic() - started
+        self.stats[provider.name].record_success(elapsed)
+        HOSTING_SECONDS.observe(elapsed, provider=provider.name, outcome="success")
+        BYTES_TOTAL.inc(Path(video_path).stat().st_size, direction="hosting")
+        return url
+
+    def stats_snapshot(self) -> Dict[str, Any]:
+        return {
+            "ranking": [p.name for p in self.ranked()],
+            "url_cache_hits": self.url_cache_hits,
+            "providers": {name: stats.as_dict() for name, stats in self.stats.items()},
+        }
+
+
+def video_to_data_uri(video_path: str) -> str:
+    """
+    Convert video file to base64 data URI
+    """
+    path = Path(video_path)
+
+    # Determine MIME type based on extension
+    extension = path.suffix.lower()
+    mime_types = {
+        '.mp4': 'video/mp4',
+        '.webm': 'video/webm',
+        '.mov': 'video/quicktime',
+        '.avi': 'video/x-msvideo'
+    }
+
+    mime_type = mime_types.get(extension, 'video/mp4')
+
+    # Read and encode file
+    with open(video_path, "rb") as video_file:
+        video_data = video_file.read()
+        base64_data = base64.b64encode(video_data).decode('utf-8')
+
+    return f"data:{mime_type};base64,{base64_data}"
+
+
+def default_providers() -> List[HostingProvider]:
+    providers: List[HostingProvider] = []
+    if settings.NGROK_ENABLED:
+        providers.append(NgrokProvider())
+    providers.extend([TransferShProvider(), ZeroX0Provider(), FileIoProvider()])
+    return providers
+
+
+hosting = HostingRace(default_providers())
@@ -0,0 +1,33 @@
+from typing import Optional
+
+import httpx
+
+from config import settings
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Process-wide AsyncClient so every outbound call (temp hosting, downloads)
+    reuses one pool of keep-alive connections. Created lazily so it binds to
+    the running event loop.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.HTTP_TIMEOUT, connect=10.0),
+            limits=httpx.Limits(
+                max_connections=settings.HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+            follow_redirects=True,
+        )
+    return _client
+
+
+async def close_http_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
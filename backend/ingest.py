@@ -0,0 +1,125 @@
+import asyncio
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Optional
+
+from fastapi import UploadFile
+
+from config import settings
+
+
+class FileTooLargeError(Exception):
+    """Raised when an upload exceeds the allowed number of bytes."""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"File exceeds {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+@dataclass
+class IngestedFile:
+    path: Path
+    size: int
+    sha256: str
+
+
+def _write_chunk(buffer: BinaryIO, digest, chunk: bytes) -> None:
+    # hashlib releases the GIL for large buffers, so hashing here keeps
+    # both the digest and the disk write off the event loop
+    digest.update(chunk)
+    buffer.write(chunk)
+
+
+async def _stream_to_file(
+    upload: UploadFile,
+    partial_path: Path,
+    max_bytes: int,
+    chunk_size: int,
+) -> tuple[int, str]:
+    digest = hashlib.sha256()
+    size = 0
+
+    buffer = await asyncio.to_thread(open, partial_path, "wb")
+    try:
+        while True:
+            chunk = await upload.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise FileTooLargeError(max_bytes)
+            await asyncio.to_thread(_write_chunk, buffer, digest, chunk)
+        await asyncio.to_thread(buffer.close)
+    except BaseException:
+        buffer.close()
+        partial_path.unlink(missing_ok=True)
+        raise
+
+    return size, digest.hexdigest()
+
+
+def _partial_path(directory: Path, name: str) -> Path:
+    return directory / f".{name}.{uuid.uuid4().hex}.part"
+
+
+def content_filename(sha256: str, original_filename: Optional[str]) -> str:
+    """Name under which content with this hash is stored"""
+    extension = Path(original_filename or "").suffix.lower() or ".mp4"
+    return f"{sha256}{extension}"
+
+
+def commit_content(partial_path: Path, destination: Path) -> None:
+    if destination.exists():
+        # Same bytes are already stored; keep the existing copy
+        partial_path.unlink(missing_ok=True)
+        os.utime(destination)
+    else:
+        os.replace(partial_path, destination)
+
+
+async def store_upload(
+    upload: UploadFile,
+    directory: Path = Path(settings.UPLOAD_DIRECTORY),
+    max_bytes: int = settings.MAX_FILE_SIZE,
+    chunk_size: int = settings.UPLOAD_CHUNK_SIZE,
+) -> IngestedFile:
+    """
+    Stream an upload into the content-addressed store.
+    Files are named by their sha256, so resubmitting the same video
+    reuses the stored copy instead of writing a duplicate.
+    """
+    directory = Path(directory)
+    partial_path = _partial_path(directory, "upload")
+    size, sha256 = await _stream_to_file(upload, partial_path, max_bytes, chunk_size)
+    destination = directory / content_filename(sha256, upload.filename)
+    await asyncio.to_thread(commit_content, partial_path, destination)
+    return IngestedFile(path=destination, size=size, sha256=sha256)
+
+
+async def measure_upload(
+    upload: UploadFile,
+    max_bytes: int = settings.MAX_FILE_SIZE,
+    chunk_size: int = settings.UPLOAD_CHUNK_SIZE,
+) -> tuple[int, str]:
+    """
+    Count and hash an upload without storing it, stopping early once
+    it exceeds max_bytes. The upload is rewound afterwards.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        while True:
+            chunk = await upload.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise FileTooLargeError(max_bytes)
+            await asyncio.to_thread(digest.update, chunk)
+    finally:
+        await upload.seek(0)
+
+    return size, digest.hexdigest()
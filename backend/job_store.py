@@ -0,0 +1,392 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from config import settings
+
+try:
+    import redis
+except ImportError:  # only needed for redis:// job stores
+    redis = None
+
+
+class JobStore:
+    """
+    Interface for job persistence backends.
+    A job is a JSON-serialisable dict with at least id, status and created_at.
+    """
+
+    def create(self, job: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def update(
+        self,
+        job_id: str,
+        changes: Dict[str, Any],
+        expected_status: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Atomically merge changes into a job and return the new record.
+        When expected_status is given the update only applies if the job is
+        still in that status; None is returned if it is not (or is missing).
+        """
+        raise NotImplementedError
+
+    def list(
+        self,
+        status: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0,
+        batch_id: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        """Return one page of jobs (newest first) and the total match count"""
+        raise NotImplementedError
+
+    def import_job(self, job: Dict[str, Any]) -> bool:
+        """Insert a job unless one with the same id exists; True if inserted"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteJobStore(JobStore):
+    """
+    Job store on an embedded SQLite database in WAL mode.
+    Indexed columns are kept alongside the full JSON record so status and
+    date filters never have to parse every job.
+    """
+
+    def __init__(self, path: str):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                completed_at TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+            CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created_at);
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        if "batch_id" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN batch_id TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_batch ON jobs (batch_id, created_at)")
+
+    def create(self, job: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, status, created_at, completed_at, batch_id, data) VALUES (?, ?, ?, ?, ?, ?)",
+                self._row(job),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def update(
+        self,
+        job_id: str,
+        changes: Dict[str, Any],
+        expected_status: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+                if row is None:
+                    self._conn.execute("ROLLBACK")
+                    return None
+
+                job = json.loads(row[0])
+                if expected_status is not None and job.get("status") != expected_status:
+                    self._conn.execute("ROLLBACK")
+                    return None
+
+                job.update(changes)
+                self._conn.execute(
+                    "UPDATE jobs SET status = ?, created_at = ?, completed_at = ?, batch_id = ?, data = ? WHERE id = ?",
+                    self._row(job)[1:] + (job_id,),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return job
+
+    def list(
+        self,
+        status: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0,
+        batch_id: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        filters = {"status": status, "batch_id": batch_id}
+        clauses = [f"{column} = ?" for column, value in filters.items() if value is not None]
+        params = tuple(value for value in filters.values() if value is not None)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            total = self._conn.execute(f"SELECT COUNT(*) FROM jobs {where}", params).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT data FROM jobs {where} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                params + (limit, offset),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows], total
+
+    def import_job(self, job: Dict[str, Any]) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, status, created_at, completed_at, batch_id, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                self._row(job),
+            )
+        return cursor.rowcount == 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _row(job: Dict[str, Any]) -> tuple:
+        return (
+            job["id"],
+            job["status"],
+            job["created_at"],
+            job.get("completed_at"),
+            job.get("batch_id"),
+            json.dumps(job),
+        )
+
+
+class RedisJobStore(JobStore):
+    """
+    Job store on Redis, shared by every API and worker node.
+    Each job is a JSON string; sorted sets keyed by creation time index all
+    jobs, jobs per status and jobs per batch. Updates are optimistic
+    WATCH/MULTI transactions, so expected_status checks stay atomic across
+    nodes.
+    """
+
+    def __init__(self, url: str, prefix: str = "sports_editor:jobs"):
+        if redis is None:
+            raise RuntimeError("The redis package is required for a redis:// job store")
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    def _key(self, *parts: str) -> str:
+        return ":".join((self.prefix,) + parts)
+
+    @staticmethod
+    def _score(job: Dict[str, Any]) -> float:
+        return datetime.fromisoformat(job["created_at"]).timestamp()
+
+    def _index(self, pipe: Any, job: Dict[str, Any], previous: Optional[Dict[str, Any]] = None) -> None:
+        score = self._score(job)
+        pipe.zadd(self._key("all"), {job["id"]: score})
+        if previous and previous["status"] != job["status"]:
+            pipe.zrem(self._key("status", previous["status"]), job["id"])
+        pipe.zadd(self._key("status", job["status"]), {job["id"]: score})
+        if job.get("batch_id"):
+            pipe.zadd(self._key("batch", job["batch_id"]), {job["id"]: score})
+
+    def create(self, job: Dict[str, Any]) -> None:
+        if not self._insert(job):
+            raise ValueError(f"Job {job['id']} already exists")
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        data = self._redis.get(self._key("job", job_id))
+        return json.loads(data) if data else None
+
+    def update(
+        self,
+        job_id: str,
+        changes: Dict[str, Any],
+        expected_status: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        key = self._key("job", job_id)
+        with self._redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    data = pipe.get(key)
+                    if data is None:
+                        return None
+                    previous = json.loads(data)
+                    if expected_status is not None and previous.get("status") != expected_status:
+                        return None
+
+                    job = {**previous, **changes}
+                    pipe.multi()
+                    pipe.set(key, json.dumps(job))
+                    self._index(pipe, job, previous)
+                    pipe.execute()
+                    return job
+                except redis.WatchError:
+                    # Another node changed the job in between; re-read and retry
+                    continue
+
+    def list(
+        self,
+        status: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0,
+        batch_id: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        if batch_id is not None:
+            ids = self._redis.zrevrange(self._key("batch", batch_id), 0, -1)
+            jobs = [job for job in self._load(ids) if status is None or job["status"] == status]
+            return jobs[offset:offset + limit], len(jobs)
+
+        index = self._key("status", status) if status is not None else self._key("all")
+        with self._redis.pipeline(transaction=False) as pipe:
+            pipe.zcard(index)
+            pipe.zrevrange(index, offset, offset + limit - 1)
+            total, ids = pipe.execute()
+        return self._load(ids), total
+
+    def import_job(self, job: Dict[str, Any]) -> bool:
+        return self._insert(job)
+
+    def close(self) -> None:
+        self._redis.close()
+
+    def _insert(self, job: Dict[str, Any]) -> bool:
+        # The record and its index entries are written in one transaction,
+        # so a crash cannot leave a job that list() and recovery never see
+        key = self._key("job", job["id"])
+        with self._redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    if pipe.exists(key):
+                        return False
+                    pipe.multi()
+                    pipe.set(key, json.dumps(job))
+                    self._index(pipe, job)
+                    pipe.execute()
+                    return True
+                except redis.WatchError:
+                    # Another node wrote the same job in between; re-check
+                    continue
+
+    def _load(self, ids: List[str]) -> List[Dict[str, Any]]:
+        if not ids:
+            return []
+        return [json.loads(data) for data in self._redis.mget([self._key("job", job_id) for job_id in ids]) if data]
+
+
+class AsyncJobStore:
+    """
+    A job store for coroutines. Every call runs on a worker thread, so a
+    store that makes network round trips (Redis) never blocks the event
+    loop. Both backends are safe to call from several threads at once.
+    """
+
+    def __init__(self, store: JobStore):
+        self.store = store
+
+    async def create(self, job: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self.store.create, job)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def update(
+        self,
+        job_id: str,
+        changes: Dict[str, Any],
+        expected_status: Optional[str] = None,
+    ) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.update, job_id, changes, expected_status)
+
+    async def list(
+        self,
+        status: Optional[str] = None,
+        limit: int = 50,
+        offset: int = 0,
+        batch_id: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], int]:
+        return await asyncio.to_thread(self.store.list, status, limit, offset, batch_id)
+
+    def close(self) -> None:
+        self.store.close()
+
+
+def _sqlite_from_url(url) -> SQLiteJobStore:
+    # sqlite:///relative.db and sqlite:////absolute/path.db
+    return SQLiteJobStore(url.path[1:] or "jobs.db")
+
+
+def _redis_from_url(url) -> RedisJobStore:
+    return RedisJobStore(url.geturl())
+
+
+_BACKENDS = {
+    "sqlite": _sqlite_from_url,
+    "redis": _redis_from_url,
+    "rediss": _redis_from_url,
+}
+
+
+def create_job_store(url: str = settings.JOB_STORE_URL) -> JobStore:
+    """Build a job store from a URL such as sqlite:///./jobs.db or redis://localhost:6379/0"""
+    parsed = urlparse(url)
+    if parsed.scheme not in _BACKENDS:
+        raise ValueError(f"Unsupported job store: {parsed.scheme}")
+    return _BACKENDS[parsed.scheme](parsed)
+
+
+def migrate_json_jobs(store: JobStore, directory: str = settings.JOBS_DIRECTORY) -> Dict[str, int]:
+    """
+    One-shot import of legacy jobs/<id>.json records into the store.
+    Imported files are renamed to <id>.json.migrated so the migration is
+    not repeated; empty or torn files are skipped and left in place.
+    """
+    counts = {"imported": 0, "existing": 0, "skipped": 0}
+
+    for job_file in sorted(Path(directory).glob("*.json")):
+        try:
+            with open(job_file, "r") as f:
+                job = json.load(f)
+            job.setdefault("id", job_file.stem)
+            job.setdefault("status", "failed")
+            job.setdefault(
+                "created_at",
+                datetime.fromtimestamp(job_file.stat().st_mtime).isoformat(),
+            )
+        except (OSError, ValueError, AttributeError):
+            counts["skipped"] += 1
+            continue
+
+        if store.import_job(job):
+            counts["imported"] += 1
+        else:
+            counts["existing"] += 1
+        os.replace(job_file, job_file.with_name(job_file.name + ".migrated"))
+
+    return counts
+
+
+if __name__ == "__main__":
+    store = create_job_store()
+    print(migrate_json_jobs(store))
+    store.close()
@@ -0,0 +1,61 @@
+import json
+import logging
+from typing import Any, Dict
+
+from config import settings
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def _extra_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_FIELDS}
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Readable line with `extra` fields appended as key=value pairs"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        fields = " ".join(f"{key}={value}" for key, value in _extra_fields(record).items())
+        return f"{line} {fields}" if fields else line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including `extra` fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **_extra_fields(record),
+        }
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+def configure_logging(
+    level: str = settings.LOG_LEVEL,
+    log_format: str = settings.LOG_FORMAT,
+    overrides: str = settings.LOG_LEVELS,
+) -> None:
+    """
+    Set up the root logger. `overrides` raises or silences single modules,
+    e.g. "httpx=WARNING,hosting=DEBUG", so hot paths can be switched off.
+    """
+    handler = logging.StreamHandler()
+    if log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(KeyValueFormatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level.upper())
+
+    for item in filter(None, (part.strip() for part in overrides.split(","))):
+        name, _, module_level = item.partition("=")
+        logging.getLogger(name.strip()).setLevel(module_level.strip().upper())
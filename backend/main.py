@@ -1,18 +1,50 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import Depends, FastAPI, HTTPException, UploadFile, File, Form, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 import uvicorn
 import os
 import json
+import secrets
 import uuid
 import asyncio
+import logging
+import time
+from contextlib import AsyncExitStack
 from datetime import datetime
+from functools import partial
 from pathlib import Path
-from typing import Optional
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple, Union
 
 from config import settings
-from runway_client import RunwayClient
+from events import event_bus
+from hosting import hosting
+from http_pool import close_http_client
+from ingest import FileTooLargeError, IngestedFile, measure_upload, store_upload
+from job_store import AsyncJobStore, create_job_store, migrate_json_jobs
+from logging_config import configure_logging
+from media import MediaFiles, is_media_name, media_response
+from metrics import BYTES_TOTAL, JOB_SECONDS, JOBS_TOTAL, STAGE_SECONDS, registry
+from normalize import normalizer
+from pipeline import StageError, StageGraph
+from playback import packager
+from preflight import face_preflight
+from probe import ProbeError, UnsupportedContainerError, check_probe, probe_cached
+from result_cache import ResultCache, result_cache
+from runway_client import ACT_TWO_RATIOS, RunwayClient
+from scheduler import QueueFullError, scheduler
+from storage import StorageManager
+from tunnel import tunnel_manager
+from upload_sessions import IncompleteUploadError, TooManyUploadsError, UploadSessionError, UploadSessionNotFound, upload_sessions
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+if settings.JOB_QUEUE_URL:
+    # Workers may run on other nodes: share job events with them
+    from redis_queue import RedisEventRelay, RedisUrlCache
+    event_bus.relay = RedisEventRelay(settings.JOB_QUEUE_URL, event_bus)
+    # ... and the inputs API nodes host early, for the worker that runs the job
+    hosting.shared = RedisUrlCache(settings.JOB_QUEUE_URL)
 
 # Create FastAPI app
 app = FastAPI(
@@ -34,31 +66,233 @@ app.add_middleware(
 os.makedirs(settings.UPLOAD_DIRECTORY, exist_ok=True)
 os.makedirs(settings.JOBS_DIRECTORY, exist_ok=True)
 
-# Mount static files
-app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIRECTORY), name="uploads")
-app.mount("/jobs", StaticFiles(directory=settings.JOBS_DIRECTORY), name="jobs")
-
-# Add a simple endpoint to serve videos with CORS headers for external access
-@app.get("/serve/{filename}")
-async def serve_video(filename: str):
-    from fastapi.responses import FileResponse
-    file_path = Path(settings.UPLOAD_DIRECTORY) / filename
-    if file_path.exists():
-        return FileResponse(
-            path=file_path,
-            media_type="video/mp4",
-            headers={
-                "Access-Control-Allow-Origin": "*",
-                "Access-Control-Allow-Methods": "GET",
-                "Access-Control-Allow-Headers": "*",
-            }
-        )
-    else:
+# Mount static files; partial files, session state and job records stay private
+app.mount("/uploads", MediaFiles(directory=settings.UPLOAD_DIRECTORY), name="uploads")
+app.mount("/jobs", MediaFiles(directory=settings.JOBS_DIRECTORY), name="jobs")
+
+def resolve_media_path(filename: str) -> Optional[Path]:
+    """Find an upload or job output by bare filename"""
+    if not is_media_name(filename):
+        return None
+    for directory in (settings.UPLOAD_DIRECTORY, settings.JOBS_DIRECTORY):
+        file_path = Path(directory) / filename
+        if file_path.is_file():
+            return file_path
+    return None
+
+# Serve uploads and job outputs with byte ranges and caching, with CORS headers for external access
+@app.api_route("/serve/{filename}", methods=["GET", "HEAD"])
+async def serve_video(filename: str, request: Request):
+    file_path = resolve_media_path(filename)
+    if file_path is None:
         raise HTTPException(status_code=404, detail="File not found")
+    
+    storage_manager.touch(file_path)
+    return media_response(
+        request,
+        file_path,
+        headers={
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Methods": "GET, HEAD",
+            "Access-Control-Allow-Headers": "*",
+            "Access-Control-Expose-Headers": "Content-Range, Content-Length, ETag",
+        }
+    )
 
 # Initialize Runway client
 runway_client = RunwayClient()
 
+# Initialize job store; its calls run off the event loop
+job_store = AsyncJobStore(create_job_store())
+# Serializes job updates so their events go out in the order they were applied
+_update_lock: Optional[asyncio.Lock] = None
+
+JOB_STATUSES = ("queued", "processing", "completed", "failed")
+FINISHED_STATUSES = ("completed", "failed")
+
+async def update_job(job_id: str, changes: dict, expected_status: Optional[str] = None) -> Optional[dict]:
+    """Apply a job state change and push it to anyone watching the job"""
+    global _update_lock
+    if _update_lock is None:
+        _update_lock = asyncio.Lock()
+    async with _update_lock:
+        job_data = await job_store.update(job_id, changes, expected_status=expected_status)
+        if job_data is not None:
+            event_bus.publish(job_id, {"event": "job", "data": job_data})
+    return job_data
+
+async def mark_outputs_removed(removed: List[Tuple[str, str]]):
+    """
+    Storage GC deleted files; clear them from every job pointing at them,
+    including cache hits that were handed another job's output
+    """
+    filenames = {name for directory, name in removed if directory == "jobs"}
+    if not filenames:
+        return
+    for job in await jobs_with_status("completed"):
+        changes = {}
+        if job.get("output_file") in filenames:
+            changes.update({"output_file": None, "output_expired_at": datetime.now().isoformat()})
+        artifacts = job.get("artifacts") or {}
+        kept = {kind: value for kind, value in artifacts.items() if value not in filenames}
+        if kept != artifacts:
+            changes["artifacts"] = kept
+        if changes:
+            await update_job(job["id"], changes)
+
+# Quotas, TTLs and LRU eviction for uploads/ and jobs/
+storage_manager = StorageManager(job_store.store, result_cache, on_remove=mark_outputs_removed)
+
+# Point-in-time gauges, read when /metrics is scraped
+registry.gauge("queue_depth", "Jobs waiting for a worker", lambda: {(): scheduler.stats()["queued"]})
+registry.gauge("jobs_running", "Jobs a worker is processing", lambda: {(): scheduler.stats()["running"]})
+registry.gauge(
+    "stage_in_flight", "Jobs holding a stage slot",
+    lambda: {(name,): stage["active"] for name, stage in scheduler.stats()["stages"].items()},
+    ["stage"]
+)
+registry.gauge("runway_tasks_outstanding", "Runway tasks being polled", lambda: {(): runway_client.poller.outstanding})
+registry.gauge(
+    "runway_concurrency_limit", "Runway tasks the gateway currently lets run at once",
+    lambda: {(): runway_client.gateway.concurrency_limit}
+)
+registry.gauge("event_subscribers", "Open job event streams", lambda: {(): event_bus.subscriber_count})
+registry.gauge(
+    "storage_bytes", "Bytes indexed by the storage manager",
+    lambda: {(index.name,): index.total_bytes for index in storage_manager.indexes},
+    ["directory"]
+)
+
+@app.on_event("startup")
+async def migrate_legacy_jobs():
+    counts = await asyncio.to_thread(migrate_json_jobs, job_store.store)
+    if counts["imported"] or counts["skipped"]:
+        logger.info("Migrated legacy job files", extra=counts)
+
+@app.on_event("startup")
+async def start_tunnel():
+    # Only nodes serving the API can answer /serve through the tunnel, so
+    # workers (which run start_scheduler alone) never open one
+    if settings.NGROK_ENABLED:
+        await tunnel_manager.start()
+
+@app.on_event("startup")
+async def start_scheduler():
+    face_preflight.start()
+    normalizer.start()
+    packager.start()
+    await result_cache.start()
+    await runway_client.poller.start()
+    if event_bus.relay is not None:
+        await event_bus.relay.start()
+    if hosting.shared is not None:
+        await hosting.shared.start()
+    await scheduler.start(process_delivery if settings.JOB_QUEUE_URL else process_video)
+
+async def jobs_with_status(status: str) -> List[dict]:
+    """Every job in a status, oldest first"""
+    jobs = []
+    while True:
+        page, total = await job_store.list(status=status, limit=200, offset=len(jobs))
+        jobs.extend(page)
+        if not page or len(jobs) >= total:
+            break
+    jobs.reverse()
+    return jobs
+
+def job_input_paths(job: dict) -> Optional[Tuple[str, str]]:
+    if "act_two" not in job:
+        # Record from before jobs kept their inputs and parameters
+        return None
+    paths = tuple(
+        str(Path(settings.UPLOAD_DIRECTORY) / job[f"{label}_file"]) for label in ("character", "reference")
+    )
+    return paths if all(os.path.exists(path) for path in paths) else None
+
+@app.on_event("startup")
+async def recover_unfinished_jobs():
+    """
+    Pick up jobs interrupted by a restart. Jobs with a submitted Runway task
+    resume waiting on (and downloading) that task; the rest go back in the
+    queue in their original order, even past JOB_QUEUE_SIZE.
+    """
+    if settings.JOB_QUEUE_URL:
+        # The shared queue redelivers jobs whose worker went away
+        return
+    resumed = requeued = 0
+    for job in await jobs_with_status("processing") + await jobs_with_status("queued"):
+        paths = job_input_paths(job)
+        if paths is None:
+            await update_job(job["id"], {
+                "status": "failed",
+                "error": "Job was interrupted by a server restart",
+                "completed_at": datetime.now().isoformat()
+            })
+            continue
+        
+        # Already accepted before the restart, so not held to the queue bound
+        if job["status"] == "processing" and job.get("runway_task_id"):
+            await scheduler.submit(job["id"], *paths, True, force=True)
+            resumed += 1
+        else:
+            if job["status"] == "processing":
+                await update_job(job["id"], {"status": "queued", "stage": None}, expected_status="processing")
+            await scheduler.submit(job["id"], *paths, force=True)
+            requeued += 1
+    
+    if resumed or requeued:
+        logger.info("Recovered jobs after restart: %d resumed, %d requeued", resumed, requeued)
+
+@app.on_event("startup")
+async def start_storage_manager():
+    if settings.STORAGE_GC_ENABLED:
+        await storage_manager.start()
+
+@app.on_event("shutdown")
+async def stop_scheduler():
+    await scheduler.stop()
+    if event_bus.relay is not None:
+        await event_bus.relay.stop()
+    if hosting.shared is not None:
+        await hosting.shared.stop()
+    await runway_client.poller.stop()
+    face_preflight.stop()
+    await storage_manager.stop()
+    await result_cache.stop()
+    await close_http_client()
+
+@app.on_event("shutdown")
+async def stop_tunnel():
+    await tunnel_manager.stop()
+
+@app.on_event("shutdown")
+async def close_job_store():
+    job_store.close()
+
+def queue_full_error(retry_after: int) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail="Too many jobs in progress, please retry shortly",
+        headers={"Retry-After": str(retry_after)}
+    )
+
+async def probe_video(
+    label: str, sha256: str, source: Union[str, BinaryIO]
+) -> Tuple[List[str], List[str], Optional[Dict[str, Any]]]:
+    """
+    Read an input's MP4/MOV header and check it against Act Two's limits.
+    Containers the probe does not understand (e.g. WebM) pass unchecked.
+    """
+    try:
+        probe = await asyncio.to_thread(probe_cached, sha256, source)
+    except UnsupportedContainerError:
+        return [], [], None
+    except ProbeError as e:
+        return [f"{label} could not be read: {e}"], [], None
+    trim_to = normalizer.max_duration if normalizer.enabled else None
+    issues, warnings = check_probe(label, probe, trim_to)
+    return issues, warnings, probe.as_dict()
+
 @app.get("/")
 async def root():
     return {"message": "Sports Editor API is running"}
@@ -67,6 +301,11 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of stage latencies, job outcomes, queue depth and bytes moved"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.post("/api/validate-videos")
 async def validate_videos(
     character_file: UploadFile = File(...),
@@ -76,25 +315,33 @@ async def validate_videos(
     
     # Basic file validation
     issues = []
+    warnings = []
+    videos = {}
     
-    # Check character file
-    if not character_file.content_type or not character_file.content_type.startswith('video/'):
-        issues.append("Character file must be a video")
-    elif character_file.size and character_file.size > settings.MAX_FILE_SIZE:
-        issues.append("Character file too large")
-    
-    # Check reference file  
-    if not reference_file.content_type or not reference_file.content_type.startswith('video/'):
-        issues.append("Reference file must be a video")
-    elif reference_file.size and reference_file.size > settings.MAX_FILE_SIZE:
-        issues.append("Reference file too large")
+    for label, upload in (("Character", character_file), ("Reference", reference_file)):
+        if not upload.content_type or not upload.content_type.startswith('video/'):
+            issues.append(f"{label} file must be a video")
+            continue
+        try:
+            _, sha256 = await measure_upload(upload)
+        except FileTooLargeError:
+            issues.append(f"{label} file too large")
+            continue
+        
+        # Resolution, duration and codec straight from the container header
+        video_issues, video_warnings, info = await probe_video(label, sha256, upload.file)
+        issues.extend(video_issues)
+        warnings.extend(video_warnings)
+        videos[label.lower()] = info
     
     if issues:
-        return {"valid": False, "issues": issues}
+        return {"valid": False, "issues": issues, "warnings": warnings, "videos": videos}
     
     # Return guidance for Act Two requirements
     return {
         "valid": True,
+        "warnings": warnings,
+        "videos": videos,
         "guidance": {
             "requirements": [
                 "Both videos must show clear, visible faces",
@@ -112,123 +359,724 @@ async def validate_videos(
         }
     }
 
+def check_video_type(label: str, upload: UploadFile):
+    if not upload.content_type or not upload.content_type.startswith('video/'):
+        raise HTTPException(status_code=400, detail=f"{label} file must be a video")
+    
+    if upload.size and upload.size > settings.MAX_FILE_SIZE:
+        raise HTTPException(status_code=400, detail=f"{label} file too large")
+
+def check_act_two(ratio: str, expression_intensity: int):
+    if ratio not in ACT_TWO_RATIOS:
+        raise HTTPException(status_code=400, detail=f"Ratio must be one of {', '.join(ACT_TWO_RATIOS)}")
+    
+    if not 1 <= expression_intensity <= 5:
+        raise HTTPException(status_code=400, detail="Expression intensity must be between 1 and 5")
+
+async def store_input(label: str, upload: UploadFile, ratio: str) -> Tuple[IngestedFile, Optional[dict]]:
+    """
+    Stream an input into the content-addressed store and probe its header.
+    Size is enforced on the real byte count and identical files are stored once.
+    """
+    try:
+        stored = await store_upload(upload)
+    except FileTooLargeError:
+        raise HTTPException(status_code=400, detail=f"{label} file too large")
+    BYTES_TOTAL.inc(stored.size, direction="ingest")
+    return await check_input(label, stored, ratio)
+
+async def check_input(label: str, stored: IngestedFile, ratio: str) -> Tuple[IngestedFile, Optional[dict]]:
+    """
+    Reject stored inputs Runway would refuse before they take a queue slot;
+    one that passes starts hosting right away, while the rest of the
+    request is handled
+    """
+    storage_manager.touch(stored.path)
+    issues, _, probe = await probe_video(label, stored.sha256, str(stored.path))
+    if issues:
+        raise HTTPException(status_code=400, detail="; ".join(issues))
+    prehost_input(stored, probe, ratio)
+    return stored, probe
+
+async def submit_job(
+    character: Tuple[IngestedFile, Optional[dict]],
+    reference: Tuple[IngestedFile, Optional[dict]],
+    act_two: dict,
+    batch_id: Optional[str] = None,
+    ingest_seconds: Optional[float] = None
+) -> dict:
+    """Create a job for a stored input pair and queue it (or answer it from the result cache)"""
+    (character_file, character_probe), (reference_file, reference_probe) = character, reference
+    job_id = str(uuid.uuid4())
+    cache_key = ResultCache.make_key(character_file.sha256, reference_file.sha256, **act_two)
+    
+    # Create job record
+    job_data = {
+        "id": job_id,
+        "batch_id": batch_id,
+        "status": "queued",
+        "character_file": character_file.path.name,
+        "reference_file": reference_file.path.name,
+        "character_sha256": character_file.sha256,
+        "reference_sha256": reference_file.sha256,
+        "character_size": character_file.size,
+        "reference_size": reference_file.size,
+        "character_probe": character_probe,
+        "reference_probe": reference_probe,
+        "act_two": act_two,
+        "cache_key": cache_key,
+        "cache_hit": False,
+        "timings": {"ingest": round(ingest_seconds, 3)} if ingest_seconds is not None else {},
+        "output_file": None,
+        "error": None,
+        "created_at": datetime.now().isoformat(),
+        "completed_at": None
+    }
+    
+    # Same inputs and parameters already rendered: hand back the existing output
+    cached = await result_cache.get(cache_key)
+    if cached:
+        job_data.update({
+            "status": "completed",
+            "output_file": cached["output_file"],
+            "artifacts": (await job_store.get(cached["job_id"]) or {}).get("artifacts") or {},
+            "cache_hit": True,
+            "completed_at": datetime.now().isoformat()
+        })
+        JOBS_TOTAL.inc(status="cached")
+    
+    # Save job data
+    await job_store.create(job_data)
+    
+    if cached:
+        return {"job_id": job_id, "status": "completed"}
+    
+    # Queue for processing by the scheduler's workers
+    try:
+        position = await scheduler.submit(job_id, str(character_file.path), str(reference_file.path))
+    except QueueFullError:
+        await update_job(job_id, {
+            "status": "failed",
+            "error": "Server busy, job was not queued",
+            "completed_at": datetime.now().isoformat()
+        })
+        raise
+    
+    return {"job_id": job_id, "status": "queued", "queue_position": position}
+
 @app.post("/api/upload")
 async def upload_video(
     character_file: UploadFile = File(...),
-    reference_file: UploadFile = File(...)
+    reference_file: UploadFile = File(...),
+    ratio: str = Form(settings.ACT_TWO_RATIO),
+    body_control: bool = Form(settings.ACT_TWO_BODY_CONTROL),
+    expression_intensity: int = Form(settings.ACT_TWO_EXPRESSION_INTENSITY)
 ):
-    # Validate character file
-    if not character_file.content_type or not character_file.content_type.startswith('video/'):
-        raise HTTPException(status_code=400, detail="Character file must be a video")
+    check_video_type("Character", character_file)
+    check_video_type("Reference", reference_file)
+    check_act_two(ratio, expression_intensity)
     
-    if character_file.size and character_file.size > settings.MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="Character file too large")
+    # Refuse early when there is no room in the queue, before reading the bodies
+    if await scheduler.is_full():
+        raise queue_full_error(scheduler.retry_after())
     
-    # Validate reference file
-    if not reference_file.content_type or not reference_file.content_type.startswith('video/'):
-        raise HTTPException(status_code=400, detail="Reference file must be a video")
+    started = time.monotonic()
+    character = await store_input("Character", character_file, ratio)
+    reference = await store_input("Reference", reference_file, ratio)
+    ingest_seconds = time.monotonic() - started
+    STAGE_SECONDS.observe(ingest_seconds, stage="ingest")
     
-    if reference_file.size and reference_file.size > settings.MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="Reference file too large")
+    act_two = {
+        "ratio": ratio,
+        "body_control": body_control,
+        "expression_intensity": expression_intensity,
+    }
+    try:
+        return await submit_job(character, reference, act_two, ingest_seconds=ingest_seconds)
+    except QueueFullError as e:
+        raise queue_full_error(e.retry_after)
+
+@app.post("/api/batches")
+async def create_batch(
+    character_files: List[UploadFile] = File(...),
+    reference_files: List[UploadFile] = File(...),
+    ratio: str = Form(settings.ACT_TWO_RATIO),
+    body_control: bool = Form(settings.ACT_TWO_BODY_CONTROL),
+    expression_intensity: int = Form(settings.ACT_TWO_EXPRESSION_INTENSITY)
+):
+    """One reference against many characters, or one character against many references"""
+    if len(character_files) != 1 and len(reference_files) != 1:
+        raise HTTPException(
+            status_code=400,
+            detail="A batch pairs one reference with many characters, or one character with many references"
+        )
     
-    # Generate job ID
-    job_id = str(uuid.uuid4())
+    job_count = len(character_files) * len(reference_files)
+    if job_count > settings.BATCH_MAX_JOBS:
+        raise HTTPException(status_code=400, detail=f"A batch can have at most {settings.BATCH_MAX_JOBS} jobs")
     
-    # Save character file
-    char_extension = Path(character_file.filename).suffix
-    character_filename = f"{job_id}_character{char_extension}"
-    character_path = Path(settings.UPLOAD_DIRECTORY) / character_filename
+    for index, upload in enumerate(character_files, 1):
+        check_video_type(f"Character {index}", upload)
+    for index, upload in enumerate(reference_files, 1):
+        check_video_type(f"Reference {index}", upload)
+    check_act_two(ratio, expression_intensity)
     
-    with open(character_path, "wb") as buffer:
-        content = await character_file.read()
-        buffer.write(content)
+    # The whole batch has to fit, so it is never half-queued
+    if await scheduler.free_slots() < job_count:
+        raise queue_full_error(scheduler.retry_after())
     
-    # Save reference file
-    ref_extension = Path(reference_file.filename).suffix
-    reference_filename = f"{job_id}_reference{ref_extension}"
-    reference_path = Path(settings.UPLOAD_DIRECTORY) / reference_filename
+    # The shared input is stored (and later normalized and hosted) once
+    started = time.monotonic()
+    characters = [await store_input(f"Character {i}", f, ratio) for i, f in enumerate(character_files, 1)]
+    references = [await store_input(f"Reference {i}", f, ratio) for i, f in enumerate(reference_files, 1)]
+    ingest_seconds = time.monotonic() - started
+    STAGE_SECONDS.observe(ingest_seconds, stage="ingest")
     
-    with open(reference_path, "wb") as buffer:
-        content = await reference_file.read()
-        buffer.write(content)
+    act_two = {
+        "ratio": ratio,
+        "body_control": body_control,
+        "expression_intensity": expression_intensity,
+    }
+    batch_id = str(uuid.uuid4())
+    jobs = []
+    for character in characters:
+        for reference in references:
+            try:
+                jobs.append(await submit_job(
+                    character, reference, act_two, batch_id=batch_id, ingest_seconds=ingest_seconds
+                ))
+            except QueueFullError:
+                jobs.append({"status": "failed", "error": "Server busy, job was not queued"})
     
-    # Create job record
-    job_data = {
-        "id": job_id,
-        "status": "processing",
-        "character_file": character_filename,
-        "reference_file": reference_filename,
-        "output_file": None,
-        "error": None,
-        "created_at": datetime.now().isoformat(),
-        "completed_at": None
+    return {"batch_id": batch_id, "jobs": jobs}
+
+@app.post("/api/uploads")
+async def create_upload(
+    filename: str = Form(...),
+    size: int = Form(...),
+    content_type: str = Form("video/mp4"),
+    sha256: Optional[str] = Form(None)
+):
+    """Start a resumable chunked upload of one input video"""
+    if not content_type.startswith('video/'):
+        raise HTTPException(status_code=400, detail="File must be a video")
+    if await scheduler.is_full():
+        raise queue_full_error(scheduler.retry_after())
+    try:
+        return await upload_sessions.create(filename, size, content_type, sha256)
+    except FileTooLargeError as e:
+        raise HTTPException(status_code=400, detail=f"File too large (limit {e.max_bytes} bytes)")
+    except TooManyUploadsError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(settings.JOB_RETRY_AFTER)})
+    except UploadSessionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/uploads/{upload_id}")
+async def get_upload(upload_id: str):
+    """Which chunks have arrived, so an interrupted upload can send only the rest"""
+    try:
+        return await upload_sessions.status(upload_id)
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+
+@app.put("/api/uploads/{upload_id}/chunks/{index}")
+async def put_upload_chunk(
+    upload_id: str,
+    index: int,
+    request: Request,
+    x_chunk_sha256: Optional[str] = Header(None)
+):
+    """Store one chunk, in any order; X-Chunk-SHA256 is checked when sent"""
+    try:
+        chunk = await upload_sessions.write_chunk(upload_id, index, request.stream(), x_chunk_sha256)
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except UploadSessionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    BYTES_TOTAL.inc(chunk["size"], direction="ingest")
+    return chunk
+
+@app.post("/api/uploads/{upload_id}/commit")
+async def commit_upload(upload_id: str):
+    try:
+        upload = await upload_sessions.commit(upload_id)
+    except UploadSessionNotFound:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    except IncompleteUploadError as e:
+        raise HTTPException(status_code=409, detail={"error": str(e), "missing": e.missing})
+    except UploadSessionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    STAGE_SECONDS.observe(upload["committed"]["seconds"], stage="ingest")
+    return upload
+
+@app.post("/api/jobs")
+async def create_job(
+    character_upload: str = Form(...),
+    reference_upload: str = Form(...),
+    ratio: str = Form(settings.ACT_TWO_RATIO),
+    body_control: bool = Form(settings.ACT_TWO_BODY_CONTROL),
+    expression_intensity: int = Form(settings.ACT_TWO_EXPRESSION_INTENSITY)
+):
+    """Same as /api/upload, for two inputs sent as committed chunked uploads"""
+    check_act_two(ratio, expression_intensity)
+    if await scheduler.is_full():
+        raise queue_full_error(scheduler.retry_after())
+    
+    inputs = []
+    ingest_seconds = 0.0
+    for label, upload_id in (("Character", character_upload), ("Reference", reference_upload)):
+        try:
+            stored = await upload_sessions.ingested(upload_id)
+            ingest_seconds = max(ingest_seconds, (await upload_sessions.status(upload_id))["committed"]["seconds"])
+        except UploadSessionNotFound:
+            raise HTTPException(status_code=404, detail=f"{label} upload not found")
+        except UploadSessionError as e:
+            raise HTTPException(status_code=400, detail=f"{label}: {e}")
+        inputs.append(await check_input(label, stored, ratio))
+    
+    act_two = {
+        "ratio": ratio,
+        "body_control": body_control,
+        "expression_intensity": expression_intensity,
     }
+    try:
+        return await submit_job(*inputs, act_two, ingest_seconds=ingest_seconds)
+    except QueueFullError as e:
+        raise queue_full_error(e.retry_after)
+
+@app.get("/api/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    jobs, total = await job_store.list(batch_id=batch_id, limit=settings.BATCH_MAX_JOBS)
+    if total == 0:
+        raise HTTPException(status_code=404, detail="Batch not found")
     
-    # Save job data
-    job_file = Path(settings.JOBS_DIRECTORY) / f"{job_id}.json"
-    with open(job_file, "w") as f:
-        json.dump(job_data, f)
+    jobs.reverse()  # submission order
+    counts = {status: 0 for status in JOB_STATUSES}
+    for job in jobs:
+        counts[job["status"]] += 1
+    finished = counts["completed"] + counts["failed"]
     
-    # Start processing in background
-    asyncio.create_task(process_video(job_id, str(character_path), str(reference_path)))
+    return {
+        "batch_id": batch_id,
+        "total": total,
+        "counts": counts,
+        "progress": finished / total,
+        "finished": finished == total,
+        "jobs": [
+            {
+                "job_id": job["id"],
+                "status": job["status"],
+                "stage": job.get("stage"),
+                "character_file": job["character_file"],
+                "reference_file": job["reference_file"],
+                "error": job["error"],
+                # Each result can be fetched as soon as its own job completes, until the GC expires it
+                "output_url": f"/serve/{job['output_file']}" if job["status"] == "completed" and job.get("output_file") else None
+            }
+            for job in jobs
+        ]
+    }
+
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    return await result_cache.stats()
+
+# Proxies such as the ngrok agent connect from localhost too, but add forwarding headers
+FORWARDING_HEADERS = ("x-forwarded-for", "forwarded", "x-real-ip")
+LOCAL_CLIENTS = ("127.0.0.1", "::1")
+
+async def require_admin(request: Request, x_admin_key: Optional[str] = Header(None)):
+    """Admin routes take ADMIN_API_KEY, or without one only direct requests from this machine"""
+    if settings.ADMIN_API_KEY:
+        if not x_admin_key or not secrets.compare_digest(x_admin_key, settings.ADMIN_API_KEY):
+            raise HTTPException(status_code=401, detail="Admin key required")
+        return
+    client = request.client.host if request.client else None
+    if client not in LOCAL_CLIENTS or any(header in request.headers for header in FORWARDING_HEADERS):
+        raise HTTPException(status_code=403, detail="Admin routes are only served to local requests")
+
+@app.get("/api/admin/storage", dependencies=[Depends(require_admin)])
+async def get_storage_stats():
+    return storage_manager.stats()
+
+@app.post("/api/admin/storage/gc", dependencies=[Depends(require_admin)])
+async def run_storage_gc():
+    reclaimed = await storage_manager.collect()
+    return {"reclaimed": reclaimed, **storage_manager.stats()}
+
+@app.post("/api/admin/storage/pins/{job_id}", dependencies=[Depends(require_admin)])
+async def pin_job_files(job_id: str):
+    """Keep a job's inputs and output regardless of TTLs and quotas"""
+    job_data = await job_store.get(job_id)
+    if job_data is None:
+        raise HTTPException(status_code=404, detail="Job not found")
     
-    return {"job_id": job_id, "status": "processing"}
+    files = [job_data.get(key) for key in ("character_file", "reference_file", "output_file")]
+    files += [item["file"] for item in (job_data.get("normalized") or {}).values()]
+    storage_manager.pin(job_id, [name for name in files if name])
+    return {"job_id": job_id, "pinned": True}
+
+@app.delete("/api/admin/storage/pins/{job_id}", dependencies=[Depends(require_admin)])
+async def unpin_job_files(job_id: str):
+    if not storage_manager.unpin(job_id):
+        raise HTTPException(status_code=404, detail="Job is not pinned")
+    return {"job_id": job_id, "pinned": False}
+
+@app.get("/api/jobs")
+async def list_jobs(
+    status: Optional[str] = None,
+    batch_id: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+    offset: int = Query(0, ge=0)
+):
+    if status is not None and status not in JOB_STATUSES:
+        raise HTTPException(status_code=400, detail=f"Status must be one of {', '.join(JOB_STATUSES)}")
+    
+    jobs, total = await job_store.list(status=status, limit=limit, offset=offset, batch_id=batch_id)
+    return {"jobs": jobs, "total": total, "limit": limit, "offset": offset}
 
 @app.get("/api/jobs/{job_id}")
 async def get_job_status(job_id: str):
-    job_file = Path(settings.JOBS_DIRECTORY) / f"{job_id}.json"
+    job_data = await job_store.get(job_id)
     
-    if not job_file.exists():
+    if job_data is None:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    with open(job_file, "r") as f:
-        job_data = json.load(f)
+    if job_data["status"] == "queued":
+        job_data["queue_position"] = await scheduler.position(job_id)
     
     return job_data
 
-async def process_video(job_id: str, character_path: str, reference_path: str):
-    """Process video with Runway Act Two API"""
-    job_file = Path(settings.JOBS_DIRECTORY) / f"{job_id}.json"
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """Server-sent events with job state transitions and render progress"""
+    queue = event_bus.subscribe(job_id)
+    job_data = await job_store.get(job_id)
     
+    if job_data is None:
+        event_bus.unsubscribe(job_id, queue)
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    if job_data["status"] == "queued":
+        job_data["queue_position"] = await scheduler.position(job_id)
+    
+    def format_event(event: str, data: dict) -> str:
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+    
+    async def event_stream():
+        try:
+            yield format_event("job", job_data)
+            if job_data["status"] in FINISHED_STATUSES:
+                return
+            
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=settings.SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                
+                yield format_event(message["event"], message["data"])
+                if message["event"] == "job" and message["data"]["status"] in FINISHED_STATUSES:
+                    return
+        finally:
+            event_bus.unsubscribe(job_id, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.get("/api/hosting/stats")
+async def get_hosting_stats():
+    return {**hosting.stats_snapshot(), "tunnel_url": tunnel_manager.public_url}
+
+@app.get("/api/scheduler/stats")
+async def get_scheduler_stats():
+    return {**scheduler.stats(), "runway": runway_client.gateway.stats()}
+
+async def normalize_input(job_data: dict, label: str, path: str) -> Tuple[str, Optional[dict]]:
+    """
+    Swap in a smaller H.264 copy of an input that is bigger than Act Two needs.
+    An input ffmpeg cannot handle is hosted as uploaded.
+    """
+    ratio = job_data["act_two"]["ratio"]
+    if not normalizer.needs_normalizing(job_data.get(f"{label}_probe"), ratio):
+        return path, None
     try:
-        # Load job data
-        with open(job_file, "r") as f:
-            job_data = json.load(f)
-        
-        # Call Runway API
-        result = await runway_client.process_video(character_path, reference_path)
+        result = await normalizer.normalize(path, job_data[f"{label}_sha256"], ratio)
+    except Exception as e:
+        logger.warning("Could not normalize %s video: %s", label, e)
+        return path, None
+    return str(result), {"file": result.name, "size": result.stat().st_size}
+
+async def host_input(path: str) -> str:
+    """Public URL for an input, taking a hosting slot unless it is already (being) hosted"""
+    if hosting.known(path):
+        return await hosting.host(path)
+    async with scheduler.stage("hosting"):
+        return await hosting.host(path)
+
+def prehost_input(stored: IngestedFile, probe: Optional[dict], ratio: str):
+    """
+    Start hosting an input as soon as it has landed and passed its probe,
+    when the file will be hosted as uploaded; the hosting stage of the job
+    then reuses this upload, on this node or (through the shared URL
+    cache) on the worker that runs it.
+    """
+    if face_preflight.enabled and not all(provider.local for provider in hosting.providers):
+        # Not published anywhere before the face preflight has passed it; a
+        # failed local upload would fall back to the public temp hosts
+        return
+    if normalizer.enabled and normalizer.needs_normalizing(probe, ratio):
+        return
+    
+    async def prehost():
+        try:
+            await host_input(str(stored.path))
+        except Exception as e:
+            logger.info("Early hosting failed, the job will host the input itself: %s", e)
+    
+    scheduler.detach(prehost())
+
+async def run_face_preflight(job_data: dict, character_path: str, reference_path: str) -> Tuple[dict, List[str]]:
+    """Face scores for both inputs and the reasons (if any) to stop here"""
+    inputs = (
+        ("Character", character_path, job_data["character_sha256"]),
+        ("Reference", reference_path, job_data["reference_sha256"]),
+    )
+    results = await asyncio.gather(
+        *(face_preflight.analyze(path, sha256) for _, path, sha256 in inputs),
+        return_exceptions=True
+    )
+    
+    scores = {}
+    problems = []
+    for (label, _, _), result in zip(inputs, results):
+        if isinstance(result, Exception):
+            # A video OpenCV cannot decode is Runway's call to make
+            logger.warning("Face preflight skipped for %s video: %s", label.lower(), result)
+            continue
+        if result is None:
+            continue
+        scores[label.lower()] = result
+        problem = face_preflight.check(label, result)
+        if problem:
+            problems.append(problem)
+    return scores, problems
+
+async def finish_job(job_id: str, timings: Dict[str, float], changes: dict, created_at: Optional[str] = None):
+    """Settle a processing job, recording its stage timings and total time"""
+    completed_at = datetime.now()
+    timings = dict(timings)
+    if created_at:
+        timings["total"] = round((completed_at - datetime.fromisoformat(created_at)).total_seconds(), 3)
+    
+    job_data = await update_job(job_id, {
+        **changes,
+        "timings": timings,
+        "completed_at": completed_at.isoformat()
+    }, expected_status="processing")
+    if job_data is not None:
+        JOBS_TOTAL.inc(status=changes["status"])
+        if "total" in timings:
+            JOB_SECONDS.observe(timings["total"], status=changes["status"])
+
+async def process_video(job_id: str, character_path: str, reference_path: str, resume: bool = False):
+    """
+    Process video with Runway Act Two API
+    The stages run as a dependency graph: each input is normalized and
+    hosted on its own, once the face preflight has passed both, and the
+    Runway task is submitted when both are hosted. The downloaded output
+    is packaged for playback (faststart, poster, HLS) before the job
+    completes. The critical path through the graph is recorded on the
+    job. With resume, a job that was already processing before a restart
+    picks up from its submitted Runway task instead of starting over.
+    """
+    timings: Dict[str, float] = {}
+    created_at = None
+    
+    async def stage_started(stage: str):
+        await update_job(job_id, {"stage": stage, "timings": merged_timings()})
+    
+    graph = StageGraph(on_start=stage_started)
+    # Held from submission until the task settles
+    runway_slot = AsyncExitStack()
+    output_filename = f"{job_id}_output.mp4"
+    
+    def merged_timings() -> Dict[str, float]:
+        merged = dict(timings)
+        for stage, seconds in graph.timings().items():
+            merged[stage] = round(timings.get(stage, 0.0) + seconds, 3)
+        return merged
+    
+    async def settle(changes: dict):
+        summary = graph.summary()
+        settled = merged_timings()
+        if summary["critical_path"]:
+            settled.update(critical_path=summary["critical_path_seconds"], serial=summary["serial_seconds"])
+            changes = {**changes, "critical_path": summary["critical_path"]}
+        await finish_job(job_id, settled, changes, created_at)
+    
+    def report_progress(progress: float):
+        event_bus.publish(job_id, {"event": "progress", "data": {"stage": "rendering", "progress": progress}})
+    
+    normalized = {}
+    
+    async def normalize(label: str, path: str) -> str:
+        path, info = await normalize_input(job_data, label, path)
+        if info:
+            normalized[label] = info
+        await update_job(job_id, {"normalized": dict(normalized)})
+        return path
+    
+    async def host(path: str, *_) -> str:
+        try:
+            return await host_input(path)
+        except Exception as e:
+            raise StageError(f"Processing failed: {e}")
+    
+    async def preflight(character: str, reference: str):
+        # Fail fast on inputs Runway would reject with NO_FACE_FOUND
+        scores, problems = await run_face_preflight(job_data, character, reference)
+        await update_job(job_id, {"preflight": scores})
+        if problems:
+            raise StageError(
+                "No usable face detected before submitting to Runway.\n\n" + "\n".join(f"• {p}" for p in problems)
+            )
+    
+    async def submit(character_url: str, reference_url: str, *_) -> str:
+        await runway_slot.enter_async_context(scheduler.stage("runway"))
+        try:
+            task_id = await runway_client.create_task(character_url, reference_url, **job_data["act_two"])
+        except Exception as e:
+            raise StageError(f"Processing failed: {e}")
+        # Persisted as soon as it exists so a restart never orphans the task
+        await update_job(job_id, {"runway_task_id": task_id})
+        return task_id
+    
+    async def render(task_id: str) -> str:
+        if resume:
+            await runway_slot.enter_async_context(scheduler.stage("runway"))
+        async with runway_slot:
+            result = await runway_client.wait_for_task(
+                task_id, character_path, reference_path, on_progress=report_progress
+            )
+        if not result["success"]:
+            raise StageError(result["error"])
+        return result["video_url"]
+    
+    async def download(video_url: str) -> int:
+        output_path = Path(settings.JOBS_DIRECTORY) / output_filename
+        async with scheduler.stage("download"):
+            return await runway_client.download_video(video_url, str(output_path))
+    
+    async def package(_: int) -> dict:
+        # Faststart, poster and HLS so the result starts playing right away
+        return await packager.package(job_id, output_filename)
+    
+    try:
+        if resume:
+            job_data = await job_store.get(job_id)
+            if job_data is None or job_data["status"] != "processing":
+                return
+            timings = dict(job_data.get("timings") or {})
+        else:
+            started_at = datetime.now()
+            job_data = await update_job(job_id, {
+                "status": "processing",
+                "started_at": started_at.isoformat()
+            }, expected_status="queued")
+            if job_data is None:
+                return
+            timings = dict(job_data.get("timings") or {})
+            queued = (started_at - datetime.fromisoformat(job_data["created_at"])).total_seconds()
+            timings["queue"] = round(queued, 3)
+            STAGE_SECONDS.observe(queued, stage="queue")
+        created_at = job_data["created_at"]
         
-        if result["success"]:
-            # Save output file
-            output_filename = f"{job_id}_output.mp4"
-            output_path = Path(settings.JOBS_DIRECTORY) / output_filename
+        task_id = job_data.get("runway_task_id")
+        if task_id:
+            # Wait on (or re-fetch the output of) the task submitted before the restart
+            graph.add("rendering", partial(render, task_id))
+        else:
+            paths = {"character": character_path, "reference": reference_path}
+            if normalizer.enabled:
+                # Ship Runway (and the temp hosts) no more pixels than the output needs
+                for label, path in paths.items():
+                    graph.add(f"normalizing:{label}", partial(normalize, label, path))
+            inputs = [f"normalizing:{label}" for label in paths] if normalizer.enabled else []
             
-            # Download result from Runway
-            await runway_client.download_video(result["video_url"], str(output_path))
+            checks = []
+            if face_preflight.enabled:
+                if inputs:
+                    graph.add("preflight", preflight, after=inputs)
+                else:
+                    graph.add("preflight", partial(preflight, character_path, reference_path))
+                # Inputs the preflight rejects never leave this machine
+                checks.append("preflight")
             
-            # Update job status
-            job_data.update({
-                "status": "completed",
-                "output_file": output_filename,
-                "completed_at": datetime.now().isoformat()
-            })
-        else:
-            job_data.update({
-                "status": "failed",
-                "error": result["error"],
-                "completed_at": datetime.now().isoformat()
-            })
+            for label, path in paths.items():
+                if normalizer.enabled:
+                    graph.add(f"hosting:{label}", host, after=[f"normalizing:{label}", *checks])
+                else:
+                    graph.add(f"hosting:{label}", partial(host, path), after=checks)
+            graph.add("submitting", submit, after=["hosting:character", "hosting:reference"])
+            graph.add("rendering", render, after=["submitting"])
+        graph.add("downloading", download, after=["rendering"])
+        if packager.enabled:
+            graph.add("packaging", package, after=["downloading"])
+        
+        results = await graph.run()
+        completed = {
+            "status": "completed",
+            "output_file": output_filename,
+            "output_size": results["downloading"]
+        }
+        if "packaging" in results:
+            # The faststart remux moves the index, which changes the size slightly
+            output_size = (Path(settings.JOBS_DIRECTORY) / output_filename).stat().st_size
+            completed.update(artifacts=results["packaging"], output_size=output_size)
+        await settle(completed)
+        await result_cache.put(job_data["cache_key"], output_filename, job_id)
     
+    except StageError as e:
+        await settle({"status": "failed", "error": str(e)})
     except Exception as e:
-        job_data.update({
-            "status": "failed",
-            "error": str(e),
-            "completed_at": datetime.now().isoformat()
-        })
+        logger.exception("Job failed: %s", e, extra={"job_id": job_id})
+        await settle({"status": "failed", "error": str(e)})
+    finally:
+        await runway_slot.aclose()
+
+async def process_delivery(job_id: str, character_path: str, reference_path: str, deliveries: int = 1):
+    """
+    Worker entry point for jobs taken from the shared queue.
+    A job delivered again after its worker went away is still marked
+    processing: it resumes from its Runway task if it got that far, and
+    otherwise starts over, until it has been delivered too many times.
+    """
+    job_data = await job_store.get(job_id)
+    if job_data is None or job_data["status"] not in ("queued", "processing"):
+        return
+    
+    if job_data["status"] == "processing":
+        if deliveries > settings.JOB_MAX_DELIVERIES:
+            await update_job(job_id, {
+                "status": "failed",
+                "error": f"Job was interrupted {deliveries - 1} times, giving up",
+                "completed_at": datetime.now().isoformat()
+            }, expected_status="processing")
+            JOBS_TOTAL.inc(status="failed")
+            return
+        if job_data.get("runway_task_id"):
+            await process_video(job_id, character_path, reference_path, True)
+            return
+        await update_job(job_id, {"status": "queued", "stage": None}, expected_status="processing")
     
-    # Save updated job data
-    with open(job_file, "w") as f:
-        json.dump(job_data, f)
+    await process_video(job_id, character_path, reference_path)
 
 if __name__ == "__main__":
     uvicorn.run(
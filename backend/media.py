@@ -0,0 +1,239 @@
+import asyncio
+import mimetypes
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Receive, Scope, Send
+
+from config import settings
+from metrics import BYTES_TOTAL
+
+# ftyp major brands that mean QuickTime rather than plain MP4
+QUICKTIME_BRANDS = (b"qt  ",)
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def is_media_name(filename: str) -> bool:
+    """
+    Whether a file in uploads/ or jobs/ may be served: finished media and
+    playback artifacts only, never partial files, upload session files or
+    legacy job records
+    """
+    return (
+        bool(filename)
+        and filename == Path(filename).name
+        and not filename.startswith(".")
+        and ".part" not in filename
+        and not filename.endswith((".json", ".migrated", ".tmp"))
+    )
+
+
+class MediaFiles(StaticFiles):
+    """StaticFiles that only serves names passing is_media_name"""
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if not is_media_name(path):
+            raise HTTPException(status_code=404)
+        return await super().get_response(path, scope)
+
+
+@lru_cache(maxsize=1024)
+def _sniff_media_type(path: str, mtime_ns: int) -> str:
+    with open(path, "rb") as f:
+        header = f.read(64)
+
+    if header[4:8] == b"ftyp":
+        brand = header[8:12]
+        return "video/quicktime" if brand in QUICKTIME_BRANDS else "video/mp4"
+    if header[4:8] in (b"moov", b"mdat", b"free", b"wide"):
+        return "video/quicktime"
+    if header.startswith(b"\x1a\x45\xdf\xa3"):
+        return "video/webm" if b"webm" in header else "video/x-matroska"
+    if header.startswith(b"RIFF") and header[8:12] == b"AVI ":
+        return "video/x-msvideo"
+    if header.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if header.startswith(b"#EXTM3U"):
+        return "application/vnd.apple.mpegurl"
+    if header.startswith(b"\x47") and path.endswith(".ts"):
+        # MPEG-TS sync byte; mimetypes maps .ts to Qt translations
+        return "video/mp2t"
+
+    guessed, _ = mimetypes.guess_type(path)
+    return guessed or "application/octet-stream"
+
+
+def detect_media_type(path: Path, stat: os.stat_result) -> str:
+    """Media type from the file's leading bytes, falling back to its extension"""
+    return _sniff_media_type(str(path), stat.st_mtime_ns)
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single byte range into inclusive (start, end).
+    Multi-range requests are answered with the whole file (None).
+    """
+    unit, _, ranges = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+
+    start_text, _, end_text = ranges.strip().partition("-")
+    try:
+        if start_text:
+            start = int(start_text)
+            end = int(end_text) if end_text else size - 1
+        else:
+            # Suffix range: last N bytes
+            length = int(end_text)
+            if length == 0:
+                raise RangeNotSatisfiable()
+            start = max(size - length, 0)
+            end = size - 1
+    except ValueError:
+        return None
+
+    if start >= size or start > end:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    # Weak comparison, as required for If-None-Match
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return etag in candidates
+
+
+def _not_modified_since(header: str, mtime: float) -> bool:
+    try:
+        since = parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(mtime) <= since
+
+
+class MediaFileResponse(Response):
+    """
+    Sends all or part of a file. Uses the ASGI zero-copy (sendfile) extension
+    when the server offers it, otherwise positional reads in a worker thread.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        start: int,
+        end: int,
+        status_code: int,
+        media_type: str,
+        headers: Dict[str, str],
+        send_body: bool = True,
+    ):
+        super().__init__(status_code=status_code, media_type=media_type, headers=headers)
+        self.path = path
+        self.start = start
+        self.length = end - start + 1
+        self.send_body = send_body
+        self.headers["content-length"] = str(self.length)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        if not self.send_body or self.length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        file = await asyncio.to_thread(open, self.path, "rb")
+        try:
+            if "http.response.zerocopy" in scope.get("extensions", {}):
+                await send({
+                    "type": "http.response.zerocopy",
+                    "file": file,
+                    "offset": self.start,
+                    "count": self.length,
+                })
+                BYTES_TOTAL.inc(self.length, direction="served")
+                return
+
+            offset = self.start
+            remaining = self.length
+            while remaining > 0:
+                chunk = await asyncio.to_thread(
+                    os.pread, file.fileno(), min(settings.MEDIA_CHUNK_SIZE, remaining), offset
+                )
+                if not chunk:
+                    break
+                offset += len(chunk)
+                remaining -= len(chunk)
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": remaining > 0,
+                })
+            if remaining > 0:
+                # File shrank underneath us; end the response cleanly
+                await send({"type": "http.response.body", "body": b""})
+            BYTES_TOTAL.inc(self.length - remaining, direction="served")
+        finally:
+            file.close()
+
+
+def media_response(request: Request, path: Path, headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Serve a media file with byte ranges (206), conditional GET (304),
+    validators and a media type sniffed from the file contents.
+    """
+    stat = path.stat()
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    response_headers = {
+        "etag": etag,
+        "last-modified": formatdate(stat.st_mtime, usegmt=True),
+        "accept-ranges": "bytes",
+        "cache-control": f"public, max-age={settings.MEDIA_MAX_AGE}",
+        **(headers or {}),
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if (if_none_match and _etag_matches(if_none_match, etag)) or (
+        not if_none_match and if_modified_since and _not_modified_since(if_modified_since, stat.st_mtime)
+    ):
+        return Response(status_code=304, headers=response_headers)
+
+    media_type = detect_media_type(path, stat)
+    size = stat.st_size
+    send_body = request.method != "HEAD"
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and if_range and if_range.strip() not in (etag, response_headers["last-modified"]):
+        # Representation changed since the client's partial copy: send it all
+        range_header = None
+
+    byte_range = None
+    if range_header and size > 0:
+        try:
+            byte_range = _parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            response_headers["content-range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=response_headers)
+
+    if byte_range is None:
+        return MediaFileResponse(path, 0, size - 1, 200, media_type, response_headers, send_body)
+
+    start, end = byte_range
+    response_headers["content-range"] = f"bytes {start}-{end}/{size}"
+    return MediaFileResponse(path, start, end, 206, media_type, response_headers, send_body)
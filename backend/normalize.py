@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Codecs Runway takes as-is; anything else is re-encoded
+PASSTHROUGH_CODECS = ("avc1", "avc3")
+
+
+class NormalizeError(Exception):
+    """Raised when ffmpeg could not produce a normalized copy."""
+
+
+def target_box(ratio: str) -> Tuple[int, int]:
+    """(long side, short side) an Act Two ratio such as '1280:720' needs"""
+    width, height = (int(side) for side in ratio.split(":"))
+    return max(width, height), min(width, height)
+
+
+class VideoNormalizer:
+    """
+    Transcodes oversized or awkward inputs to H.264 that fits the requested
+    Act Two box (in the source's own orientation), with faststart and a
+    duration cap, before they are hosted. Outputs are cached next to the
+    uploads as `<sha256>_<long>x<short>.mp4`, so each source is transcoded at
+    most once per box and concurrent requests for the same output share one
+    ffmpeg run. ffmpeg runs are bounded by `workers`. Disabled when ffmpeg is
+    not installed.
+    """
+
+    def __init__(
+        self,
+        ffmpeg_path: str = settings.FFMPEG_PATH,
+        workers: int = settings.NORMALIZE_WORKERS,
+        max_duration: float = settings.NORMALIZE_MAX_DURATION,
+        crf: int = settings.NORMALIZE_CRF,
+        directory: str = settings.UPLOAD_DIRECTORY,
+    ):
+        self.ffmpeg = shutil.which(ffmpeg_path) if settings.NORMALIZE_ENABLED else None
+        self.workers = workers
+        self.max_duration = max_duration
+        self.crf = crf
+        self.directory = Path(directory)
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ffmpeg is not None
+
+    def start(self) -> None:
+        self._slots = asyncio.Semaphore(self.workers)
+        if settings.NORMALIZE_ENABLED and not self.enabled:
+            logger.warning("ffmpeg not found; inputs will be hosted without normalization")
+
+    def needs_normalizing(self, probe: Optional[Dict[str, Any]], ratio: str) -> bool:
+        """Whether the source is bigger or heavier than Act Two needs"""
+        if probe is None:
+            # Not MP4/MOV (e.g. WebM): always worth turning into H.264
+            return True
+        long_side, short_side = target_box(ratio)
+        return (
+            probe["codec"] not in PASSTHROUGH_CODECS
+            or max(probe["width"], probe["height"]) > long_side
+            or min(probe["width"], probe["height"]) > short_side
+            or probe["duration"] > self.max_duration
+        )
+
+    def output_path(self, sha256: str, ratio: str) -> Path:
+        long_side, short_side = target_box(ratio)
+        return self.directory / f"{sha256}_{long_side}x{short_side}.mp4"
+
+    async def normalize(self, source_path: str, sha256: str, ratio: str) -> Path:
+        """Return the normalized copy of a source, transcoding it if not cached"""
+        output = self.output_path(sha256, ratio)
+        if output.exists():
+            return output
+
+        key = output.name
+        if key not in self._inflight:
+            self._inflight[key] = asyncio.ensure_future(
+                self._transcode(source_path, output, target_box(ratio))
+            )
+            self._inflight[key].add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(self._inflight[key])
+
+    async def _transcode(self, source_path: str, output: Path, box: Tuple[int, int]) -> Path:
+        long_side, short_side = box
+        partial = output.with_suffix(".part.mp4")
+        args = [
+            self.ffmpeg, "-nostdin", "-y", "-v", "error",
+            "-i", source_path,
+            "-t", f"{self.max_duration:g}",
+            "-map", "0:v:0", "-map", "0:a:0?",
+            # Fit inside the box in the source's orientation, never upscaling,
+            # with even dimensions for yuv420p
+            "-vf", (
+                f"scale=w='if(gte(iw,ih),min({long_side},iw),min({short_side},iw))'"
+                f":h='if(gte(iw,ih),min({short_side},ih),min({long_side},ih))'"
+                ":force_original_aspect_ratio=decrease:force_divisible_by=2"
+            ),
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", str(self.crf), "-pix_fmt", "yuv420p",
+            "-c:a", "aac", "-b:a", "128k",
+            "-movflags", "+faststart",
+            str(partial),
+        ]
+
+        async with self._slots:
+            process = await asyncio.create_subprocess_exec(
+                *args, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                _, stderr = await process.communicate()
+            except asyncio.CancelledError:
+                process.kill()
+                await process.wait()
+                partial.unlink(missing_ok=True)
+                raise
+
+        if process.returncode != 0:
+            partial.unlink(missing_ok=True)
+            message = stderr.decode(errors="replace").strip().splitlines()
+            raise NormalizeError(f"ffmpeg exited with {process.returncode}: {message[-1] if message else ''}")
+
+        os.replace(partial, output)
+        return output
+
+
+normalizer = VideoNormalizer()
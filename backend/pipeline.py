@@ -0,0 +1,115 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from metrics import STAGE_SECONDS
+
+
+class StageError(Exception):
+    """Raised by a stage to fail its job with a message meant for the user."""
+
+
+@dataclass
+class _Node:
+    name: str
+    run: Callable[..., Awaitable[Any]]
+    after: Tuple[str, ...]
+    started: Optional[float] = None
+    ended: Optional[float] = None
+
+    @property
+    def stage(self) -> str:
+        # "hosting:character" is reported as part of the "hosting" stage
+        return self.name.split(":", 1)[0]
+
+
+class StageGraph:
+    """
+    One job's pipeline as a small dependency graph. Every node starts as
+    soon as the nodes it runs after have finished, with their results as
+    arguments, so independent work (such as hosting both inputs) overlaps.
+    The first node to fail cancels the rest and its error is raised.
+    From when each node ran, the graph reports per-stage wall time and the
+    critical path: the chain of nodes that decided when the job finished.
+    """
+
+    def __init__(self, on_start: Optional[Callable[[str], Awaitable[None]]] = None):
+        self.on_start = on_start
+        self._nodes: Dict[str, _Node] = {}
+        self._started = 0.0
+
+    def add(self, name: str, run: Callable[..., Awaitable[Any]], after: Sequence[str] = ()) -> None:
+        for dependency in after:
+            if dependency not in self._nodes:
+                raise ValueError(f"Stage {name} runs after unknown stage {dependency}")
+        self._nodes[name] = _Node(name, run, tuple(after))
+
+    async def run(self) -> Dict[str, Any]:
+        """Run every node; returns each node's result by name"""
+        self._started = time.monotonic()
+        futures: Dict[str, asyncio.Task] = {}
+
+        async def run_node(node: _Node) -> Any:
+            args = [await futures[dependency] for dependency in node.after]
+            node.started = time.monotonic()
+            if self.on_start:
+                await self.on_start(node.stage)
+            try:
+                return await node.run(*args)
+            finally:
+                node.ended = time.monotonic()
+                STAGE_SECONDS.observe(node.ended - node.started, stage=node.stage)
+
+        # Nodes are added after their dependencies, so this order is topological
+        for node in self._nodes.values():
+            futures[node.name] = asyncio.ensure_future(run_node(node))
+        try:
+            await asyncio.gather(*futures.values())
+        finally:
+            pending = [future for future in futures.values() if not future.done()]
+            for future in pending:
+                future.cancel()
+            # Dependents re-raise their dependency's error; collect every copy
+            await asyncio.gather(*futures.values(), return_exceptions=True)
+        return {name: future.result() for name, future in futures.items()}
+
+    def _ran(self) -> List[_Node]:
+        return [node for node in self._nodes.values() if node.started is not None and node.ended is not None]
+
+    def timings(self) -> Dict[str, float]:
+        """Wall time per stage; overlapping nodes of one stage count once"""
+        spans: Dict[str, Tuple[float, float]] = {}
+        for node in self._ran():
+            start, end = spans.get(node.stage, (node.started, node.ended))
+            spans[node.stage] = (min(start, node.started), max(end, node.ended))
+        return {stage: round(end - start, 3) for stage, (start, end) in spans.items()}
+
+    def critical_path(self) -> List[str]:
+        """Nodes from the last one to finish back through the dependency each one waited on longest"""
+        ran = {node.name: node for node in self._ran()}
+        if not ran:
+            return []
+        node = max(ran.values(), key=lambda n: n.ended)
+        path = [node.name]
+        while True:
+            waited_on = [ran[name] for name in node.after if name in ran]
+            if not waited_on:
+                break
+            node = max(waited_on, key=lambda n: n.ended)
+            path.append(node.name)
+        path.reverse()
+        return path
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Critical path with its length, next to the time the same nodes
+        would have taken one after another
+        """
+        ran = self._ran()
+        path = self.critical_path()
+        return {
+            "critical_path": path,
+            "critical_path_seconds": round(max((n.ended for n in ran), default=self._started) - self._started, 3),
+            "serial_seconds": round(sum(n.ended - n.started for n in ran), 3),
+        }
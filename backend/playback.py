@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import settings
+from probe import ProbeError, VideoProbe, probe_mp4
+
+logger = logging.getLogger(__name__)
+
+
+class PackagingError(Exception):
+    """Raised when ffmpeg could not produce a playback artifact."""
+
+
+class PlaybackPackager:
+    """
+    Makes a finished output quick to start playing: remuxes it with the
+    moov atom up front (faststart, no re-encode), grabs a poster JPEG and,
+    if enabled, cuts short HLS segments from the same streams. Artifacts
+    sit next to the output as `<job_id>_poster.jpg`, `<job_id>_hls.m3u8`
+    and `<job_id>_hls_<n>.ts`, so the storage GC keeps and expires them
+    with their job. Outputs are packaged `workers` at a time. Disabled
+    when ffmpeg is not installed.
+    """
+
+    def __init__(
+        self,
+        ffmpeg_path: str = settings.FFMPEG_PATH,
+        workers: int = settings.PLAYBACK_WORKERS,
+        poster_at: float = settings.PLAYBACK_POSTER_AT,
+        hls_enabled: bool = settings.PLAYBACK_HLS_ENABLED,
+        hls_segment_seconds: float = settings.PLAYBACK_HLS_SEGMENT_SECONDS,
+        directory: str = settings.JOBS_DIRECTORY,
+    ):
+        self.ffmpeg = shutil.which(ffmpeg_path) if settings.PLAYBACK_ENABLED else None
+        self.workers = workers
+        self.poster_at = poster_at
+        self.hls_enabled = hls_enabled
+        self.hls_segment_seconds = hls_segment_seconds
+        self.directory = Path(directory)
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.ffmpeg is not None
+
+    def start(self) -> None:
+        self._slots = asyncio.Semaphore(self.workers)
+        if settings.PLAYBACK_ENABLED and not self.enabled:
+            logger.warning("ffmpeg not found; outputs will be served as downloaded")
+
+    async def package(self, job_id: str, output_filename: str) -> Dict[str, Any]:
+        """
+        Build the playback artifacts of a job's output; returns what was
+        made, by kind. A step that fails is logged and left out rather
+        than failing the job, since the output itself is fine.
+        """
+        output = self.directory / output_filename
+        try:
+            probe = await asyncio.to_thread(self._probe, output)
+            duration, faststart = probe.duration, probe.faststart
+        except ProbeError:
+            duration, faststart = None, False
+
+        artifacts: Dict[str, Any] = {}
+        async with self._slots:
+            if not faststart:
+                try:
+                    await self._faststart(output)
+                    faststart = True
+                except PackagingError as e:
+                    logger.warning("Could not remux output for faststart: %s", e, extra={"job_id": job_id})
+            artifacts["faststart"] = faststart
+
+            poster = self.directory / f"{job_id}_poster.jpg"
+            try:
+                await self._poster(output, poster, duration)
+                artifacts["poster"] = poster.name
+            except PackagingError as e:
+                logger.warning("Could not extract a poster frame: %s", e, extra={"job_id": job_id})
+
+            if self.hls_enabled:
+                playlist = self.directory / f"{job_id}_hls.m3u8"
+                try:
+                    await self._hls(output, playlist)
+                    artifacts["hls"] = playlist.name
+                except PackagingError as e:
+                    logger.warning("Could not package HLS segments: %s", e, extra={"job_id": job_id})
+        return artifacts
+
+    @staticmethod
+    def _probe(output: Path) -> VideoProbe:
+        with open(output, "rb") as f:
+            return probe_mp4(f)
+
+    async def _faststart(self, output: Path) -> None:
+        partial = output.with_suffix(".part.mp4")
+        await self._run([
+            "-i", str(output),
+            "-map", "0", "-c", "copy",
+            "-movflags", "+faststart",
+            str(partial),
+        ], partial)
+        os.replace(partial, output)
+
+    async def _poster(self, output: Path, poster: Path, duration: Optional[float]) -> None:
+        # Clips shorter than twice poster_at use their middle frame
+        at = min(self.poster_at, duration / 2) if duration else 0.0
+        partial = poster.with_suffix(".part.jpg")
+        await self._run([
+            "-ss", f"{at:g}",
+            "-i", str(output),
+            "-frames:v", "1", "-q:v", "3",
+            str(partial),
+        ], partial)
+        if not partial.exists() or partial.stat().st_size == 0:
+            partial.unlink(missing_ok=True)
+            raise PackagingError("no frame decoded")
+        os.replace(partial, poster)
+
+    async def _hls(self, output: Path, playlist: Path) -> None:
+        # Segments are written under their final names; the playlist only
+        # appears once all of them are in place
+        partial = playlist.with_suffix(".part.m3u8")
+        segment_pattern = playlist.with_name(f"{playlist.stem}_%03d.ts")
+        try:
+            await self._run([
+                "-i", str(output),
+                "-map", "0:v:0", "-map", "0:a:0?", "-c", "copy",
+                "-f", "hls",
+                "-hls_time", f"{self.hls_segment_seconds:g}",
+                "-hls_playlist_type", "vod",
+                "-hls_segment_filename", str(segment_pattern),
+                str(partial),
+            ], partial)
+        except PackagingError:
+            for segment in self._segments(playlist):
+                segment.unlink(missing_ok=True)
+            raise
+        os.replace(partial, playlist)
+
+    def _segments(self, playlist: Path) -> List[Path]:
+        return sorted(self.directory.glob(f"{playlist.stem}_*.ts"))
+
+    async def _run(self, args: List[str], partial: Path) -> None:
+        process = await asyncio.create_subprocess_exec(
+            self.ffmpeg, "-nostdin", "-y", "-v", "error", *args,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
+        )
+        try:
+            _, stderr = await process.communicate()
+        except asyncio.CancelledError:
+            process.kill()
+            await process.wait()
+            partial.unlink(missing_ok=True)
+            raise
+
+        if process.returncode != 0:
+            partial.unlink(missing_ok=True)
+            message = stderr.decode(errors="replace").strip().splitlines()
+            raise PackagingError(f"ffmpeg exited with {process.returncode}: {message[-1] if message else ''}")
+
+
+packager = PlaybackPackager()
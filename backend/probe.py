@@ -0,0 +1,256 @@
+import os
+import struct
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+from config import settings
+
+# Top-level boxes an ISO base media (MP4/MOV) file can start with
+LEADING_BOXES = (b"ftyp", b"moov", b"mdat", b"free", b"skip", b"wide", b"pdin")
+# Boxes whose payload is just more boxes, on the way down to the track headers
+CONTAINER_BOXES = (b"moov", b"trak", b"mdia", b"minf", b"stbl")
+# Upper bound on the moov box we are willing to read into memory
+MAX_MOOV_BYTES = 32 * 1024 * 1024
+VIDEO_CODECS = ("avc1", "avc3", "hvc1", "hev1")
+
+
+class ProbeError(Exception):
+    """Raised when a file's MP4/MOV header cannot be read."""
+
+
+class UnsupportedContainerError(ProbeError):
+    """Raised for files that are not ISO base media (e.g. WebM)."""
+
+
+@dataclass
+class VideoProbe:
+    brand: Optional[str]
+    width: int
+    height: int
+    duration: float
+    codec: Optional[str]
+    frame_rate: Optional[float]
+    has_audio: bool
+    faststart: bool
+
+    def as_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class _Track:
+    handler: Optional[str] = None
+    width: float = 0.0
+    height: float = 0.0
+    rotated: bool = False
+    timescale: int = 0
+    duration: int = 0
+    codec: Optional[str] = None
+    sample_count: int = 0
+
+
+def _read_header(f: BinaryIO, offset: int, end: int) -> Optional[Tuple[bytes, int, int]]:
+    """Return (type, header_size, box_size) of the box at offset"""
+    if offset + 8 > end:
+        return None
+    f.seek(offset)
+    header = f.read(8)
+    if len(header) < 8:
+        return None
+    size, box_type = struct.unpack(">I4s", header)
+    header_size = 8
+    if size == 1:
+        large = f.read(8)
+        if len(large) < 8:
+            return None
+        size = struct.unpack(">Q", large)[0]
+        header_size = 16
+    elif size == 0:
+        size = end - offset
+    if size < header_size:
+        raise ProbeError(f"Corrupt box size at offset {offset}")
+    return box_type, header_size, size
+
+
+def _iter_boxes(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[bytes, bytes]]:
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, offset)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", data, offset + 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            return
+        yield box_type, data[offset + header_size: offset + size]
+        offset += size
+
+
+def _parse_tkhd(payload: bytes, track: _Track) -> None:
+    version = payload[0]
+    # version/flags, times, track id, reserved, duration, reserved, layer... then the matrix
+    matrix_offset = 4 + (32 if version == 1 else 20) + 8 + 8
+    a, b = struct.unpack_from(">ii", payload, matrix_offset)
+    track.rotated = a == 0 and b != 0
+    width, height = struct.unpack_from(">II", payload, len(payload) - 8)
+    track.width = width / 65536
+    track.height = height / 65536
+
+
+def _parse_mdhd(payload: bytes, track: _Track) -> None:
+    if payload[0] == 1:
+        track.timescale, track.duration = struct.unpack_from(">IQ", payload, 20)
+    else:
+        track.timescale, track.duration = struct.unpack_from(">II", payload, 12)
+
+
+def _parse_track(payload: bytes) -> _Track:
+    track = _Track()
+
+    def walk(data: bytes) -> None:
+        for box_type, body in _iter_boxes(data):
+            if box_type in CONTAINER_BOXES:
+                walk(body)
+            elif box_type == b"tkhd":
+                _parse_tkhd(body, track)
+            elif box_type == b"mdhd":
+                _parse_mdhd(body, track)
+            elif box_type == b"hdlr":
+                track.handler = body[8:12].decode("latin-1")
+            elif box_type == b"stsd" and len(body) >= 16:
+                track.codec = body[12:16].decode("latin-1").strip()
+            elif box_type == b"stts":
+                entry_count = struct.unpack_from(">I", body, 4)[0]
+                track.sample_count = sum(
+                    struct.unpack_from(">I", body, 8 + i * 8)[0] for i in range(entry_count)
+                )
+
+    walk(payload)
+    return track
+
+
+def probe_mp4(f: BinaryIO) -> VideoProbe:
+    """
+    Read resolution, duration, codec and frame rate from an MP4/MOV header.
+    Only box headers are read while walking the top level; mdat is skipped
+    with a seek and parsing stops as soon as moov has been read.
+    """
+    f.seek(0, os.SEEK_END)
+    end = f.tell()
+
+    first = _read_header(f, 0, end)
+    if first is None:
+        raise ProbeError("File is empty or truncated")
+    if first[0] not in LEADING_BOXES:
+        raise UnsupportedContainerError("Not an MP4/MOV file")
+
+    brand = None
+    moov = None
+    mdat_seen = False
+    offset = 0
+    while moov is None:
+        header = _read_header(f, offset, end)
+        if header is None:
+            break
+        box_type, header_size, size = header
+        if box_type == b"ftyp":
+            f.seek(offset + header_size)
+            brand = f.read(4).decode("latin-1").strip() or None
+        elif box_type == b"mdat":
+            mdat_seen = True
+        elif box_type == b"moov":
+            if size > MAX_MOOV_BYTES:
+                raise ProbeError("Video header is unreasonably large")
+            f.seek(offset + header_size)
+            moov = f.read(size - header_size)
+        offset += size
+
+    if moov is None:
+        raise ProbeError("No moov box found (file may be truncated)")
+
+    tracks = [_parse_track(body) for box_type, body in _iter_boxes(moov) if box_type == b"trak"]
+    video = next((t for t in tracks if t.handler == "vide"), None)
+    if video is None:
+        raise ProbeError("No video track found")
+
+    duration = video.duration / video.timescale if video.timescale else 0.0
+    frame_rate = video.sample_count / duration if duration and video.sample_count else None
+    width, height = (video.height, video.width) if video.rotated else (video.width, video.height)
+
+    return VideoProbe(
+        brand=brand,
+        width=int(round(width)),
+        height=int(round(height)),
+        duration=round(duration, 3),
+        codec=video.codec,
+        frame_rate=round(frame_rate, 3) if frame_rate else None,
+        has_audio=any(t.handler == "soun" for t in tracks),
+        faststart=not mdat_seen,
+    )
+
+
+_cache: "OrderedDict[str, Any]" = OrderedDict()
+
+
+def probe_cached(sha256: str, source: Union[str, BinaryIO]) -> VideoProbe:
+    """
+    probe_mp4 on a path or open file, with results (errors included) cached
+    by content hash so resubmitted files are not parsed again.
+    """
+    if sha256 in _cache:
+        _cache.move_to_end(sha256)
+        result = _cache[sha256]
+    else:
+        try:
+            if isinstance(source, str):
+                with open(source, "rb") as f:
+                    result = probe_mp4(f)
+            else:
+                result = probe_mp4(source)
+        except ProbeError as e:
+            result = e
+        except (struct.error, IndexError) as e:
+            result = ProbeError(f"Malformed video header: {e}")
+        _cache[sha256] = result
+        if len(_cache) > settings.PROBE_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    if isinstance(result, ProbeError):
+        raise result
+    return result
+
+
+def check_probe(label: str, probe: VideoProbe, trim_to: Optional[float] = None) -> Tuple[List[str], List[str]]:
+    """
+    Blocking issues and softer warnings for one probed video. With trim_to
+    (normalization on), a video that is too long only gets a warning,
+    since it will be cut to that many seconds before it is hosted.
+    """
+    issues: List[str] = []
+    warnings: List[str] = []
+    short_side = min(probe.width, probe.height)
+
+    if short_side < settings.PROBE_MIN_SHORT_SIDE:
+        issues.append(
+            f"{label} resolution {probe.width}x{probe.height} is too low "
+            f"(needs at least {settings.PROBE_MIN_SHORT_SIDE}p)"
+        )
+    elif short_side < 720:
+        warnings.append(f"{label} is below 720p; face detection often fails at {probe.width}x{probe.height}")
+
+    if probe.duration < settings.PROBE_MIN_DURATION:
+        issues.append(f"{label} is too short ({probe.duration:.1f}s, needs at least {settings.PROBE_MIN_DURATION:g}s)")
+    elif probe.duration > settings.PROBE_MAX_DURATION:
+        if trim_to is not None and trim_to <= settings.PROBE_MAX_DURATION:
+            warnings.append(f"{label} is {probe.duration:.1f}s long and will be trimmed to {trim_to:g}s")
+        else:
+            issues.append(f"{label} is too long ({probe.duration:.1f}s, max {settings.PROBE_MAX_DURATION:g}s)")
+
+    if probe.codec and probe.codec not in VIDEO_CODECS:
+        warnings.append(f"{label} uses codec {probe.codec}; H.264 works best")
+
+    return issues, warnings
@@ -0,0 +1,341 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import settings
+from events import JobEventBus
+from scheduler import JobScheduler, QueueFullError
+
+try:
+    import redis
+    import redis.asyncio as aioredis
+except ImportError:  # only needed for the distributed queue
+    redis = None
+
+# Relayed events waiting to be published; the oldest are dropped beyond this
+RELAY_BACKLOG = 1000
+
+logger = logging.getLogger(__name__)
+
+# Move the oldest pending job into the in-flight set with its visibility deadline
+_CLAIM = """
+local job_id = redis.call('RPOP', KEYS[1])
+if not job_id then
+    return nil
+end
+redis.call('ZADD', KEYS[2], ARGV[1], job_id)
+local deliveries = redis.call('HINCRBY', KEYS[3], job_id, 1)
+return {job_id, deliveries}
+"""
+
+# Hand in-flight jobs whose deadline has passed back out, ahead of the queue
+_REQUEUE_EXPIRED = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, job_id in ipairs(expired) do
+    redis.call('ZREM', KEYS[2], job_id)
+    redis.call('RPUSH', KEYS[1], job_id)
+end
+return expired
+"""
+
+
+class RedisJobScheduler(JobScheduler):
+    """
+    JobScheduler whose queue lives in Redis, so API nodes enqueue and any
+    number of worker nodes consume.
+    A claimed job moves to an in-flight set with a visibility deadline its
+    worker keeps extending, and is acknowledged once the handler returns.
+    If the worker dies the deadline lapses and the job goes back to the
+    head of the queue. The handler gets the delivery count as its last
+    argument. Stage limits still apply per node. Every Redis call is made
+    with the asyncio client; stats() reports queue counts refreshed in the
+    background, since it is read from synchronous gauges.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        max_queue: int,
+        workers: int,
+        stage_limits: Dict[str, int],
+        default_retry_after: int,
+        visibility_timeout: float = settings.JOB_VISIBILITY_TIMEOUT,
+        poll_interval: float = 0.5,
+        prefix: str = "sports_editor:queue",
+    ):
+        if redis is None:
+            raise RuntimeError("The redis package is required for JOB_QUEUE_URL")
+        super().__init__(max_queue, workers, stage_limits, default_retry_after)
+        self.url = url
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.keys = {name: f"{prefix}:{name}" for name in ("pending", "inflight", "deliveries", "args")}
+        self._async: Optional["aioredis.Redis"] = None
+        self._counts = {"queued": 0, "in_flight": 0}
+
+    async def start(self, handler: Callable[..., Awaitable[Any]]) -> None:
+        self._handler = handler
+        self._stages = {name: asyncio.Semaphore(limit) for name, limit in self.stage_limits.items()}
+        self._async = aioredis.Redis.from_url(self.url, decode_responses=True)
+        self._worker_tasks.append(asyncio.create_task(self._count()))
+        if not self.workers:
+            return
+        self._claim = self._async.register_script(_CLAIM)
+        self._requeue_expired = self._async.register_script(_REQUEUE_EXPIRED)
+        # Loaded up front so the workers do not all start with a NOSCRIPT round-trip
+        for script in (_CLAIM, _REQUEUE_EXPIRED):
+            await self._async.script_load(script)
+        for _ in range(self.workers):
+            self._worker_tasks.append(asyncio.create_task(self._worker()))
+        self._worker_tasks.append(asyncio.create_task(self._reaper()))
+
+    async def stop(self, drain_timeout: float = 30.0) -> None:
+        await super().stop(drain_timeout)
+        if self._async is not None:
+            await self._async.aclose()
+            self._async = None
+
+    async def _queued(self) -> int:
+        return await self._async.llen(self.keys["pending"])
+
+    async def is_full(self) -> bool:
+        return await self._queued() >= self.max_queue
+
+    async def free_slots(self) -> int:
+        return max(0, self.max_queue - await self._queued())
+
+    async def submit(self, job_id: str, *args: Any, force: bool = False) -> int:
+        if not force and await self.is_full():
+            raise QueueFullError(self.retry_after())
+        async with self._async.pipeline() as pipe:
+            pipe.hset(self.keys["args"], job_id, json.dumps(args))
+            pipe.lpush(self.keys["pending"], job_id)
+            _, length = await pipe.execute()
+        return length
+
+    async def position(self, job_id: str) -> Optional[int]:
+        # Jobs are pushed on the left and claimed from the right
+        async with self._async.pipeline(transaction=False) as pipe:
+            pipe.lpos(self.keys["pending"], job_id)
+            pipe.llen(self.keys["pending"])
+            index, queued = await pipe.execute()
+        if index is None:
+            return None
+        return queued - index
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), **self._counts, "distributed": True}
+
+    async def _count(self) -> None:
+        while True:
+            try:
+                async with self._async.pipeline(transaction=False) as pipe:
+                    pipe.llen(self.keys["pending"])
+                    pipe.zcard(self.keys["inflight"])
+                    queued, in_flight = await pipe.execute()
+                self._counts = {"queued": queued, "in_flight": in_flight}
+            except redis.RedisError as e:
+                logger.warning("Could not read queue counts: %s", e)
+            await asyncio.sleep(1.0)
+
+    async def _worker(self) -> None:
+        while True:
+            try:
+                claimed = await self._claim(
+                    keys=[self.keys["pending"], self.keys["inflight"], self.keys["deliveries"]],
+                    args=[time.time() + self.visibility_timeout],
+                )
+            except redis.RedisError as e:
+                logger.warning("Could not claim a job: %s", e)
+                claimed = None
+            if not claimed:
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            job_id, deliveries = claimed[0], int(claimed[1])
+            # A job left claimed by a failed Redis call goes back to the
+            # queue once its visibility timeout lapses
+            try:
+                args = await self._async.hget(self.keys["args"], job_id)
+                if args is None:
+                    await self._ack(job_id)
+                    continue
+            except redis.RedisError as e:
+                logger.warning("Could not read a claimed job: %s", e, extra={"job_id": job_id})
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            self._running.add(job_id)
+            heartbeat = asyncio.create_task(self._heartbeat(job_id))
+            started = time.monotonic()
+            try:
+                await self._handler(job_id, *json.loads(args), deliveries)
+            except asyncio.CancelledError:
+                # Shutting down: give the job straight to another worker
+                try:
+                    await self._nack(job_id)
+                except redis.RedisError as e:
+                    logger.warning("Could not hand back a job: %s", e, extra={"job_id": job_id})
+                raise
+            except Exception as e:
+                logger.exception("Job crashed in worker: %s", e, extra={"job_id": job_id})
+            finally:
+                heartbeat.cancel()
+                self._running.discard(job_id)
+                self._record_duration(time.monotonic() - started)
+            try:
+                await self._ack(job_id)
+            except redis.RedisError as e:
+                logger.warning("Could not acknowledge a job: %s", e, extra={"job_id": job_id})
+                await asyncio.sleep(self.poll_interval)
+
+    async def _heartbeat(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            try:
+                await self._async.zadd(
+                    self.keys["inflight"], {job_id: time.time() + self.visibility_timeout}, xx=True
+                )
+            except redis.RedisError as e:
+                logger.warning("Could not extend job visibility: %s", e, extra={"job_id": job_id})
+
+    async def _reaper(self) -> None:
+        while True:
+            try:
+                expired = await self._requeue_expired(
+                    keys=[self.keys["pending"], self.keys["inflight"]], args=[time.time()]
+                )
+                if expired:
+                    logger.warning("Requeued %d jobs whose worker stopped responding", len(expired))
+            except redis.RedisError as e:
+                logger.warning("Could not requeue expired jobs: %s", e)
+            await asyncio.sleep(max(1.0, self.visibility_timeout / 4))
+
+    async def _ack(self, job_id: str) -> None:
+        async with self._async.pipeline() as pipe:
+            pipe.zrem(self.keys["inflight"], job_id)
+            pipe.hdel(self.keys["args"], job_id)
+            pipe.hdel(self.keys["deliveries"], job_id)
+            await pipe.execute()
+
+    async def _nack(self, job_id: str) -> None:
+        if await self._async.zrem(self.keys["inflight"], job_id):
+            await self._async.rpush(self.keys["pending"], job_id)
+
+
+class RedisEventRelay:
+    """
+    Carries job events between nodes over Redis pub/sub, so a client
+    following a job on one API node sees the updates of the worker running
+    it. Events a node published itself are not delivered back to it.
+    publish() only queues the event; a background task sends it, so job
+    updates never wait on Redis.
+    """
+
+    def __init__(self, url: str, bus: JobEventBus, channel: str = "sports_editor:events"):
+        if redis is None:
+            raise RuntimeError("The redis package is required for JOB_QUEUE_URL")
+        self.url = url
+        self.bus = bus
+        self.channel = channel
+        self.node_id = uuid.uuid4().hex
+        self._outbox: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def publish(self, job_id: str, event: Dict[str, Any]) -> None:
+        if self._outbox is None:
+            return
+        if self._outbox.full():
+            self._outbox.get_nowait()
+        self._outbox.put_nowait(json.dumps({"node": self.node_id, "job_id": job_id, "event": event}))
+
+    async def start(self) -> None:
+        self._outbox = asyncio.Queue(maxsize=RELAY_BACKLOG)
+        self._tasks = [asyncio.create_task(self._send()), asyncio.create_task(self._listen())]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._outbox = None
+
+    async def _send(self) -> None:
+        client = aioredis.Redis.from_url(self.url, decode_responses=True)
+        try:
+            while True:
+                message = await self._outbox.get()
+                try:
+                    await client.publish(self.channel, message)
+                except redis.RedisError as e:
+                    logger.warning("Could not relay job event: %s", e)
+        finally:
+            await client.aclose()
+
+    async def _listen(self) -> None:
+        while True:
+            client = aioredis.Redis.from_url(self.url, decode_responses=True)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    async for message in pubsub.listen():
+                        if message["type"] != "message":
+                            continue
+                        payload = json.loads(message["data"])
+                        if payload["node"] != self.node_id:
+                            self.bus.deliver(payload["job_id"], payload["event"])
+            except redis.RedisError as e:
+                logger.warning("Job event relay disconnected: %s", e)
+                await asyncio.sleep(1)
+            finally:
+                await client.aclose()
+
+
+class RedisUrlCache:
+    """
+    Hosted input URLs shared between nodes, so an input an API node starts
+    hosting as it lands is reused by whichever worker runs the job. Each
+    URL expires with its hosting TTL. Redis errors count as misses.
+    """
+
+    def __init__(self, url: str, prefix: str = "sports_editor:hosted"):
+        if redis is None:
+            raise RuntimeError("The redis package is required for JOB_QUEUE_URL")
+        self.url = url
+        self.prefix = prefix
+        self._async: Optional["aioredis.Redis"] = None
+
+    async def start(self) -> None:
+        self._async = aioredis.Redis.from_url(self.url, decode_responses=True)
+
+    async def stop(self) -> None:
+        if self._async is not None:
+            await self._async.aclose()
+            self._async = None
+
+    async def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """The URL hosted for a file and its seconds left, if any"""
+        if self._async is None:
+            return None
+        try:
+            async with self._async.pipeline(transaction=False) as pipe:
+                pipe.get(f"{self.prefix}:{key}")
+                pipe.pttl(f"{self.prefix}:{key}")
+                url, ttl = await pipe.execute()
+        except redis.RedisError as e:
+            logger.warning("Could not look up a shared hosted URL: %s", e)
+            return None
+        if url is None or ttl <= 0:
+            return None
+        return url, ttl / 1000
+
+    async def put(self, key: str, url: str, ttl: float) -> None:
+        if self._async is None:
+            return
+        try:
+            await self._async.set(f"{self.prefix}:{key}", url, px=int(ttl * 1000))
+        except redis.RedisError as e:
+            logger.warning("Could not share a hosted URL: %s", e)
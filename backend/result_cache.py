@@ -0,0 +1,291 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import settings
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # only needed for a cache shared through Redis
+    aioredis = None
+
+# Store an entry and evict the least recently used ones beyond max_bytes
+_PUT = """
+local previous = redis.call('HGET', KEYS[2], ARGV[1])
+if previous then
+    redis.call('DECRBY', KEYS[4], previous)
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+redis.call('ZADD', KEYS[3], ARGV[4], ARGV[1])
+local total = redis.call('INCRBY', KEYS[4], ARGV[3])
+local evicted = 0
+while total > tonumber(ARGV[5]) and redis.call('ZCARD', KEYS[3]) > 1 do
+    local oldest = redis.call('ZRANGE', KEYS[3], 0, 0)[1]
+    total = redis.call('DECRBY', KEYS[4], redis.call('HGET', KEYS[2], oldest) or 0)
+    redis.call('HDEL', KEYS[1], oldest)
+    redis.call('HDEL', KEYS[2], oldest)
+    redis.call('ZREM', KEYS[3], oldest)
+    evicted = evicted + 1
+end
+return evicted
+"""
+
+# Forget entries, keeping the byte total in step
+_DROP = """
+for _, key in ipairs(ARGV) do
+    local size = redis.call('HGET', KEYS[2], key)
+    if size then
+        redis.call('DECRBY', KEYS[4], size)
+        redis.call('HDEL', KEYS[1], key)
+        redis.call('HDEL', KEYS[2], key)
+        redis.call('ZREM', KEYS[3], key)
+    end
+end
+return 0
+"""
+
+
+class ResultCache:
+    """
+    LRU index of finished Act Two outputs keyed on the input content hashes
+    and the Act Two parameters. Evicting an entry only forgets it; the output
+    file stays with the job that produced it. The index is a JSON file owned
+    by this process; nodes sharing a queue use RedisResultCache instead.
+    Changes only mark the index dirty; a background task writes it out at
+    most every flush_interval seconds, off the event loop.
+    """
+
+    def __init__(self, index_path: str, outputs_directory: str, max_bytes: int, flush_interval: float = 1.0):
+        self.index_path = Path(index_path)
+        self.outputs_directory = Path(outputs_directory)
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._total_bytes = 0
+        self._dirty = False
+        self._flusher: Optional[asyncio.Task] = None
+        self._load()
+
+    @staticmethod
+    def make_key(
+        character_sha256: str,
+        reference_sha256: str,
+        ratio: str,
+        body_control: bool,
+        expression_intensity: int,
+    ) -> str:
+        material = json.dumps(
+            [character_sha256, reference_sha256, ratio, body_control, expression_intensity]
+        )
+        return hashlib.sha256(material.encode()).hexdigest()
+
+    async def start(self) -> None:
+        self._flusher = asyncio.create_task(self._flush_periodically())
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Write the index out if it changed since the last write"""
+        if not self._dirty:
+            return
+        self._dirty = False
+        await asyncio.to_thread(self._save, list(self._entries.items()))
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry and not (self.outputs_directory / entry["output_file"]).exists():
+            # Output was removed behind our back
+            self._drop(key)
+            self._dirty = True
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    async def put(self, key: str, output_file: str, job_id: str) -> None:
+        output_path = self.outputs_directory / output_file
+        if not output_path.exists():
+            return
+
+        if key in self._entries:
+            self._drop(key)
+        entry = {
+            "output_file": output_file,
+            "job_id": job_id,
+            "size": output_path.stat().st_size,
+        }
+        self._entries[key] = entry
+        self._total_bytes += entry["size"]
+        self._evict()
+        self._dirty = True
+
+    async def entries(self) -> List[Dict[str, Any]]:
+        return list(self._entries.values())
+
+    async def discard_output(self, output_file: str) -> None:
+        """Forget entries pointing at an output that is being deleted"""
+        keys = [key for key, entry in self._entries.items() if entry["output_file"] == output_file]
+        for key in keys:
+            self._drop(key)
+        if keys:
+            self._dirty = True
+
+    async def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry["size"]
+
+    def _evict(self) -> None:
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            oldest_key = next(iter(self._entries))
+            self._drop(oldest_key)
+            self.evictions += 1
+
+    def _load(self) -> None:
+        try:
+            with open(self.index_path, "r") as f:
+                entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+
+        for key, entry in entries:
+            self._entries[key] = entry
+            self._total_bytes += entry["size"]
+        self._evict()
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def _save(self, entries: List[Any]) -> None:
+        # Write-then-rename so a crash never leaves a torn index behind
+        tmp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.index_path)
+
+
+class RedisResultCache(ResultCache):
+    """
+    The result cache index kept in Redis, so every API node and worker
+    sharing a queue sees the outputs the others recorded. Entries, their
+    sizes and their last use are hashes and a sorted set; storing and
+    evicting run as one script so concurrent writers keep the byte total
+    right. Hit and miss counts are per process.
+    """
+
+    def __init__(self, url: str, outputs_directory: str, max_bytes: int, prefix: str = "sports_editor:results"):
+        if aioredis is None:
+            raise RuntimeError("The redis package is required for JOB_QUEUE_URL")
+        self.url = url
+        self.outputs_directory = Path(outputs_directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.keys = [f"{prefix}:{name}" for name in ("entries", "sizes", "lru", "bytes")]
+        self._redis: Optional["aioredis.Redis"] = None
+
+    async def start(self) -> None:
+        self._redis = aioredis.Redis.from_url(self.url, decode_responses=True)
+        self._put = self._redis.register_script(_PUT)
+        self._drop_keys = self._redis.register_script(_DROP)
+
+    async def stop(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = await self._redis.hget(self.keys[0], key)
+        if entry is not None:
+            entry = json.loads(entry)
+            if not (self.outputs_directory / entry["output_file"]).exists():
+                await self._drop_keys(keys=self.keys, args=[key])
+                entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        await self._redis.zadd(self.keys[2], {key: time.time()}, xx=True)
+        return entry
+
+    async def put(self, key: str, output_file: str, job_id: str) -> None:
+        output_path = self.outputs_directory / output_file
+        if not output_path.exists():
+            return
+
+        size = output_path.stat().st_size
+        entry = {"output_file": output_file, "job_id": job_id, "size": size}
+        self.evictions += await self._put(
+            keys=self.keys, args=[key, json.dumps(entry), size, time.time(), self.max_bytes]
+        )
+
+    async def entries(self) -> List[Dict[str, Any]]:
+        return [json.loads(entry) for entry in await self._redis.hvals(self.keys[0])]
+
+    async def discard_output(self, output_file: str) -> None:
+        entries = await self._redis.hgetall(self.keys[0])
+        keys = [key for key, entry in entries.items() if json.loads(entry)["output_file"] == output_file]
+        if keys:
+            await self._drop_keys(keys=self.keys, args=keys)
+
+    async def stats(self) -> Dict[str, Any]:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.hlen(self.keys[0])
+            pipe.get(self.keys[3])
+            count, total_bytes = await pipe.execute()
+        lookups = self.hits + self.misses
+        return {
+            "entries": count,
+            "bytes": int(total_bytes or 0),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "shared": True,
+        }
+
+
+def create_result_cache(queue_url: str = settings.JOB_QUEUE_URL) -> ResultCache:
+    """A process-local index, or one shared through Redis when a queue URL is set"""
+    if queue_url:
+        return RedisResultCache(queue_url, settings.JOBS_DIRECTORY, settings.RESULT_CACHE_MAX_BYTES)
+    return ResultCache(settings.RESULT_CACHE_PATH, settings.JOBS_DIRECTORY, settings.RESULT_CACHE_MAX_BYTES)
+
+
+result_cache = create_result_cache()
@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Optional, Set
+
+import httpx
+from runwayml import APIConnectionError, APIStatusError, AsyncRunwayML
+
+from config import settings
+from metrics import RUNWAY_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Allows `rate` calls per second with bursts of up to `burst`. Waiters
+    are served in arrival order; pause() holds everyone back, e.g. for a
+    Retry-After.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+def _retry_after(error: APIStatusError) -> Optional[float]:
+    value = error.response.headers.get("retry-after")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+# Failures that happen before a request reaches Runway
+_NOT_SENT = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+def _retryable(error: Exception, idempotent: bool = True) -> bool:
+    """
+    Whether a failed call may be made again. A call that is not idempotent
+    (task creation) is only repeated when Runway refused it with a 429 or
+    it never left this process; after a timeout or a 5xx the task may exist.
+    """
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or (idempotent and error.status_code >= 500)
+    if isinstance(error, APIConnectionError):
+        return idempotent or isinstance(error.__cause__, _NOT_SENT)
+    return False
+
+
+class RunwayGateway:
+    """
+    The one way this process talks to the Runway API.
+    Task creation and status reads each go through a token bucket. 429s,
+    5xx and connection errors are retried with jittered exponential backoff, or after
+    Retry-After when Runway sends one, which also pauses the whole bucket.
+    Submissions are paced to the account's concurrency quota. The limit
+    starts at `max_concurrency`, drops to what Runway actually runs when it
+    throttles tasks or refuses new ones, and creeps back up once the
+    throttling stops. Creates refused with 429 wait and resubmit for up to
+    `throttle_timeout` instead of failing the job. Creates are otherwise
+    only retried when they never reached Runway, so a timed-out create
+    cannot start a second billed task. `client` returns the SDK client to
+    call, looked up on every request.
+    """
+
+    def __init__(
+        self,
+        client: Callable[[], AsyncRunwayML],
+        create_rate: float = settings.RUNWAY_CREATE_RATE,
+        create_burst: int = settings.RUNWAY_CREATE_BURST,
+        retrieve_rate: float = settings.RUNWAY_RETRIEVE_RATE,
+        retrieve_burst: int = settings.RUNWAY_RETRIEVE_BURST,
+        max_retries: int = settings.RUNWAY_MAX_RETRIES,
+        retry_base_delay: float = settings.RUNWAY_RETRY_BASE_DELAY,
+        retry_max_delay: float = settings.RUNWAY_RETRY_MAX_DELAY,
+        max_concurrency: int = settings.RUNWAY_CONCURRENCY,
+        throttle_timeout: float = settings.RUNWAY_THROTTLE_TIMEOUT,
+        quota_probe_interval: float = 60.0,
+    ):
+        self.client = client
+        self.create_bucket = TokenBucket(create_rate, create_burst)
+        self.retrieve_bucket = TokenBucket(retrieve_rate, retrieve_burst)
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.max_concurrency = max_concurrency
+        self.concurrency_limit = max_concurrency
+        self.throttle_timeout = throttle_timeout
+        self.quota_probe_interval = quota_probe_interval
+        self.retries = 0
+        self._tasks: Set[str] = set()
+        self._throttled: Set[str] = set()
+        self._last_throttled = 0.0
+        self._capacity: Optional[asyncio.Condition] = None
+        self._reserved = 0
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._tasks) + self._reserved
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "throttled": len(self._throttled),
+            "concurrency_limit": self.concurrency_limit,
+            "max_concurrency": self.max_concurrency,
+            "retries": self.retries,
+        }
+
+    async def create_task(self, **params: Any) -> str:
+        """Submit an Act Two task once the quota has room; returns its ID"""
+        capacity = self._condition()
+        async with capacity:
+            await capacity.wait_for(lambda: self.in_flight < self.concurrency_limit)
+            self._reserved += 1
+
+        task_id = None
+        try:
+            task = await self._call(
+                "create",
+                self.create_bucket,
+                lambda: self.client().character_performance.create(**params),
+                deadline=time.monotonic() + self.throttle_timeout,
+                idempotent=False,
+            )
+            task_id = task.id
+        finally:
+            async with capacity:
+                self._reserved -= 1
+                if task_id:
+                    self._tasks.add(task_id)
+                capacity.notify_all()
+        return task_id
+
+    async def retrieve_task(self, task_id: str) -> Any:
+        task = await self._call("retrieve", self.retrieve_bucket, lambda: self.client().tasks.retrieve(task_id))
+        self._observe_status(task_id, getattr(task, "status", None))
+        return task
+
+    def adopt(self, task_id: str) -> None:
+        """Count a task submitted before a restart against the quota"""
+        self._tasks.add(task_id)
+
+    async def release(self, task_id: str) -> None:
+        """A task settled: its quota slot is free again"""
+        self._tasks.discard(task_id)
+        self._throttled.discard(task_id)
+        if (
+            self.concurrency_limit < self.max_concurrency
+            and not self._throttled
+            and time.monotonic() - self._last_throttled > self.quota_probe_interval
+        ):
+            self.concurrency_limit += 1
+        capacity = self._condition()
+        async with capacity:
+            capacity.notify_all()
+
+    def _condition(self) -> asyncio.Condition:
+        if self._capacity is None:
+            self._capacity = asyncio.Condition()
+        return self._capacity
+
+    def _observe_status(self, task_id: str, status: Optional[str]) -> None:
+        if status == "THROTTLED":
+            # Runway queued it behind the account's concurrency quota
+            self._throttled.add(task_id)
+            self._hit_quota(len(self._tasks) - len(self._throttled))
+        else:
+            self._throttled.discard(task_id)
+
+    def _hit_quota(self, running: int) -> None:
+        limit = max(1, running)
+        if limit < self.concurrency_limit:
+            logger.info("Runway concurrency quota reached, pacing submissions to %d", limit)
+            self.concurrency_limit = limit
+        self._last_throttled = time.monotonic()
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter, so waiting jobs do not retry in lockstep
+        return random.uniform(0, min(self.retry_max_delay, self.retry_base_delay * 2 ** attempt))
+
+    async def _call(
+        self,
+        operation: str,
+        bucket: TokenBucket,
+        request: Callable[[], Awaitable[Any]],
+        deadline: Optional[float] = None,
+        idempotent: bool = True,
+    ) -> Any:
+        attempt = 0
+        while True:
+            await bucket.acquire()
+            try:
+                result = await request()
+            except Exception as e:
+                throttled = isinstance(e, APIStatusError) and e.status_code == 429
+                # Creates refused for quota keep waiting until their deadline
+                may_wait = throttled and deadline is not None and time.monotonic() < deadline
+                if not _retryable(e, idempotent) or (attempt >= self.max_retries and not may_wait):
+                    RUNWAY_REQUESTS.inc(operation=operation, outcome="error")
+                    raise
+
+                delay = self._backoff(attempt)
+                if isinstance(e, APIStatusError):
+                    retry_after = _retry_after(e)
+                    if retry_after is not None:
+                        delay = retry_after
+                if throttled:
+                    bucket.pause(delay)
+                    if operation == "create":
+                        self._hit_quota(len(self._tasks))
+
+                outcome = "throttled" if throttled else "retried"
+                RUNWAY_REQUESTS.inc(operation=operation, outcome=outcome)
+                self.retries += 1
+                attempt += 1
+                logger.warning("Runway %s %s, retrying in %.1fs: %s", operation, outcome, delay, e)
+                await asyncio.sleep(delay)
+                continue
+
+            RUNWAY_REQUESTS.inc(operation=operation, outcome="success")
+            return result
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Job queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class JobScheduler:
+    """
+    Bounded FIFO job queue drained by a fixed pool of workers.
+    Each pipeline stage also has its own concurrency limit, so a burst of
+    jobs cannot open an unbounded number of uploads, Runway tasks or
+    downloads at once.
+    """
+
+    def __init__(
+        self,
+        max_queue: int,
+        workers: int,
+        stage_limits: Dict[str, int],
+        default_retry_after: int,
+    ):
+        self.max_queue = max_queue
+        self.workers = workers
+        self.stage_limits = stage_limits
+        self.default_retry_after = default_retry_after
+        self._stages: Dict[str, asyncio.Semaphore] = {}
+        self._stage_active = {name: 0 for name in stage_limits}
+        self._pending: "OrderedDict[str, tuple]" = OrderedDict()
+        self._running: set = set()
+        self._wakeup: Optional[asyncio.Queue] = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._detached: Set[asyncio.Task] = set()
+        self._handler: Optional[Callable[..., Awaitable[Any]]] = None
+        self._avg_job_seconds: Optional[float] = None
+
+    async def start(self, handler: Callable[..., Awaitable[Any]]) -> None:
+        self._handler = handler
+        self._wakeup = asyncio.Queue()
+        self._stages = {name: asyncio.Semaphore(limit) for name, limit in self.stage_limits.items()}
+        for _ in range(self.workers):
+            self._worker_tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self, drain_timeout: float = 30.0) -> None:
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks.clear()
+        # Let detached work finish (briefly) rather than cut it off
+        if self._detached:
+            _, unfinished = await asyncio.wait(self._detached, timeout=drain_timeout)
+            for task in unfinished:
+                task.cancel()
+            await asyncio.gather(*unfinished, return_exceptions=True)
+
+    async def is_full(self) -> bool:
+        return len(self._pending) >= self.max_queue
+
+    async def free_slots(self) -> int:
+        return max(0, self.max_queue - len(self._pending))
+
+    def retry_after(self) -> int:
+        """Seconds until a queue slot is likely to free up"""
+        if self._avg_job_seconds is None:
+            return self.default_retry_after
+        return max(1, math.ceil(self._avg_job_seconds / self.workers))
+
+    async def submit(self, job_id: str, *args: Any, force: bool = False) -> int:
+        """
+        Queue a job and return its 1-based position in the queue. force
+        admits it even when the queue is full, for jobs accepted earlier.
+        """
+        if not force and await self.is_full():
+            raise QueueFullError(self.retry_after())
+        self._pending[job_id] = args
+        self._wakeup.put_nowait(job_id)
+        return len(self._pending)
+
+    async def position(self, job_id: str) -> Optional[int]:
+        """1-based queue position, or None once the job has left the queue"""
+        for index, pending_id in enumerate(self._pending):
+            if pending_id == job_id:
+                return index + 1
+        return None
+
+    def detach(self, work: Awaitable[Any], job_id: Optional[str] = None) -> asyncio.Task:
+        """
+        Run work that should not keep a worker busy, such as a finished
+        job's post-processing, alongside the next job
+        """
+        task = asyncio.ensure_future(self._run_detached(work, job_id))
+        self._detached.add(task)
+        task.add_done_callback(self._detached.discard)
+        return task
+
+    async def _run_detached(self, work: Awaitable[Any], job_id: Optional[str]) -> None:
+        try:
+            await work
+        except Exception as e:
+            logger.exception("Background work failed: %s", e, extra={"job_id": job_id})
+
+    def stage(self, name: str) -> "_StageSlot":
+        """Async context manager holding one slot of the named stage"""
+        return _StageSlot(self, name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self._pending),
+            "max_queue": self.max_queue,
+            "running": len(self._running),
+            "workers": self.workers,
+            "detached": len(self._detached),
+            "stages": {
+                name: {"active": self._stage_active[name], "limit": limit}
+                for name, limit in self.stage_limits.items()
+            },
+        }
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._wakeup.get()
+            args = self._pending.pop(job_id, None)
+            if args is None:
+                continue
+
+            self._running.add(job_id)
+            started = time.monotonic()
+            try:
+                await self._handler(job_id, *args)
+            except Exception as e:
+                logger.exception("Job crashed in worker: %s", e, extra={"job_id": job_id})
+            finally:
+                self._running.discard(job_id)
+                self._record_duration(time.monotonic() - started)
+
+    def _record_duration(self, seconds: float) -> None:
+        if self._avg_job_seconds is None:
+            self._avg_job_seconds = seconds
+        else:
+            self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * seconds
+
+
+class _StageSlot:
+    def __init__(self, scheduler: JobScheduler, name: str):
+        self.scheduler = scheduler
+        self.name = name
+
+    async def __aenter__(self) -> None:
+        await self.scheduler._stages[self.name].acquire()
+        self.scheduler._stage_active[self.name] += 1
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.scheduler._stage_active[self.name] -= 1
+        self.scheduler._stages[self.name].release()
+
+
+def create_scheduler(queue_url: str = settings.JOB_QUEUE_URL) -> JobScheduler:
+    """The in-process queue, or the shared Redis queue when a queue URL is set"""
+    options = dict(
+        max_queue=settings.JOB_QUEUE_SIZE,
+        workers=settings.JOB_WORKERS,
+        stage_limits={
+            "hosting": settings.HOSTING_CONCURRENCY,
+            "runway": settings.RUNWAY_CONCURRENCY,
+            "download": settings.DOWNLOAD_CONCURRENCY,
+        },
+        default_retry_after=settings.JOB_RETRY_AFTER,
+    )
+    if queue_url:
+        from redis_queue import RedisJobScheduler
+        return RedisJobScheduler(queue_url, **options)
+    return JobScheduler(**options)
+
+
+scheduler = create_scheduler()
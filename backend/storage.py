@@ -0,0 +1,334 @@
+import asyncio
+import json
+import logging
+import os
+import stat
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from config import settings
+from job_store import JobStore
+from result_cache import ResultCache
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _FileEntry:
+    size: int
+    last_used: float
+
+
+class DirectoryIndex:
+    """
+    In-memory sizes and last-use times for one directory's files.
+    The directory is only relisted when its own mtime changes (a file was
+    added or removed), and at most `budget` new files are stat'ed per
+    refresh, so a large tree is never rescanned in full.
+    """
+
+    def __init__(self, name: str, path: str, quota: int):
+        self.name = name
+        self.path = Path(path)
+        self.quota = quota
+        self.entries: Dict[str, _FileEntry] = {}
+        self.total_bytes = 0
+        self._listed_mtime_ns: Optional[int] = None
+        self._unscanned: List[str] = []
+
+    def refresh(self, budget: int) -> None:
+        """Pick up added and removed files. Blocking; run in a thread."""
+        try:
+            mtime_ns = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            self.entries.clear()
+            self.total_bytes = 0
+            return
+
+        if mtime_ns != self._listed_mtime_ns:
+            names = set(os.listdir(self.path))
+            for name in [name for name in self.entries if name not in names]:
+                self.forget(name)
+            self._unscanned = [name for name in names if name not in self.entries]
+            self._listed_mtime_ns = mtime_ns
+
+        while self._unscanned and budget > 0:
+            name = self._unscanned.pop()
+            try:
+                st = os.stat(self.path / name)
+            except FileNotFoundError:
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            self.entries[name] = _FileEntry(size=st.st_size, last_used=st.st_mtime)
+            self.total_bytes += st.st_size
+            budget -= 1
+
+    def touch(self, name: str) -> None:
+        entry = self.entries.get(name)
+        if entry:
+            entry.last_used = time.time()
+
+    def forget(self, name: str) -> None:
+        entry = self.entries.pop(name, None)
+        if entry:
+            self.total_bytes -= entry.size
+
+    def usage(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "bytes": self.total_bytes,
+            "files": len(self.entries),
+            "quota": self.quota,
+            "pending_scan": len(self._unscanned),
+        }
+
+
+class StorageManager:
+    """
+    Background lifecycle for uploads/ and jobs/.
+    Each pass expires files by age (job outputs by their job's status,
+    uploads by last use), then evicts least recently used files from any
+    directory over its byte quota. Files of unfinished or pinned jobs are
+    never touched; outputs the result cache still points at go last.
+    """
+
+    def __init__(
+        self,
+        job_store: JobStore,
+        result_cache: ResultCache,
+        pins_path: str = settings.STORAGE_PINS_PATH,
+        interval: float = settings.STORAGE_GC_INTERVAL,
+        scan_batch: int = settings.STORAGE_SCAN_BATCH,
+        on_remove: Optional[Callable[[List[Tuple[str, str]]], Awaitable[None]]] = None,
+    ):
+        self.job_store = job_store
+        self.result_cache = result_cache
+        self.pins_path = Path(pins_path)
+        self.interval = interval
+        self.scan_batch = scan_batch
+        self.on_remove = on_remove
+        self.uploads = DirectoryIndex("uploads", settings.UPLOAD_DIRECTORY, settings.UPLOAD_QUOTA_BYTES)
+        self.jobs = DirectoryIndex("jobs", settings.JOBS_DIRECTORY, settings.JOBS_QUOTA_BYTES)
+        self.ttls = {
+            "completed": settings.STORAGE_TTL_COMPLETED,
+            "failed": settings.STORAGE_TTL_FAILED,
+            "upload": settings.STORAGE_TTL_UPLOAD,
+            "partial": settings.STORAGE_TTL_PARTIAL,
+        }
+        self.reclaimed_bytes = 0
+        self.reclaimed_files = 0
+        self.reclaimed_by_reason: Dict[str, int] = {"ttl": 0, "quota": 0}
+        self.runs = 0
+        self.last_run_at: Optional[float] = None
+        self.last_run_seconds: Optional[float] = None
+        self._pins: Dict[str, List[str]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._load_pins()
+
+    @property
+    def indexes(self) -> Tuple[DirectoryIndex, DirectoryIndex]:
+        return self.uploads, self.jobs
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def touch(self, path: Path) -> None:
+        """Mark a file as just used, for LRU eviction"""
+        for index in self.indexes:
+            if path.parent.resolve() == index.path.resolve():
+                index.touch(path.name)
+
+    def pin(self, job_id: str, filenames: Iterable[str]) -> None:
+        self._pins[job_id] = sorted(set(filenames))
+        self._save_pins()
+
+    def unpin(self, job_id: str) -> bool:
+        if self._pins.pop(job_id, None) is None:
+            return False
+        self._save_pins()
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "directories": {index.name: index.usage() for index in self.indexes},
+            "ttl_seconds": self.ttls,
+            "reclaimed_bytes": self.reclaimed_bytes,
+            "reclaimed_files": self.reclaimed_files,
+            "reclaimed_by_reason": self.reclaimed_by_reason,
+            "pinned_jobs": len(self._pins),
+            "runs": self.runs,
+            "last_run_at": self.last_run_at,
+            "last_run_seconds": self.last_run_seconds,
+        }
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.collect()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("Storage GC failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def collect(self) -> Dict[str, int]:
+        """Run one lifecycle pass; returns bytes reclaimed per reason"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            started = time.monotonic()
+            pass_started = time.time()
+            for index in self.indexes:
+                await asyncio.to_thread(index.refresh, self.scan_batch)
+
+            protected = await asyncio.to_thread(self._protected_files)
+            # Jobs whose output is cached keep their playback artifacts with it
+            cached = {self._job_id(entry["output_file"]) for entry in await self.result_cache.entries()}
+            # Reads job records for the TTLs, so off the event loop too
+            expired = await asyncio.to_thread(self._expired, protected, cached)
+            expiring = {(index.name, name) for index, name, _ in expired}
+            removals = expired + self._over_quota(protected, cached, expiring)
+
+            reclaimed = {"ttl": 0, "quota": 0}
+            removed: List[Tuple[str, str]] = []
+            for index, name, reason in removals:
+                size = await asyncio.to_thread(self._delete, index, name, pass_started)
+                if size is None:
+                    continue
+                reclaimed[reason] += size
+                self.reclaimed_by_reason[reason] += size
+                self.reclaimed_bytes += size
+                self.reclaimed_files += 1
+                if index is self.jobs:
+                    await self.result_cache.discard_output(name)
+                removed.append((index.name, name))
+            if removed and self.on_remove:
+                # One call per pass, so the callback can look jobs up once
+                await self.on_remove(removed)
+
+            self.runs += 1
+            self.last_run_at = time.time()
+            self.last_run_seconds = time.monotonic() - started
+            if reclaimed["ttl"] or reclaimed["quota"]:
+                logger.info("Storage GC reclaimed %d bytes", sum(reclaimed.values()), extra={"reclaimed": reclaimed})
+            return reclaimed
+
+    def _protected_files(self) -> Set[str]:
+        """Files of unfinished jobs and pinned jobs, plus unfinished jobs' outputs"""
+        protected = {name for names in self._pins.values() for name in names}
+        for status in ("queued", "processing"):
+            offset = 0
+            while True:
+                jobs, total = self.job_store.list(status=status, limit=200, offset=offset)
+                for job in jobs:
+                    protected.add(f"job:{job['id']}")
+                    protected.update(job.get(key) for key in ("character_file", "reference_file"))
+                    protected.update(item["file"] for item in (job.get("normalized") or {}).values())
+                offset += len(jobs)
+                if not jobs or offset >= total:
+                    break
+        for job_id in self._pins:
+            protected.add(f"job:{job_id}")
+        return protected
+
+    @staticmethod
+    def _job_id(name: str) -> str:
+        # Job outputs are named <job_id>_<artifact>
+        return name.split("_", 1)[0]
+
+    def _is_protected(self, index: DirectoryIndex, name: str, protected: Set[str]) -> bool:
+        if name in protected:
+            return True
+        return index is self.jobs and f"job:{self._job_id(name)}" in protected
+
+    def _ttl(self, index: DirectoryIndex, name: str, jobs: Dict[str, Optional[Dict[str, Any]]]) -> float:
+        if ".part" in name:
+            return self.ttls["partial"]
+        if index is self.uploads:
+            return self.ttls["upload"]
+
+        job_id = self._job_id(name)
+        if job_id not in jobs:
+            jobs[job_id] = self.job_store.get(job_id)
+        job = jobs[job_id]
+        if job is None or job["status"] == "failed":
+            # Orphans and leftovers of failed jobs go first
+            return self.ttls["failed"]
+        return self.ttls["completed"]
+
+    def _expired(self, protected: Set[str], cached: Set[str]) -> List[Tuple[DirectoryIndex, str, str]]:
+        now = time.time()
+        jobs: Dict[str, Optional[Dict[str, Any]]] = {}
+        removals = []
+        for index in self.indexes:
+            for name, entry in index.entries.items():
+                if self._is_protected(index, name, protected) or (index is self.jobs and self._job_id(name) in cached):
+                    continue
+                if now - entry.last_used > self._ttl(index, name, jobs):
+                    removals.append((index, name, "ttl"))
+        return removals
+
+    def _over_quota(
+        self, protected: Set[str], cached: Set[str], expiring: Set[Tuple[str, str]]
+    ) -> List[Tuple[DirectoryIndex, str, str]]:
+        removals = []
+        for index in self.indexes:
+            usage = sum(
+                entry.size for name, entry in index.entries.items() if (index.name, name) not in expiring
+            )
+            if usage <= index.quota:
+                continue
+            # Least recently used first; cached outputs only once nothing else is left
+            candidates = sorted(
+                (index is self.jobs and self._job_id(name) in cached, entry.last_used, name)
+                for name, entry in index.entries.items()
+                if (index.name, name) not in expiring and not self._is_protected(index, name, protected)
+            )
+            for _, _, name in candidates:
+                if usage <= index.quota:
+                    break
+                usage -= index.entries[name].size
+                removals.append((index, name, "quota"))
+        return removals
+
+    @staticmethod
+    def _delete(index: DirectoryIndex, name: str, pass_started: float) -> Optional[int]:
+        path = index.path / name
+        try:
+            st = path.stat()
+            last_used = max(index.entries[name].last_used, st.st_mtime)
+            if last_used > pass_started:
+                # Served, re-stored or rewritten since this pass chose it: in use again
+                index.forget(name)
+                index.entries[name] = _FileEntry(size=st.st_size, last_used=last_used)
+                index.total_bytes += st.st_size
+                return None
+            path.unlink()
+        except FileNotFoundError:
+            index.forget(name)
+            return None
+        index.forget(name)
+        return st.st_size
+
+    def _load_pins(self) -> None:
+        try:
+            with open(self.pins_path, "r") as f:
+                self._pins = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self._pins = {}
+
+    def _save_pins(self) -> None:
+        tmp_path = self.pins_path.with_name(self.pins_path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self._pins, f)
+        os.replace(tmp_path, self.pins_path)
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from runwayml import TaskFailedError, TaskTimeoutError
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_FAILURE_STATUSES = ("FAILED", "CANCELLED")
+
+
+@dataclass
+class _TrackedTask:
+    task_id: str
+    future: asyncio.Future
+    deadline: float
+    interval: float
+    next_poll: float
+    last_status: Optional[str] = None
+    errors: int = 0
+    listeners: List[Callable[[Any], None]] = field(default_factory=list)
+
+
+class RunwayTaskPoller:
+    """
+    One coroutine that tracks every outstanding Runway task.
+    Each task is polled on its own backoff schedule, with up to
+    `batch_size` retrieves in flight at once. Each retrieve is handled as
+    soon as it returns, so a task whose retrieve is retrying does not hold
+    up the others. The future handed out by wait() resolves when the task
+    settles.
+    """
+
+    def __init__(
+        self,
+        retrieve: Callable[[str], Awaitable[Any]],
+        initial_interval: float = settings.RUNWAY_POLL_INITIAL_INTERVAL,
+        max_interval: float = settings.RUNWAY_POLL_MAX_INTERVAL,
+        backoff: float = settings.RUNWAY_POLL_BACKOFF,
+        batch_size: int = settings.RUNWAY_POLL_BATCH_SIZE,
+        timeout: float = settings.RUNWAY_TASK_TIMEOUT,
+        max_errors: int = 5,
+    ):
+        self.retrieve = retrieve
+        self.initial_interval = initial_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.max_errors = max_errors
+        self._tasks: Dict[str, _TrackedTask] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._retrieving: Dict[str, asyncio.Task] = {}
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._runner = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._runner:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+        for retrieving in self._retrieving.values():
+            retrieving.cancel()
+        await asyncio.gather(*self._retrieving.values(), return_exceptions=True)
+        self._retrieving.clear()
+        for tracked in self._tasks.values():
+            if not tracked.future.done():
+                tracked.future.cancel()
+        self._tasks.clear()
+
+    def wait(
+        self,
+        task_id: str,
+        on_update: Optional[Callable[[Any], None]] = None,
+    ) -> "asyncio.Future[Any]":
+        """
+        Future resolving to the finished task, or raising TaskFailedError /
+        TaskTimeoutError. Several callers may wait on the same task.
+        on_update is called with each intermediate task response; if it
+        raises, the error is logged and polling carries on.
+        """
+        tracked = self._tasks.get(task_id)
+        if tracked is None:
+            now = time.monotonic()
+            tracked = _TrackedTask(
+                task_id=task_id,
+                future=asyncio.get_running_loop().create_future(),
+                deadline=now + self.timeout,
+                interval=self.initial_interval,
+                next_poll=now + self.initial_interval,
+            )
+            self._tasks[task_id] = tracked
+            self._wakeup.set()
+        if on_update is not None:
+            tracked.listeners.append(on_update)
+        # Shield so one cancelled waiter does not cancel the shared future
+        return asyncio.shield(tracked.future)
+
+    @property
+    def outstanding(self) -> int:
+        return len(self._tasks)
+
+    async def _run(self) -> None:
+        while True:
+            now = time.monotonic()
+            idle = [t for t in self._tasks.values() if t.task_id not in self._retrieving]
+            slots = max(0, self.batch_size - len(self._retrieving))
+            due = sorted((t for t in idle if t.next_poll <= now), key=lambda t: t.next_poll)[:slots]
+            for tracked in due:
+                self._retrieving[tracked.task_id] = asyncio.create_task(self._poll(tracked))
+
+            # Sleep until the next idle task is due, or until a retrieve
+            # returns or a task is added
+            waiting = [t.next_poll for t in idle if t.task_id not in self._retrieving]
+            delay = None
+            if waiting and len(self._retrieving) < self.batch_size:
+                delay = max(0.0, min(waiting) - time.monotonic())
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, tracked: _TrackedTask) -> None:
+        try:
+            result = await self.retrieve(tracked.task_id)
+        except Exception as e:
+            result = e
+        finally:
+            self._retrieving.pop(tracked.task_id, None)
+            self._wakeup.set()
+        self._handle(tracked, result)
+
+    def _handle(self, tracked: _TrackedTask, result: Any) -> None:
+        now = time.monotonic()
+
+        if isinstance(result, Exception):
+            tracked.errors += 1
+            if tracked.errors >= self.max_errors:
+                self._settle(tracked, exception=result)
+            else:
+                self._schedule(tracked, now, backoff=True)
+            return
+
+        tracked.errors = 0
+        status = getattr(result, "status", None)
+        if status == "SUCCEEDED":
+            self._settle(tracked, result=result)
+        elif status in TERMINAL_FAILURE_STATUSES:
+            self._settle(tracked, exception=TaskFailedError(result))
+        elif status == "THROTTLED":
+            # Waiting behind the account's quota is not render time
+            tracked.deadline = max(tracked.deadline, now + self.timeout)
+            tracked.last_status = status
+            self._schedule(tracked, now, backoff=True)
+        elif now >= tracked.deadline:
+            self._settle(tracked, exception=TaskTimeoutError(result))
+        else:
+            # Poll quickly again after a status change (e.g. PENDING -> RUNNING),
+            # back off while the task stays in the same state
+            changed = status != tracked.last_status
+            tracked.last_status = status
+            self._schedule(tracked, now, backoff=not changed)
+            for listener in tracked.listeners:
+                # A broken listener must not stop the poller for every other task
+                try:
+                    listener(result)
+                except Exception as e:
+                    logger.exception("Task update listener failed: %s", e, extra={"task_id": tracked.task_id})
+
+    def _schedule(self, tracked: _TrackedTask, now: float, backoff: bool) -> None:
+        if backoff:
+            tracked.interval = min(tracked.interval * self.backoff, self.max_interval)
+        else:
+            tracked.interval = self.initial_interval
+        tracked.next_poll = now + tracked.interval
+
+    def _settle(self, tracked: _TrackedTask, result: Any = None, exception: Optional[BaseException] = None) -> None:
+        self._tasks.pop(tracked.task_id, None)
+        if tracked.future.done():
+            return
+        if exception is not None:
+            tracked.future.set_exception(exception)
+        else:
+            tracked.future.set_result(result)
@@ -0,0 +1,7 @@
+import os
+import sys
+from pathlib import Path
+
+# Settings are read on import and need an API key; modules import each other by bare name
+os.environ.setdefault("RUNWAY_API_KEY", "test")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,63 @@
+import asyncio
+
+import pytest
+
+from bench.fakes import FakeHosting, FakeProfile, LocalServer
+from hosting import FileIoProvider, HostingRace, TransferShProvider, ZeroX0Provider
+from http_pool import close_http_client
+
+
+@pytest.fixture
+def hosts():
+    """A temp host that always fails, one that is slow and one that is fast"""
+    fakes = {
+        "failing": FakeHosting(profile=FakeProfile(latency=0.01, jitter=0, failure_rate=1.0)),
+        "slow": FakeHosting(profile=FakeProfile(latency=1.0, jitter=0)),
+        "fast": FakeHosting(profile=FakeProfile(latency=0.05, jitter=0)),
+    }
+    servers = {}
+    for name, fake in fakes.items():
+        servers[name] = LocalServer(fake.app()).start()
+        fake.base_url = servers[name].url
+    yield fakes
+    for server in servers.values():
+        server.stop()
+
+
+def test_race_skips_failures_hedges_slow_hosts_and_cancels_losers(hosts, tmp_path):
+    video = tmp_path / "input.mp4"
+    video.write_bytes(b"\0" * 1024)
+    race = HostingRace(
+        [
+            ZeroX0Provider(f"{hosts['failing'].base_url}/0x0"),
+            TransferShProvider(f"{hosts['slow'].base_url}/transfer"),
+            FileIoProvider(f"{hosts['fast'].base_url}/fileio"),
+        ],
+        stagger=0.2,
+    )
+
+    async def scenario():
+        try:
+            url = await race.host(str(video))
+            # The winner now ranks first, so the next race starts with it
+            ranking = [provider.name for provider in race.ranked()]
+            again = await race.host(str(video))
+        finally:
+            await close_http_client()
+        return url, ranking, again
+
+    url, ranking, again = asyncio.run(scenario())
+    assert url.startswith(hosts["fast"].base_url)
+    # file.io links are single use, so the second request raced again
+    assert again.startswith(hosts["fast"].base_url) and again != url
+    assert ranking[0] == "file.io"
+
+    stats = race.stats_snapshot()["providers"]
+    assert stats["0x0.st"]["failures"] == 1
+    assert stats["transfer.sh"]["cancelled"] == 1
+    assert stats["transfer.sh"]["successes"] == 0
+    # Only the first race reached the failing and slow hosts; the slow one never answered
+    assert stats["file.io"]["successes"] == 2
+    assert hosts["failing"].uploads == 0 and hosts["failing"].bytes_received > 0
+    assert hosts["slow"].uploads == 0
+    assert hosts["fast"].uploads == 2
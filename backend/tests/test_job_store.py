@@ -0,0 +1,97 @@
+import json
+import sqlite3
+
+import pytest
+
+from job_store import RedisJobStore, SQLiteJobStore, migrate_json_jobs
+
+
+def make_job(job_id: str, status: str = "queued", created_at: str = "2026-01-01T00:00:00", **fields) -> dict:
+    return {"id": job_id, "status": status, "created_at": created_at, **fields}
+
+
+@pytest.fixture
+def sqlite_store(tmp_path):
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def redis_store(monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        "job_store.redis.Redis.from_url",
+        lambda url, **options: fakeredis.FakeRedis(server=server, **options),
+    )
+    return RedisJobStore("redis://fake/0")
+
+
+def test_redis_create_indexes_the_job_or_writes_nothing(redis_store, monkeypatch):
+    redis_store.create(make_job("job-1"))
+    with pytest.raises(ValueError):
+        redis_store.create(make_job("job-1"))
+    assert redis_store.list() == ([make_job("job-1")], 1)
+    assert redis_store.list(status="queued")[1] == 1
+
+    def crash(*args, **kwargs):
+        raise RuntimeError("process killed")
+
+    # Dying before the transaction is sent leaves no half-created job behind
+    monkeypatch.setattr(redis_store, "_index", crash)
+    with pytest.raises(RuntimeError):
+        redis_store.create(make_job("job-2"))
+    assert redis_store.get("job-2") is None
+    assert redis_store.list()[1] == 1
+
+
+def test_sqlite_update_applies_only_from_the_expected_status(sqlite_store):
+    sqlite_store.create(make_job("job-1"))
+    with pytest.raises(sqlite3.IntegrityError):
+        sqlite_store.create(make_job("job-1"))
+
+    updated = sqlite_store.update("job-1", {"status": "processing"}, expected_status="queued")
+    assert updated == make_job("job-1", status="processing")
+    # A second worker racing for the same job loses
+    assert sqlite_store.update("job-1", {"status": "processing"}, expected_status="queued") is None
+    assert sqlite_store.update("missing", {"status": "failed"}) is None
+    assert sqlite_store.get("job-1")["status"] == "processing"
+    assert sqlite_store.get("missing") is None
+
+
+def test_sqlite_list_pages_newest_first_and_filters(sqlite_store):
+    for minute in range(5):
+        sqlite_store.create(make_job(
+            f"job-{minute}",
+            status="completed" if minute % 2 else "queued",
+            created_at=f"2026-01-01T00:0{minute}:00",
+            batch_id="batch-1" if minute < 2 else None,
+        ))
+
+    jobs, total = sqlite_store.list(limit=2, offset=1)
+    assert [job["id"] for job in jobs] == ["job-3", "job-2"]
+    assert total == 5
+    jobs, total = sqlite_store.list(status="completed")
+    assert [job["id"] for job in jobs] == ["job-3", "job-1"]
+    assert total == 2
+    jobs, total = sqlite_store.list(status="queued", batch_id="batch-1")
+    assert [job["id"] for job in jobs] == ["job-0"]
+    assert total == 1
+
+
+def test_migrate_json_jobs_imports_once(sqlite_store, tmp_path):
+    legacy = tmp_path / "jobs"
+    legacy.mkdir()
+    (legacy / "old.json").write_text(json.dumps({"status": "completed", "created_at": "2025-06-01T12:00:00"}))
+    (legacy / "kept.json").write_text(json.dumps(make_job("kept", status="failed")))
+    (legacy / "torn.json").write_text('{"status": "comp')
+    sqlite_store.create(make_job("kept", status="completed"))
+
+    counts = migrate_json_jobs(sqlite_store, str(legacy))
+    assert counts == {"imported": 1, "existing": 1, "skipped": 1}
+    assert sqlite_store.get("old") == {"status": "completed", "created_at": "2025-06-01T12:00:00", "id": "old"}
+    # The store's copy wins over the legacy file
+    assert sqlite_store.get("kept")["status"] == "completed"
+    assert sorted(path.name for path in legacy.iterdir()) == ["kept.json.migrated", "old.json.migrated", "torn.json"]
+    assert migrate_json_jobs(sqlite_store, str(legacy)) == {"imported": 0, "existing": 0, "skipped": 1}
@@ -0,0 +1,27 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from media import MediaFiles, is_media_name
+
+
+def test_only_finished_media_names_are_served():
+    assert is_media_name("3f2a_output.mp4")
+    assert is_media_name("3f2a_hls_001.ts")
+    assert not is_media_name(".session-abc.part.json")
+    assert not is_media_name("3f2a_output.mp4.part")
+    assert not is_media_name("3f2a_output.part.mp4")
+    assert not is_media_name("3f2a.json.migrated")
+    assert not is_media_name("nested/3f2a_output.mp4")
+    assert not is_media_name("")
+
+
+def test_media_mount_hides_partial_and_session_files(tmp_path):
+    for name in ("clip.mp4", ".session-abc.part", ".session-abc.part.json", "clip.mp4.part", "legacy.json"):
+        (tmp_path / name).write_bytes(b"data")
+    app = FastAPI()
+    app.mount("/uploads", MediaFiles(directory=tmp_path), name="uploads")
+    client = TestClient(app)
+
+    assert client.get("/uploads/clip.mp4").status_code == 200
+    for name in (".session-abc.part", ".session-abc.part.json", "clip.mp4.part", "legacy.json", ""):
+        assert client.get(f"/uploads/{name}").status_code == 404
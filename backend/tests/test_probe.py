@@ -0,0 +1,73 @@
+import io
+import struct
+
+import pytest
+
+from bench.fakes import synthetic_mp4
+from probe import ProbeError, UnsupportedContainerError, VideoProbe, check_probe, probe_mp4
+
+
+def make_probe(**fields) -> VideoProbe:
+    defaults = dict(
+        brand="isom", width=1280, height=720, duration=10.0, codec="avc1",
+        frame_rate=30.0, has_audio=True, faststart=True,
+    )
+    return VideoProbe(**{**defaults, **fields})
+
+
+def test_too_long_is_rejected_without_normalization():
+    issues, warnings = check_probe("Character", make_probe(duration=45.0))
+    assert issues == ["Character is too long (45.0s, max 30s)"]
+    assert warnings == []
+
+
+def test_too_long_is_a_warning_when_it_will_be_trimmed():
+    issues, warnings = check_probe("Character", make_probe(duration=45.0), trim_to=30.0)
+    assert issues == []
+    assert warnings == ["Character is 45.0s long and will be trimmed to 30s"]
+
+
+def test_reads_the_video_track_header():
+    probe = probe_mp4(io.BytesIO(synthetic_mp4(width=1920, height=1080, duration=4.0, fps=25)))
+    assert probe == VideoProbe(
+        brand="isom", width=1920, height=1080, duration=4.0, codec="avc1",
+        frame_rate=25.0, has_audio=False, faststart=True,
+    )
+
+
+def test_moov_after_mdat_is_not_faststart():
+    video = synthetic_mp4()
+    ftyp_size = struct.unpack_from(">I", video)[0]
+    moov_size = struct.unpack_from(">I", video, ftyp_size)[0]
+    ftyp, moov, mdat = video[:ftyp_size], video[ftyp_size:ftyp_size + moov_size], video[ftyp_size + moov_size:]
+    probe = probe_mp4(io.BytesIO(ftyp + mdat + moov))
+    assert not probe.faststart
+    assert (probe.width, probe.height) == (1280, 720)
+
+
+def test_rejects_other_containers_and_truncated_files():
+    with pytest.raises(UnsupportedContainerError):
+        probe_mp4(io.BytesIO(b"\x1a\x45\xdf\xa3" + b"\0" * 60))  # WebM/EBML
+    with pytest.raises(ProbeError, match="empty"):
+        probe_mp4(io.BytesIO(b""))
+    ftyp_size = struct.unpack_from(">I", synthetic_mp4())[0]
+    with pytest.raises(ProbeError, match="moov"):
+        probe_mp4(io.BytesIO(synthetic_mp4()[:ftyp_size]))
+
+
+def test_thresholds():
+    assert check_probe("Character", make_probe()) == ([], [])
+
+    issues, _ = check_probe("Character", make_probe(width=320, height=240))
+    assert issues == ["Character resolution 320x240 is too low (needs at least 360p)"]
+
+    issues, warnings = check_probe("Character", make_probe(width=640, height=360))
+    assert issues == []
+    assert warnings == ["Character is below 720p; face detection often fails at 640x360"]
+
+    issues, _ = check_probe("Reference", make_probe(duration=0.5))
+    assert issues == ["Reference is too short (0.5s, needs at least 1s)"]
+
+    issues, warnings = check_probe("Reference", make_probe(codec="mp4v"))
+    assert issues == []
+    assert warnings == ["Reference uses codec mp4v; H.264 works best"]
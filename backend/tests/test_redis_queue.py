@@ -0,0 +1,309 @@
+import asyncio
+import json
+
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")  # the queue's claim and requeue steps are Lua scripts
+
+import redis_queue  # noqa: E402
+import result_cache as result_cache_module  # noqa: E402
+from events import JobEventBus  # noqa: E402
+from redis_queue import RedisEventRelay, RedisJobScheduler  # noqa: E402
+from result_cache import RedisResultCache  # noqa: E402
+from scheduler import QueueFullError  # noqa: E402
+
+URL = "redis://fake/0"
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """Every client the queue opens talks to one in-memory Redis"""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        redis_queue.aioredis.Redis,
+        "from_url",
+        lambda url, **options: fakeredis.FakeAsyncRedis(server=server, **options),
+    )
+    return server
+
+
+def make_scheduler(**options) -> RedisJobScheduler:
+    defaults = dict(
+        max_queue=10,
+        workers=1,
+        stage_limits={"hosting": 1},
+        default_retry_after=5,
+        visibility_timeout=30.0,
+        poll_interval=0.01,
+    )
+    return RedisJobScheduler(URL, **{**defaults, **options})
+
+
+async def inspect(server) -> dict:
+    client = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+    prefix = "sports_editor:queue"
+    state = {
+        "pending": await client.lrange(f"{prefix}:pending", 0, -1),
+        "inflight": await client.zrange(f"{prefix}:inflight", 0, -1),
+        "args": await client.hgetall(f"{prefix}:args"),
+        "deliveries": await client.hgetall(f"{prefix}:deliveries"),
+    }
+    await client.aclose()
+    return state
+
+
+async def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not await condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_claimed_job_runs_and_is_acknowledged(server):
+    async def scenario():
+        calls = []
+        done = asyncio.Event()
+
+        async def handler(job_id, *args):
+            calls.append((job_id, *args))
+            done.set()
+
+        scheduler = make_scheduler(workers=0)
+        await scheduler.start(handler)
+        assert await scheduler.submit("job-1", "character.mp4", "reference.mp4") == 1
+        assert await scheduler.submit("job-2", "character.mp4", "reference.mp4") == 2
+        assert await scheduler.position("job-1") == 1
+        assert await scheduler.position("job-2") == 2
+        await scheduler.stop()
+
+        # Claimed in submission order by another node's worker
+        worker = make_scheduler()
+        await worker.start(handler)
+        await asyncio.wait_for(done.wait(), 5)
+        await wait_for(lambda: _is_empty(server))
+        await worker.stop()
+        return calls
+
+    calls = asyncio.run(scenario())
+    assert calls[:2] == [("job-1", "character.mp4", "reference.mp4", 1), ("job-2", "character.mp4", "reference.mp4", 1)]
+
+
+async def _is_empty(server) -> bool:
+    state = await inspect(server)
+    return not any(state.values())
+
+
+def test_submit_refuses_when_the_shared_queue_is_full(server):
+    async def scenario():
+        scheduler = make_scheduler(workers=0, max_queue=1)
+        await scheduler.start(None)
+        await scheduler.submit("job-1")
+        assert await scheduler.is_full()
+        assert await scheduler.free_slots() == 0
+        with pytest.raises(QueueFullError):
+            await scheduler.submit("job-2")
+        await scheduler.stop()
+
+    asyncio.run(scenario())
+
+
+def test_job_is_handed_back_when_its_worker_stops(server):
+    async def scenario():
+        started = asyncio.Event()
+
+        async def handler(job_id, *args):
+            started.set()
+            await asyncio.Event().wait()
+
+        scheduler = make_scheduler()
+        await scheduler.start(handler)
+        await scheduler.submit("job-1", "a")
+        await asyncio.wait_for(started.wait(), 5)
+        assert (await inspect(server))["inflight"] == ["job-1"]
+
+        # Shutting down nacks the running job straight back to the queue
+        await scheduler.stop()
+        return await inspect(server)
+
+    state = asyncio.run(scenario())
+    assert state["pending"] == ["job-1"]
+    assert state["inflight"] == []
+    assert json.loads(state["args"]["job-1"]) == ["a"]
+
+
+def test_job_of_a_dead_worker_is_requeued_after_the_visibility_timeout(server):
+    async def scenario():
+        started = asyncio.Event()
+
+        async def hang(job_id, *args):
+            started.set()
+            await asyncio.Event().wait()
+
+        crashed = make_scheduler(visibility_timeout=0.3)
+        await crashed.start(hang)
+        await crashed.submit("job-1", "a")
+        await asyncio.wait_for(started.wait(), 5)
+
+        async def vanish(job_id):
+            pass
+
+        # A worker that dies never acknowledges or hands back its job
+        crashed._nack = vanish
+        await crashed.stop()
+        assert (await inspect(server))["inflight"] == ["job-1"]
+
+        deliveries = []
+        done = asyncio.Event()
+
+        async def handler(job_id, *args):
+            deliveries.append((job_id, *args))
+            done.set()
+
+        survivor = make_scheduler(visibility_timeout=0.3)
+        await survivor.start(handler)
+        await asyncio.wait_for(done.wait(), 5)
+        await wait_for(lambda: _is_empty(server))
+        await survivor.stop()
+        return deliveries
+
+    # The delivery count tells the handler this is a second attempt
+    assert asyncio.run(scenario()) == [("job-1", "a", 2)]
+
+
+def test_relay_publishes_without_blocking_and_skips_its_own_events(server):
+    async def scenario():
+        first_bus, second_bus = JobEventBus(), JobEventBus()
+        first = RedisEventRelay(URL, first_bus)
+        second = RedisEventRelay(URL, second_bus)
+        await first.start()
+        await second.start()
+        await asyncio.sleep(0.1)  # both subscribed
+
+        mine = first_bus.subscribe("job-1")
+        theirs = second_bus.subscribe("job-1")
+        first.publish("job-1", {"event": "job", "data": {"status": "processing"}})
+        received = await asyncio.wait_for(theirs.get(), 5)
+        await asyncio.sleep(0.1)
+        echoed = not mine.empty()
+
+        await first.stop()
+        await second.stop()
+        return received, echoed
+
+    received, echoed = asyncio.run(scenario())
+    assert received == {"event": "job", "data": {"status": "processing"}}
+    assert not echoed
+
+
+def test_forced_submit_ignores_the_queue_bound(server):
+    async def scenario():
+        scheduler = make_scheduler(workers=0, max_queue=1)
+        await scheduler.start(None)
+        await scheduler.submit("job-1")
+        position = await scheduler.submit("job-2", force=True)
+        await scheduler.stop()
+        return position
+
+    assert asyncio.run(scenario()) == 2
+
+
+def test_worker_survives_a_redis_error_after_claiming(server):
+    async def scenario():
+        calls = []
+        done = asyncio.Event()
+
+        async def handler(job_id, *args):
+            calls.append((job_id, *args))
+            done.set()
+
+        scheduler = make_scheduler(visibility_timeout=0.3)
+        await scheduler.start(handler)
+        hget = scheduler._async.hget
+        failures = []
+
+        async def flaky_hget(*args, **kwargs):
+            if not failures:
+                failures.append(args)
+                raise redis_queue.redis.ConnectionError("connection reset")
+            return await hget(*args, **kwargs)
+
+        scheduler._async.hget = flaky_hget
+        await scheduler.submit("job-1", "a")
+        # The claim is abandoned, then requeued by the reaper and run by the same worker
+        await asyncio.wait_for(done.wait(), 5)
+        alive = [task for task in scheduler._worker_tasks if not task.done()]
+        await scheduler.stop()
+        return calls, failures, len(alive)
+
+    calls, failures, alive = asyncio.run(scenario())
+    assert len(failures) == 1
+    assert calls == [("job-1", "a", 2)]
+    assert alive == 3  # counter, worker and reaper
+
+
+def test_result_cache_is_shared_between_nodes(server, monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        result_cache_module.aioredis.Redis,
+        "from_url",
+        lambda url, **options: fakeredis.FakeAsyncRedis(server=server, **options),
+    )
+    for name, size in (("a_output.mp4", 40), ("b_output.mp4", 40), ("c_output.mp4", 40)):
+        (tmp_path / name).write_bytes(b"x" * size)
+
+    async def scenario():
+        worker = RedisResultCache(URL, str(tmp_path), max_bytes=100)
+        api = RedisResultCache(URL, str(tmp_path), max_bytes=100)
+        await worker.start()
+        await api.start()
+        await worker.put("key-a", "a_output.mp4", "a")
+        await worker.put("key-b", "b_output.mp4", "b")
+        hit = await api.get("key-a")
+        # Over max_bytes: key-b is now the least recently used
+        await worker.put("key-c", "c_output.mp4", "c")
+        evicted = await api.get("key-b")
+        (tmp_path / "c_output.mp4").unlink()
+        removed = await api.get("key-c")
+        stats = await api.stats()
+        await worker.stop()
+        await api.stop()
+        return hit, evicted, removed, stats
+
+    hit, evicted, removed, stats = asyncio.run(scenario())
+    assert hit == {"output_file": "a_output.mp4", "job_id": "a", "size": 40}
+    assert evicted is None
+    assert removed is None
+    assert (stats["entries"], stats["bytes"]) == (1, 40)
+
+
+def test_hosted_urls_are_shared_between_nodes(server, tmp_path):
+    from hosting import HostingRace
+
+    class Provider:
+        name = "stand-in"
+        reusable = True
+        local = False
+
+        def __init__(self):
+            self.uploads = 0
+
+        async def upload(self, video_path):
+            self.uploads += 1
+            return "https://example.test/input.mp4"
+
+    video = tmp_path / "input.mp4"
+    video.write_bytes(b"x")
+
+    async def scenario():
+        api_provider, worker_provider = Provider(), Provider()
+        api, worker = HostingRace([api_provider]), HostingRace([worker_provider])
+        api.shared, worker.shared = redis_queue.RedisUrlCache(URL), redis_queue.RedisUrlCache(URL)
+        await api.shared.start()
+        await worker.shared.start()
+        first = await api.host(str(video))
+        second = await worker.host(str(video))
+        await api.shared.stop()
+        await worker.shared.stop()
+        return first, second, api_provider.uploads, worker_provider.uploads
+
+    assert asyncio.run(scenario()) == ("https://example.test/input.mp4", "https://example.test/input.mp4", 1, 0)
@@ -0,0 +1,40 @@
+import asyncio
+
+from result_cache import ResultCache
+
+
+def test_index_is_written_by_flush_not_by_lookups(tmp_path):
+    (tmp_path / "a_output.mp4").write_bytes(b"x" * 10)
+    index = tmp_path / "result_cache.json"
+
+    async def scenario():
+        cache = ResultCache(str(index), str(tmp_path), max_bytes=100, flush_interval=60)
+        await cache.start()
+        await cache.put("key-a", "a_output.mp4", "a")
+        written_on_put = index.exists()
+        await cache.flush()
+        mtime = index.stat().st_mtime_ns
+        assert await cache.get("key-a")
+        await cache.flush()
+        rewritten_on_get = index.stat().st_mtime_ns != mtime
+        await cache.stop()
+        return written_on_put, rewritten_on_get
+
+    assert asyncio.run(scenario()) == (False, False)
+
+    reloaded = ResultCache(str(index), str(tmp_path), max_bytes=100)
+    assert asyncio.run(reloaded.get("key-a")) == {"output_file": "a_output.mp4", "job_id": "a", "size": 10}
+
+
+def test_stop_writes_pending_changes(tmp_path):
+    (tmp_path / "a_output.mp4").write_bytes(b"x")
+    index = tmp_path / "result_cache.json"
+
+    async def scenario():
+        cache = ResultCache(str(index), str(tmp_path), max_bytes=100, flush_interval=60)
+        await cache.start()
+        await cache.put("key-a", "a_output.mp4", "a")
+        await cache.stop()
+
+    asyncio.run(scenario())
+    assert index.exists()
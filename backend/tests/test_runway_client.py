@@ -0,0 +1,22 @@
+import asyncio
+
+import http_pool
+from runway_client import RunwayClient
+
+
+def test_sdk_client_follows_a_recreated_http_pool():
+    async def scenario():
+        runway = RunwayClient()
+        first = runway.client
+        same = runway.client is first
+        await http_pool.close_http_client()
+        # e.g. a shutdown in one test and a fresh pool in the next
+        second = runway.client
+        pool = http_pool.get_http_client()
+        await http_pool.close_http_client()
+        return same, first, second, pool
+
+    same, first, second, pool = asyncio.run(scenario())
+    assert same
+    assert second is not first
+    assert second._client is pool
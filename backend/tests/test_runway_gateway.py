@@ -0,0 +1,96 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from runwayml import APIConnectionError, APIStatusError
+
+import runway_gateway
+from runway_gateway import RunwayGateway, TokenBucket, _retryable
+
+REQUEST = httpx.Request("POST", "https://api.example.test/v1/character_performance")
+
+
+def status_error(status_code: int, **headers) -> APIStatusError:
+    response = httpx.Response(status_code, headers=headers, request=REQUEST)
+    return APIStatusError(f"status {status_code}", response=response, body=None)
+
+
+def connection_error(cause: Exception) -> APIConnectionError:
+    error = APIConnectionError(request=REQUEST)
+    error.__cause__ = cause
+    return error
+
+
+def test_only_creates_that_never_reached_runway_are_retried():
+    assert _retryable(status_error(429), idempotent=False)
+    assert _retryable(status_error(503))
+    assert not _retryable(status_error(503), idempotent=False)
+    assert not _retryable(status_error(400))
+    assert _retryable(connection_error(httpx.ReadTimeout("slow")))
+    assert not _retryable(connection_error(httpx.ReadTimeout("slow")), idempotent=False)
+    assert _retryable(connection_error(httpx.ConnectError("refused")), idempotent=False)
+    assert not _retryable(ValueError("bug"))
+
+
+def test_backoff_is_jittered_and_capped(monkeypatch):
+    gateway = RunwayGateway(lambda: None, retry_base_delay=0.5, retry_max_delay=4.0)
+    monkeypatch.setattr(runway_gateway.random, "uniform", lambda low, high: high)
+    assert [gateway._backoff(attempt) for attempt in range(5)] == [0.5, 1.0, 2.0, 4.0, 4.0]
+    monkeypatch.undo()
+    assert all(0 <= gateway._backoff(3) <= 4.0 for _ in range(100))
+
+
+def test_token_bucket_allows_a_burst_then_paces():
+    async def scenario():
+        bucket = TokenBucket(rate=20, burst=2)
+        started = time.monotonic()
+        for _ in range(2):
+            await bucket.acquire()
+        burst = time.monotonic() - started
+        await bucket.acquire()
+        paced = time.monotonic() - started
+        bucket.pause(0.2)
+        await bucket.acquire()
+        paused = time.monotonic() - started - paced
+        return burst, paced, paused
+
+    burst, paced, paused = asyncio.run(scenario())
+    assert burst < 0.03
+    assert paced >= 0.04  # one token every 50ms
+    assert paused >= 0.19
+
+
+def test_retrieve_waits_out_retry_after_and_creates_are_not_repeated():
+    async def scenario():
+        retrieves = []
+        creates = []
+
+        async def retrieve(task_id):
+            retrieves.append(task_id)
+            if len(retrieves) == 1:
+                raise status_error(429, **{"retry-after": "0"})
+            return SimpleNamespace(id=task_id, status="RUNNING")
+
+        async def create(**params):
+            creates.append(params)
+            raise status_error(502)
+
+        client = SimpleNamespace(
+            tasks=SimpleNamespace(retrieve=retrieve),
+            character_performance=SimpleNamespace(create=create),
+        )
+        gateway = RunwayGateway(lambda: client, retry_base_delay=0.01, retry_max_delay=0.01)
+        task = await gateway.retrieve_task("task-1")
+        with pytest.raises(APIStatusError):
+            await gateway.create_task(model="act_two")
+        return task, retrieves, creates, gateway.stats()
+
+    task, retrieves, creates, stats = asyncio.run(scenario())
+    assert task.status == "RUNNING"
+    assert retrieves == ["task-1", "task-1"]
+    # A 502 may mean the task exists; sending it again could bill twice
+    assert len(creates) == 1
+    assert stats["retries"] == 1
+    assert stats["in_flight"] == 0
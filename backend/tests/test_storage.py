@@ -0,0 +1,93 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from job_store import SQLiteJobStore
+from result_cache import ResultCache
+from storage import DirectoryIndex, StorageManager
+
+DAY = 24 * 3600
+
+
+@pytest.fixture
+def manager(tmp_path):
+    uploads, jobs = tmp_path / "uploads", tmp_path / "jobs"
+    uploads.mkdir()
+    jobs.mkdir()
+    store = SQLiteJobStore(str(tmp_path / "jobs.db"))
+    cache = ResultCache(str(tmp_path / "result_cache.json"), str(jobs), max_bytes=10**6)
+    manager = StorageManager(store, cache, pins_path=str(tmp_path / "pins.json"))
+    manager.uploads = DirectoryIndex("uploads", str(uploads), quota=10**6)
+    manager.jobs = DirectoryIndex("jobs", str(jobs), quota=10**6)
+    manager.ttls = {"completed": 3600, "failed": 3600, "upload": 3600, "partial": 3600}
+    yield manager
+    store.close()
+
+
+def add_job(manager, job_id, status, **fields):
+    manager.job_store.create({"id": job_id, "status": status, "created_at": "2026-01-01T00:00:00", **fields})
+
+
+def add_file(index, name, size=10, age=2 * DAY):
+    path = index.path / name
+    path.write_bytes(b"x" * size)
+    used = time.time() - age
+    os.utime(path, (used, used))
+
+
+def remaining(manager):
+    return {index.name: sorted(os.listdir(index.path)) for index in manager.indexes}
+
+
+def test_expiry_spares_pinned_unfinished_and_cached_jobs(manager):
+    add_job(manager, "run", "processing", character_file="char.mp4", reference_file="ref.mp4")
+    add_job(manager, "pin", "completed")
+    add_job(manager, "hit", "completed")
+    add_job(manager, "old", "completed")
+    for name in ("char.mp4", "ref.mp4", "stale.mp4"):
+        add_file(manager.uploads, name)
+    for job_id in ("run", "pin", "hit", "old"):
+        add_file(manager.jobs, f"{job_id}_output.mp4")
+    manager.pin("pin", [])
+    asyncio.run(manager.result_cache.put("cache-key", "hit_output.mp4", "hit"))
+
+    reclaimed = asyncio.run(manager.collect())
+    assert reclaimed == {"ttl": 20, "quota": 0}
+    assert remaining(manager) == {
+        "uploads": ["char.mp4", "ref.mp4"],
+        "jobs": ["hit_output.mp4", "pin_output.mp4", "run_output.mp4"],
+    }
+
+
+def test_over_quota_evicts_least_recently_used_and_cached_outputs_last(manager):
+    manager.ttls = {name: 30 * DAY for name in manager.ttls}
+    manager.jobs.quota = 25
+    for job_id in ("hit", "older", "newer", "pin"):
+        add_job(manager, job_id, "completed")
+    add_file(manager.jobs, "hit_output.mp4", age=3 * DAY)
+    add_file(manager.jobs, "older_output.mp4", age=2 * DAY)
+    add_file(manager.jobs, "newer_output.mp4", age=1 * DAY)
+    add_file(manager.jobs, "pin_output.mp4", age=4 * DAY)
+    manager.pin("pin", [])
+    asyncio.run(manager.result_cache.put("cache-key", "hit_output.mp4", "hit"))
+
+    reclaimed = asyncio.run(manager.collect())
+    # 40 bytes against a 25 byte quota; the pinned file still counts towards it
+    assert reclaimed == {"ttl": 0, "quota": 20}
+    assert remaining(manager)["jobs"] == ["hit_output.mp4", "pin_output.mp4"]
+
+
+def test_file_used_after_the_pass_started_is_kept(manager):
+    add_file(manager.uploads, "input.mp4")
+    manager.uploads.refresh(budget=10)
+    pass_started = time.time()
+    # Served again between the pass choosing the file and deleting it
+    manager.uploads.touch("input.mp4")
+
+    assert StorageManager._delete(manager.uploads, "input.mp4", pass_started) is None
+    assert (manager.uploads.path / "input.mp4").exists()
+    assert manager.uploads.total_bytes == 10
+    assert StorageManager._delete(manager.uploads, "input.mp4", time.time() + 1) == 10
+    assert manager.uploads.total_bytes == 0
@@ -0,0 +1,59 @@
+import asyncio
+from types import SimpleNamespace
+
+from task_poller import RunwayTaskPoller
+
+
+def test_failing_listener_does_not_stop_polling():
+    async def scenario():
+        statuses = iter(["PENDING", "RUNNING", "SUCCEEDED"])
+
+        async def retrieve(task_id):
+            return SimpleNamespace(id=task_id, status=next(statuses))
+
+        def broken(task):
+            raise RuntimeError("listener bug")
+
+        updates = []
+        poller = RunwayTaskPoller(retrieve, initial_interval=0.01, max_interval=0.01)
+        await poller.start()
+        first = poller.wait("task-1", on_update=broken)
+        poller.wait("task-1", on_update=lambda task: updates.append(task.status))
+        try:
+            task = await asyncio.wait_for(first, 5)
+        finally:
+            await poller.stop()
+        return task, updates
+
+    task, updates = asyncio.run(scenario())
+    assert task.status == "SUCCEEDED"
+    assert updates == ["PENDING", "RUNNING"]
+
+
+def test_slow_retrieve_does_not_hold_up_other_tasks():
+    async def scenario():
+        release = asyncio.Event()
+
+        async def retrieve(task_id):
+            if task_id == "slow":
+                # e.g. a retrieve backing off after repeated 5xx
+                await release.wait()
+            return SimpleNamespace(id=task_id, status="SUCCEEDED")
+
+        poller = RunwayTaskPoller(retrieve, initial_interval=0.01, max_interval=0.01)
+        await poller.start()
+        slow = poller.wait("slow")
+        fast = poller.wait("fast")
+        try:
+            task = await asyncio.wait_for(fast, 5)
+            still_waiting = not slow.done()
+            release.set()
+            await asyncio.wait_for(slow, 5)
+        finally:
+            await poller.stop()
+        return task, still_waiting, poller.outstanding
+
+    task, still_waiting, outstanding = asyncio.run(scenario())
+    assert task.id == "fast"
+    assert still_waiting
+    assert outstanding == 0
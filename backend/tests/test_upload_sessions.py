@@ -0,0 +1,87 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from upload_sessions import IncompleteUploadError, TooManyUploadsError, UploadSessionError, UploadSessions
+
+CONTENT = b"0123456789abcdefghij"  # five 4-byte chunks
+
+
+def test_open_sessions_are_capped_by_count_and_reserved_bytes(tmp_path):
+    async def scenario():
+        sessions = UploadSessions(tmp_path, chunk_size=4, max_bytes=100, max_sessions=2, quota_bytes=150)
+        await sessions.create("a.mp4", 100, "video/mp4")
+        with pytest.raises(TooManyUploadsError):
+            await sessions.create("b.mp4", 60, "video/mp4")  # 160 bytes reserved
+        second = await sessions.create("b.mp4", 50, "video/mp4")
+        with pytest.raises(TooManyUploadsError):
+            await sessions.create("c.mp4", 1, "video/mp4")  # third open session
+
+        # A committed session no longer counts
+        for index in range(second["chunk_count"]):
+            await sessions.write_chunk(second["upload_id"], index, chunks(second, index))
+        await sessions.commit(second["upload_id"])
+        return await sessions.create("c.mp4", 1, "video/mp4")
+
+    assert asyncio.run(scenario())["size"] == 1
+
+
+async def chunks(session, index):
+    yield b"x" * min(session["chunk_size"], session["size"] - index * session["chunk_size"])
+
+
+async def body(data):
+    yield data
+
+
+def test_chunks_in_any_order_commit_to_the_original_file(tmp_path):
+    async def scenario():
+        sessions = UploadSessions(tmp_path, chunk_size=4, max_bytes=100)
+        session = await sessions.create("clip.mp4", len(CONTENT), "video/mp4")
+        upload_id = session["upload_id"]
+        for index in (4, 1, 3):
+            await sessions.write_chunk(upload_id, index, body(CONTENT[index * 4:index * 4 + 4]))
+        # A resent chunk overwrites the first copy
+        await sessions.write_chunk(upload_id, 1, body(CONTENT[4:8]))
+        status = await sessions.status(upload_id)
+        with pytest.raises(IncompleteUploadError) as incomplete:
+            await sessions.commit(upload_id)
+
+        await sessions.write_chunk(upload_id, 2, body(CONTENT[8:12]))
+        await sessions.write_chunk(upload_id, 0, body(CONTENT[0:4]))
+        first = await sessions.commit(upload_id)
+        again = await sessions.commit(upload_id)
+        stored = await sessions.ingested(upload_id)
+        return status, incomplete.value.missing, first, again, stored
+
+    status, missing, first, again, stored = asyncio.run(scenario())
+    assert status["received"] == [1, 3, 4]
+    assert status["bytes_received"] == 12
+    assert missing == [0, 2]
+    assert first == again
+    assert first["committed"]["sha256"] == hashlib.sha256(CONTENT).hexdigest()
+    assert stored.path.read_bytes() == CONTENT
+    assert len(list(tmp_path.glob("*.part"))) == 0
+
+
+def test_checksum_mismatches_are_refused(tmp_path):
+    async def scenario():
+        sessions = UploadSessions(tmp_path, chunk_size=4, max_bytes=100)
+        session = await sessions.create("clip.mp4", 8, "video/mp4", sha256=hashlib.sha256(b"expected").hexdigest())
+        upload_id = session["upload_id"]
+        with pytest.raises(UploadSessionError, match="Chunk 0 checksum mismatch"):
+            await sessions.write_chunk(upload_id, 0, body(b"abcd"), sha256=hashlib.sha256(b"wxyz").hexdigest())
+        with pytest.raises(UploadSessionError, match="must be 4 bytes"):
+            await sessions.write_chunk(upload_id, 0, body(b"abc"))
+
+        # Every chunk arrived, but the file is not the one announced
+        await sessions.write_chunk(upload_id, 0, body(b"abcd"), sha256=hashlib.sha256(b"abcd").hexdigest())
+        await sessions.write_chunk(upload_id, 1, body(b"efgh"))
+        with pytest.raises(UploadSessionError, match="Upload checksum mismatch"):
+            await sessions.commit(upload_id)
+        return await sessions.status(upload_id)
+
+    status = asyncio.run(scenario())
+    assert status["committed"] is None
+    assert status["received"] == [0, 1]
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from typing import Optional
+
+from config import settings
+from http_pool import get_http_client
+
+logger = logging.getLogger(__name__)
+
+
+class TunnelUnavailableError(Exception):
+    """Raised when no public tunnel URL is currently known."""
+
+
+class TunnelManager:
+    """
+    Keeps the ngrok tunnel's public base URL cached.
+    The tunnel is discovered (or started) once in the background at startup
+    and re-checked periodically, so publishing a file is just formatting a URL
+    and nothing on the request path waits on ngrok.
+    """
+
+    def __init__(
+        self,
+        api_url: str = settings.NGROK_API_URL,
+        local_port: int = settings.NGROK_LOCAL_PORT,
+        autostart: bool = settings.NGROK_AUTOSTART,
+        health_interval: float = settings.TUNNEL_HEALTH_INTERVAL,
+        startup_timeout: float = 10.0,
+    ):
+        self.api_url = api_url.rstrip("/")
+        self.local_port = local_port
+        self.autostart = autostart
+        self.health_interval = health_interval
+        self.startup_timeout = startup_timeout
+        self.public_url: Optional[str] = None
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._monitor: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._monitor = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._monitor:
+            self._monitor.cancel()
+            await asyncio.gather(self._monitor, return_exceptions=True)
+            self._monitor = None
+        if self._process and self._process.returncode is None:
+            self._process.terminate()
+            await self._process.wait()
+        self._process = None
+
+    def url_for(self, filename: str) -> str:
+        if self.public_url is None:
+            raise TunnelUnavailableError("ngrok tunnel is not available")
+        return f"{self.public_url}/serve/{filename}"
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._check()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Tunnel check failed: %s", e)
+                self.public_url = None
+            await asyncio.sleep(self.health_interval)
+
+    async def _check(self) -> None:
+        url = await self._discover()
+        if url is None and self.autostart and not self._owns_running_process():
+            url = await self._launch()
+
+        if url != self.public_url:
+            logger.info("ngrok tunnel: %s", url or "unavailable")
+        self.public_url = url
+
+    async def _discover(self) -> Optional[str]:
+        try:
+            response = await get_http_client().get(f"{self.api_url}/api/tunnels", timeout=5.0)
+            tunnels = response.json().get("tunnels", [])
+        except Exception:
+            return None
+
+        matching = [
+            tunnel["public_url"]
+            for tunnel in tunnels
+            if str(tunnel.get("config", {}).get("addr", "")).rstrip("/").endswith(f":{self.local_port}")
+        ]
+        # Prefer the https endpoint when ngrok exposes both
+        matching.sort(key=lambda url: not url.startswith("https://"))
+        return matching[0] if matching else None
+
+    def _owns_running_process(self) -> bool:
+        return self._process is not None and self._process.returncode is None
+
+    async def _launch(self) -> Optional[str]:
+        logger.info("Starting ngrok tunnel")
+        try:
+            self._process = await asyncio.create_subprocess_exec(
+                "ngrok", "http", str(self.local_port),
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL,
+            )
+        except FileNotFoundError:
+            logger.error("ngrok is not installed; tunnel hosting disabled")
+            self.autostart = False
+            return None
+
+        deadline = asyncio.get_running_loop().time() + self.startup_timeout
+        while asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(1)
+            url = await self._discover()
+            if url:
+                return url
+        return None
+
+
+tunnel_manager = TunnelManager()
@@ -0,0 +1,280 @@
+import asyncio
+import hashlib
+import json
+import math
+import os
+import re
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from config import settings
+from ingest import FileTooLargeError, IngestedFile, commit_content, content_filename
+
+
+class UploadSessionNotFound(Exception):
+    """Raised for an unknown, expired or malformed upload ID."""
+
+
+class UploadSessionError(Exception):
+    """Raised when a chunk or commit does not match the upload."""
+
+
+class TooManyUploadsError(UploadSessionError):
+    """Raised when opening a session would exceed the open session or byte limits."""
+
+
+class IncompleteUploadError(UploadSessionError):
+    """Raised when committing an upload that is still missing chunks."""
+
+    def __init__(self, missing: List[int]):
+        super().__init__(f"Upload is missing {len(missing)} chunks")
+        self.missing = missing
+
+
+_UPLOAD_ID = re.compile(r"[0-9a-f]{32}")
+
+
+class UploadSessions:
+    """
+    Resumable uploads sent as fixed-size chunks, in any order and in
+    parallel, then committed into the content-addressed store.
+    Each session is three flat files next to the uploads: the metadata,
+    the data file every chunk is written into at its offset, and an
+    append-only log of received chunks with their sha256. Appends need no
+    lock, so chunks may arrive on any node sharing the directory. The
+    names contain ".part", so abandoned sessions expire with the other
+    partial files. At most `max_sessions` uncommitted sessions are open at
+    once, and the bytes they reserve stay within `quota_bytes`. File work
+    runs in worker threads.
+    """
+
+    def __init__(
+        self,
+        directory: Path = Path(settings.UPLOAD_DIRECTORY),
+        chunk_size: int = settings.CHUNKED_UPLOAD_CHUNK_SIZE,
+        max_bytes: int = settings.CHUNKED_UPLOAD_MAX_SIZE,
+        read_size: int = settings.UPLOAD_CHUNK_SIZE,
+        max_sessions: int = settings.CHUNKED_UPLOAD_MAX_SESSIONS,
+        quota_bytes: int = settings.UPLOAD_QUOTA_BYTES,
+    ):
+        self.directory = Path(directory)
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.read_size = read_size
+        self.max_sessions = max_sessions
+        self.quota_bytes = quota_bytes
+        self._create_lock: Optional[asyncio.Lock] = None
+        self._commit_lock: Optional[asyncio.Lock] = None
+
+    def _paths(self, upload_id: str) -> Dict[str, Path]:
+        if not _UPLOAD_ID.fullmatch(upload_id):
+            raise UploadSessionNotFound(upload_id)
+        base = f".session-{upload_id}.part"
+        return {
+            "meta": self.directory / f"{base}.json",
+            "data": self.directory / base,
+            "log": self.directory / f"{base}.chunks",
+        }
+
+    def _load(self, upload_id: str) -> Dict[str, Any]:
+        try:
+            with open(self._paths(upload_id)["meta"], "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            raise UploadSessionNotFound(upload_id)
+
+    def _save(self, session: Dict[str, Any]) -> None:
+        meta_path = self._paths(session["upload_id"])["meta"]
+        tmp_path = meta_path.with_name(meta_path.name + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(session, f)
+        os.replace(tmp_path, meta_path)
+
+    def _received(self, upload_id: str) -> Dict[int, str]:
+        received = {}
+        try:
+            with open(self._paths(upload_id)["log"], "r") as f:
+                for line in f:
+                    index, _, sha256 = line.strip().partition(" ")
+                    if index.isdigit() and len(sha256) == 64:
+                        received[int(index)] = sha256
+        except FileNotFoundError:
+            pass
+        return received
+
+    def _open_sessions(self) -> List[Dict[str, Any]]:
+        """Uncommitted sessions in the directory, from any node sharing it"""
+        sessions = []
+        for meta_path in self.directory.glob(".session-*.part.json"):
+            try:
+                with open(meta_path, "r") as f:
+                    session = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not session.get("committed"):
+                sessions.append(session)
+        return sessions
+
+    async def create(self, filename: str, size: int, content_type: str, sha256: Optional[str] = None) -> Dict[str, Any]:
+        """Start a session for a file of `size` bytes; returns its status"""
+        if size <= 0:
+            raise UploadSessionError("File is empty")
+        if size > self.max_bytes:
+            raise FileTooLargeError(self.max_bytes)
+
+        if self._create_lock is None:
+            self._create_lock = asyncio.Lock()
+        async with self._create_lock:
+            return await asyncio.to_thread(self._create, filename, size, content_type, sha256)
+
+    def _create(self, filename: str, size: int, content_type: str, sha256: Optional[str]) -> Dict[str, Any]:
+        sessions = self._open_sessions()
+        if len(sessions) >= self.max_sessions:
+            raise TooManyUploadsError(f"Too many uploads in progress (limit {self.max_sessions})")
+        if sum(session["size"] for session in sessions) + size > self.quota_bytes:
+            raise TooManyUploadsError("Not enough upload space left, retry once other uploads finish")
+
+        upload_id = uuid.uuid4().hex
+        session = {
+            "upload_id": upload_id,
+            "filename": Path(filename).name,
+            "content_type": content_type,
+            "size": size,
+            "sha256": sha256.lower() if sha256 else None,
+            "chunk_size": self.chunk_size,
+            "chunk_count": math.ceil(size / self.chunk_size),
+            "created_at": datetime.now().isoformat(),
+            "committed": None,
+        }
+        with open(self._paths(upload_id)["data"], "wb") as f:
+            # Sparse on most filesystems; chunks fill it in place
+            f.truncate(size)
+        self._save(session)
+        return self._status(upload_id)
+
+    async def status(self, upload_id: str) -> Dict[str, Any]:
+        """Session metadata plus which chunks have been received"""
+        return await asyncio.to_thread(self._status, upload_id)
+
+    def _status(self, upload_id: str) -> Dict[str, Any]:
+        session = self._load(upload_id)
+        received = self._received(upload_id) if not session["committed"] else {}
+        return {
+            **session,
+            "received": sorted(received),
+            "bytes_received": sum(self._chunk_length(session, index) for index in received),
+        }
+
+    @staticmethod
+    def _chunk_length(session: Dict[str, Any], index: int) -> int:
+        return min(session["chunk_size"], session["size"] - index * session["chunk_size"])
+
+    async def write_chunk(
+        self, upload_id: str, index: int, body: AsyncIterator[bytes], sha256: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Store chunk `index` from a request body. With `sha256`, a chunk
+        whose bytes do not hash to it is refused. Sending a chunk again
+        overwrites it, so a retry after a dropped response is harmless.
+        """
+        session = await asyncio.to_thread(self._load, upload_id)
+        if session["committed"]:
+            raise UploadSessionError("Upload is already committed")
+        if not 0 <= index < session["chunk_count"]:
+            raise UploadSessionError(f"Chunk index must be between 0 and {session['chunk_count'] - 1}")
+
+        expected = self._chunk_length(session, index)
+        data = bytearray()
+        async for part in body:
+            data += part
+            if len(data) > expected:
+                raise UploadSessionError(f"Chunk {index} must be {expected} bytes")
+        if len(data) != expected:
+            raise UploadSessionError(f"Chunk {index} must be {expected} bytes, got {len(data)}")
+
+        digest = await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+        if sha256 and sha256.lower() != digest:
+            raise UploadSessionError(f"Chunk {index} checksum mismatch")
+        await asyncio.to_thread(self._store_chunk, session, index, data, digest)
+        return {"upload_id": upload_id, "index": index, "size": expected, "sha256": digest}
+
+    def _store_chunk(self, session: Dict[str, Any], index: int, data: bytearray, sha256: str) -> None:
+        paths = self._paths(session["upload_id"])
+        try:
+            with open(paths["data"], "r+b") as f:
+                f.seek(index * session["chunk_size"])
+                f.write(data)
+        except FileNotFoundError:
+            # Committed (or expired) while this chunk was in flight
+            raise UploadSessionNotFound(session["upload_id"])
+        # Logged only once the bytes are in place
+        with open(paths["log"], "a") as f:
+            f.write(f"{index} {sha256}\n")
+        # Keep an active session's metadata from expiring
+        os.utime(paths["meta"])
+
+    async def commit(self, upload_id: str) -> Dict[str, Any]:
+        """
+        Verify every chunk arrived (and the whole-file sha256, if one was
+        given), then move the file into the content-addressed store.
+        Committing again returns the same result.
+        """
+        if self._commit_lock is None:
+            self._commit_lock = asyncio.Lock()
+        async with self._commit_lock:
+            return await asyncio.to_thread(self._commit, upload_id)
+
+    def _commit(self, upload_id: str) -> Dict[str, Any]:
+        session = self._load(upload_id)
+        if session["committed"]:
+            return self._status(upload_id)
+
+        received = self._received(upload_id)
+        missing = [index for index in range(session["chunk_count"]) if index not in received]
+        if missing:
+            raise IncompleteUploadError(missing)
+
+        paths = self._paths(upload_id)
+        digest = hashlib.sha256()
+        try:
+            with open(paths["data"], "rb") as f:
+                while chunk := f.read(self.read_size):
+                    digest.update(chunk)
+        except FileNotFoundError:
+            # Another node committed it first
+            return self._status(upload_id)
+        sha256 = digest.hexdigest()
+        if session["sha256"] and session["sha256"] != sha256:
+            raise UploadSessionError("Upload checksum mismatch, the file has to be sent again")
+
+        destination = self.directory / content_filename(sha256, session["filename"])
+        commit_content(paths["data"], destination)
+        committed_at = datetime.now()
+        session["committed"] = {
+            "file": destination.name,
+            "sha256": sha256,
+            "committed_at": committed_at.isoformat(),
+            "seconds": round((committed_at - datetime.fromisoformat(session["created_at"])).total_seconds(), 3),
+        }
+        self._save(session)
+        paths["log"].unlink(missing_ok=True)
+        return self._status(upload_id)
+
+    async def ingested(self, upload_id: str) -> IngestedFile:
+        """The stored file of a committed upload"""
+        return await asyncio.to_thread(self._ingested, upload_id)
+
+    def _ingested(self, upload_id: str) -> IngestedFile:
+        session = self._load(upload_id)
+        committed = session["committed"]
+        if not committed:
+            raise UploadSessionError("Upload is not committed yet")
+        path = self.directory / committed["file"]
+        if not path.exists():
+            raise UploadSessionNotFound(upload_id)
+        return IngestedFile(path=path, size=session["size"], sha256=committed["sha256"])
+
+
+upload_sessions = UploadSessions()
@@ -0,0 +1,45 @@
+"""
+Queue worker for distributed mode: runs the job pipeline against the
+shared Redis queue without serving the API. Start as many as you like,
+on any node that sees the same upload and jobs directories:
+
+    JOB_QUEUE_URL=redis://localhost:6379/0 python worker.py
+
+A worker serves nothing, so it never opens an ngrok tunnel and publishes
+inputs through the temp hosts only.
+"""
+import asyncio
+import logging
+import signal
+import sys
+
+from config import settings
+
+
+async def run() -> None:
+    import main
+
+    logger = logging.getLogger("worker")
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    await main.start_scheduler()
+    logger.info("Worker started with %d job workers", settings.JOB_WORKERS)
+    try:
+        await stopping.wait()
+    finally:
+        logger.info("Worker stopping")
+        await main.stop_scheduler()
+        await main.close_job_store()
+
+
+if __name__ == "__main__":
+    if not settings.JOB_QUEUE_URL:
+        sys.exit("JOB_QUEUE_URL must point at the shared Redis queue")
+    if settings.JOB_WORKERS < 1:
+        sys.exit("JOB_WORKERS must be at least 1 on a worker")
+    # Before main is imported, so hosting leaves the ngrok provider out
+    settings.NGROK_ENABLED = False
+    asyncio.run(run())
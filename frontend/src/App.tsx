@@ -1,12 +1,20 @@
 import React, { useState, useRef } from 'react';
 import './App.css';
+import { UploadError, forgetUpload, uploadFile } from './chunkedUpload';
+
+// Matches CHUNKED_UPLOAD_MAX_SIZE on the server
+const MAX_FILE_SIZE = 128 * 1024 * 1024;
 
 interface Job {
   id: string;
-  status: 'processing' | 'completed' | 'failed';
-  prompt: string;
-  input_file: string;
+  status: 'queued' | 'processing' | 'completed' | 'failed';
+  character_file: string;
+  reference_file: string;
   output_file: string | null;
+  artifacts?: { faststart?: boolean; poster?: string; hls?: string };
+  queue_position?: number | null;
+  stage?: string | null;
+  preflight?: Record<string, { face_coverage: number; brightness: number }>;
   error: string | null;
   created_at: string;
   completed_at: string | null;
@@ -16,7 +24,10 @@ function App() {
   const [characterFile, setCharacterFile] = useState<File | null>(null);
   const [referenceFile, setReferenceFile] = useState<File | null>(null);
   const [isUploading, setIsUploading] = useState(false);
+  const [uploadProgress, setUploadProgress] = useState<number | null>(null);
   const [currentJob, setCurrentJob] = useState<Job | null>(null);
+  const [renderProgress, setRenderProgress] = useState<number | null>(null);
+  const eventSourceRef = useRef<EventSource | null>(null);
   const characterInputRef = useRef<HTMLInputElement>(null);
   const referenceInputRef = useRef<HTMLInputElement>(null);
 
@@ -29,9 +40,9 @@ function App() {
         return;
       }
       
-      // Validate file size (16MB)
-      if (file.size > 16 * 1024 * 1024) {
-        alert('File size must be less than 16MB');
+      // Validate file size (128MB)
+      if (file.size > MAX_FILE_SIZE) {
+        alert('File size must be less than 128MB');
         return;
       }
       
@@ -48,9 +59,9 @@ function App() {
         return;
       }
       
-      // Validate file size (16MB)
-      if (file.size > 16 * 1024 * 1024) {
-        alert('File size must be less than 16MB');
+      // Validate file size (128MB)
+      if (file.size > MAX_FILE_SIZE) {
+        alert('File size must be less than 128MB');
         return;
       }
       
@@ -67,30 +78,100 @@ function App() {
     setIsUploading(true);
     
     try {
+      // Both videos go up in resumable chunks; a retry only sends what is missing
+      const sent = { character: 0, reference: 0 };
+      const total = characterFile.size + referenceFile.size;
+      const track = (key: keyof typeof sent) => (bytes: number) => {
+        sent[key] = bytes;
+        setUploadProgress((sent.character + sent.reference) / total);
+      };
+      const [characterUpload, referenceUpload] = await Promise.all([
+        uploadFile(characterFile, { onProgress: track('character') }),
+        uploadFile(referenceFile, { onProgress: track('reference') }),
+      ]);
+
       const formData = new FormData();
-      formData.append('character_file', characterFile);
-      formData.append('reference_file', referenceFile);
+      formData.append('character_upload', characterUpload);
+      formData.append('reference_upload', referenceUpload);
 
-      const response = await fetch('/api/upload', {
+      const response = await fetch('/api/jobs', {
         method: 'POST',
         body: formData,
       });
 
+      if (response.status === 429) {
+        const retryAfter = response.headers.get('Retry-After');
+        alert(`The server is busy right now. Please try again in ${retryAfter || 'a few'} seconds.`);
+        return;
+      }
+
+      if (response.status === 404) {
+        // An earlier upload of these files has expired on the server
+        forgetUpload(characterFile);
+        forgetUpload(referenceFile);
+        alert('Your upload expired. Please press the button again to re-send it.');
+        return;
+      }
+
       if (!response.ok) {
         throw new Error('Upload failed');
       }
 
       const result = await response.json();
       
-      // Start polling for job status
-      pollJobStatus(result.job_id);
+      // Follow job status (pushed from the server, polling as a fallback)
+      watchJob(result.job_id);
       
     } catch (error) {
       console.error('Upload error:', error);
-      alert('Upload failed. Please try again.');
+      if (error instanceof UploadError && error.status === 429) {
+        alert(`The server is busy right now. Please try again in ${error.retryAfter || 'a few'} seconds.`);
+      } else if (error instanceof UploadError && error.status === 400) {
+        alert(`Upload failed: ${error.message}`);
+      } else {
+        alert('Upload interrupted. Press the button again to resume where it stopped.');
+      }
     } finally {
       setIsUploading(false);
+      setUploadProgress(null);
+    }
+  };
+
+  const isActive = (job: Job) => job.status === 'queued' || job.status === 'processing';
+
+  const watchJob = (jobId: string) => {
+    if (typeof EventSource === 'undefined') {
+      pollJobStatus(jobId);
+      return;
     }
+
+    const source = new EventSource(`/api/jobs/${jobId}/events`);
+    eventSourceRef.current = source;
+    let connected = false;
+
+    source.addEventListener('job', (event) => {
+      connected = true;
+      const jobData: Job = JSON.parse((event as MessageEvent).data);
+      setCurrentJob(jobData);
+      if (!isActive(jobData)) {
+        source.close();
+      }
+    });
+
+    source.addEventListener('progress', (event) => {
+      const { progress } = JSON.parse((event as MessageEvent).data);
+      setRenderProgress(progress);
+    });
+
+    source.onerror = () => {
+      // EventSource reconnects on its own once a stream has worked;
+      // if it never connected, fall back to polling
+      if (!connected) {
+        source.close();
+        eventSourceRef.current = null;
+        pollJobStatus(jobId);
+      }
+    };
   };
 
   const pollJobStatus = async (jobId: string) => {
@@ -101,7 +182,7 @@ function App() {
           const jobData: Job = await response.json();
           setCurrentJob(jobData);
           
-          if (jobData.status === 'processing') {
+          if (isActive(jobData)) {
             setTimeout(poll, 3000); // Poll every 3 seconds
           }
         }
@@ -114,9 +195,12 @@ function App() {
   };
 
   const resetForm = () => {
+    eventSourceRef.current?.close();
+    eventSourceRef.current = null;
     setCharacterFile(null);
     setReferenceFile(null);
     setCurrentJob(null);
+    setRenderProgress(null);
     if (characterInputRef.current) {
       characterInputRef.current.value = '';
     }
@@ -126,7 +210,7 @@ function App() {
   };
 
   const getVideoUrl = (filename: string) => {
-    return `/jobs/${filename}`;
+    return `/serve/${filename}`;
   };
 
   return (
@@ -194,7 +278,11 @@ function App() {
               disabled={!characterFile || !referenceFile || isUploading}
               className="upload-button"
             >
-              {isUploading ? 'Creating Sports Content...' : '🚀 Create Sports Interview'}
+              {isUploading
+                ? uploadProgress !== null && uploadProgress < 1
+                  ? `Uploading... ${Math.round(uploadProgress * 100)}%`
+                  : 'Creating Sports Content...'
+                : '🚀 Create Sports Interview'}
             </button>
         </div>
 
@@ -202,6 +290,8 @@ function App() {
           <div className="job-status">
             <h3>🎬 Production Status</h3>
             <div className={`status-badge ${currentJob.status}`}>
+              {currentJob.status === 'queued' &&
+                `🕒 Waiting in line${currentJob.queue_position ? ` (#${currentJob.queue_position})` : ''}...`}
               {currentJob.status === 'processing' && '⏳ Creating Sports Interview...'}
               {currentJob.status === 'completed' && '✅ Sports Content Ready!'}
               {currentJob.status === 'failed' && '❌ Production Failed'}
@@ -235,10 +325,16 @@ function App() {
               </div>
             </div>
             
-            {currentJob.status === 'processing' && (
+            {(currentJob.status === 'queued' || currentJob.status === 'processing') && (
               <div className="loading-spinner">
                 <div className="spinner"></div>
                 <p>🔥 AI is working its magic... This may take a few minutes.</p>
+                {currentJob.stage === 'preflight' && (
+                  <p>🔍 Checking both videos for visible faces...</p>
+                )}
+                {currentJob.stage === 'rendering' && renderProgress !== null && (
+                  <p>🎞️ Rendering: {Math.round(renderProgress * 100)}%</p>
+                )}
                 <p>We're transferring the interview style to your athlete!</p>
               </div>
             )}
@@ -248,9 +344,15 @@ function App() {
                 <h4>🎯 Your Sports Interview</h4>
                 <video
                   controls
+                  preload="metadata"
                   className="result-video"
-                  src={getVideoUrl(currentJob.output_file)}
+                  poster={currentJob.artifacts?.poster ? getVideoUrl(currentJob.artifacts.poster) : undefined}
                 >
+                  {/* Browsers with native HLS take the segments; the rest the faststart MP4 */}
+                  {currentJob.artifacts?.hls && (
+                    <source src={getVideoUrl(currentJob.artifacts.hls)} type="application/vnd.apple.mpegurl" />
+                  )}
+                  <source src={getVideoUrl(currentJob.output_file)} type="video/mp4" />
                   Your browser does not support the video tag.
                 </video>
                 <div className="download-section">
@@ -0,0 +1,155 @@
+// Resumable chunked uploads (/api/uploads): chunks go up in parallel and in
+// any order, and an interrupted upload of the same file picks up where it
+// stopped instead of starting over.
+
+interface UploadSession {
+  upload_id: string;
+  chunk_size: number;
+  chunk_count: number;
+  received: number[];
+  committed: { file: string; sha256: string } | null;
+}
+
+export interface ChunkedUploadOptions {
+  parallel?: number;
+  maxRetries?: number;
+  onProgress?: (sentBytes: number, totalBytes: number) => void;
+}
+
+export class UploadError extends Error {
+  constructor(message: string, public status?: number, public retryAfter?: string | null) {
+    super(message);
+  }
+}
+
+const sessionKey = (file: File) => `upload:${file.name}:${file.size}:${file.lastModified}`;
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+// crypto.subtle only exists on secure origins; the server skips the check without it
+const sha256Hex = async (data: ArrayBuffer): Promise<string | null> => {
+  if (typeof crypto === 'undefined' || !crypto.subtle) {
+    return null;
+  }
+  const digest = await crypto.subtle.digest('SHA-256', data);
+  return Array.from(new Uint8Array(digest))
+    .map((byte) => ('0' + byte.toString(16)).slice(-2))
+    .join('');
+};
+
+const failed = async (response: Response, what: string) => {
+  let detail = '';
+  try {
+    const body = await response.json();
+    detail = typeof body.detail === 'string' ? body.detail : body.detail?.error || '';
+  } catch (error) {
+    // Not JSON; keep the generic message
+  }
+  return new UploadError(detail || `${what} failed`, response.status, response.headers.get('Retry-After'));
+};
+
+const resumeSession = async (file: File): Promise<UploadSession | null> => {
+  const uploadId = localStorage.getItem(sessionKey(file));
+  if (!uploadId) {
+    return null;
+  }
+  const response = await fetch(`/api/uploads/${uploadId}`);
+  if (!response.ok) {
+    localStorage.removeItem(sessionKey(file));
+    return null;
+  }
+  return response.json();
+};
+
+const startSession = async (file: File): Promise<UploadSession> => {
+  const form = new FormData();
+  form.append('filename', file.name);
+  form.append('size', String(file.size));
+  form.append('content_type', file.type || 'video/mp4');
+  const response = await fetch('/api/uploads', { method: 'POST', body: form });
+  if (!response.ok) {
+    throw await failed(response, 'Starting the upload');
+  }
+  const session: UploadSession = await response.json();
+  localStorage.setItem(sessionKey(file), session.upload_id);
+  return session;
+};
+
+const sendChunk = async (file: File, session: UploadSession, index: number, maxRetries: number) => {
+  const start = index * session.chunk_size;
+  const chunk = await file.slice(start, start + session.chunk_size).arrayBuffer();
+  const checksum = await sha256Hex(chunk);
+  const headers: Record<string, string> = { 'Content-Type': 'application/octet-stream' };
+  if (checksum) {
+    headers['X-Chunk-SHA256'] = checksum;
+  }
+
+  for (let attempt = 0; ; attempt++) {
+    try {
+      const response = await fetch(`/api/uploads/${session.upload_id}/chunks/${index}`, {
+        method: 'PUT',
+        headers,
+        body: chunk,
+      });
+      if (response.ok) {
+        return chunk.byteLength;
+      }
+      // 4xx other than a checksum mismatch will not get better by retrying
+      if (response.status !== 400 && response.status < 500) {
+        throw await failed(response, 'Uploading');
+      }
+    } catch (error) {
+      if (error instanceof UploadError || attempt >= maxRetries) {
+        throw error;
+      }
+    }
+    if (attempt >= maxRetries) {
+      throw new UploadError('Uploading failed');
+    }
+    await sleep(Math.min(30000, 1000 * 2 ** attempt) * (0.5 + Math.random()));
+  }
+};
+
+/** Upload a file in chunks and commit it; resolves to the upload ID for /api/jobs */
+export const uploadFile = async (file: File, options: ChunkedUploadOptions = {}): Promise<string> => {
+  const { parallel = 4, maxRetries = 5, onProgress } = options;
+  const session = await resumeSession(file);
+  if (session?.committed) {
+    onProgress?.(file.size, file.size);
+    return session.upload_id;
+  }
+  const current = session || (await startSession(file));
+
+  const done = new Array(current.chunk_count).fill(false);
+  current.received.forEach((index) => {
+    done[index] = true;
+  });
+  const pending = done.map((received, index) => (received ? -1 : index)).filter((index) => index >= 0);
+  let sentBytes = file.size - pending.reduce(
+    (total, index) => total + Math.min(current.chunk_size, file.size - index * current.chunk_size),
+    0
+  );
+  onProgress?.(sentBytes, file.size);
+
+  const worker = async () => {
+    while (pending.length) {
+      const index = pending.shift()!;
+      sentBytes += await sendChunk(file, current, index, maxRetries);
+      onProgress?.(sentBytes, file.size);
+    }
+  };
+  await Promise.all(Array.from({ length: Math.min(parallel, pending.length) }, worker));
+
+  const response = await fetch(`/api/uploads/${current.upload_id}/commit`, { method: 'POST' });
+  if (!response.ok) {
+    if (response.status === 400) {
+      // The assembled file is unusable; start fresh next time
+      localStorage.removeItem(sessionKey(file));
+    }
+    throw await failed(response, 'Finishing the upload');
+  }
+  return current.upload_id;
+};
+
+/** Forget a finished upload so the same file is sent again next time */
+export const forgetUpload = (file: File) => localStorage.removeItem(sessionKey(file));